@@ -8,6 +8,11 @@
 #define DISPLAY_UPDATE_INTERVAL 750  // milliseconds
 #define MAX_ERRORS 3
 
+// Serial port defaults, overridable with the UART_PORT / UART_BAUD
+// environment variables
+#define UART_DEFAULT_PORT "/dev/serial0"
+#define UART_DEFAULT_BAUD 9600
+
 // Function declarations
 void create_ui(void);
 void init_uart(void);
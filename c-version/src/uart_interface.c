@@ -1,5 +1,6 @@
 #include "uart_interface.h"
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
 #include <termios.h>
 #include <fcntl.h>
@@ -11,17 +12,36 @@ static lv_obj_t *buttons[8];
 static int uart_fd = -1;
 static int error_counter = 0;
 
+static speed_t baud_to_speed(long baud) {
+    switch (baud) {
+        case 9600:   return B9600;
+        case 19200:  return B19200;
+        case 38400:  return B38400;
+        case 57600:  return B57600;
+        case 115200: return B115200;
+        case 230400: return B230400;
+        default:
+            printf("[WARNING] Unsupported baud rate %ld, using %d\n", baud, UART_DEFAULT_BAUD);
+            return B9600;
+    }
+}
+
 void init_uart(void) {
-    uart_fd = open("/dev/serial0", O_RDWR);
+    const char *port = getenv("UART_PORT");
+    const char *baud = getenv("UART_BAUD");
+    if (!port || !*port) port = UART_DEFAULT_PORT;
+    speed_t speed = baud_to_speed(baud && *baud ? strtol(baud, NULL, 10) : UART_DEFAULT_BAUD);
+
+    uart_fd = open(port, O_RDWR);
     if (uart_fd < 0) {
-        printf("[ERROR] Failed to open UART\n");
+        printf("[ERROR] Failed to open UART %s\n", port);
         return;
     }
 
     struct termios options;
     tcgetattr(uart_fd, &options);
-    cfsetispeed(&options, B9600);
-    cfsetospeed(&options, B9600);
+    cfsetispeed(&options, speed);
+    cfsetospeed(&options, speed);
     options.c_cflag |= (CLOCAL | CREAD);
     options.c_cflag &= ~PARENB;
     options.c_cflag &= ~CSTOPB;
@@ -0,0 +1,47 @@
+import pytest
+
+import uart_config
+from uart_config import DEFAULTS, load_config, validate_config
+
+
+@pytest.fixture(autouse=True)
+def no_system_config(monkeypatch):
+    monkeypatch.setattr(uart_config, "CONFIG_PATHS", [])
+    for var in list(uart_config.ENV_VARS.values()) + ["UART_CONFIG"]:
+        monkeypatch.delenv(var, raising=False)
+
+
+def test_later_sources_override():
+    config, remaining = load_config(["--timeout", "0.5", "-platform", "offscreen"])
+    assert config["timeout"] == 0.5
+    assert remaining == ["-platform", "offscreen"]
+
+
+def test_bad_choice_names_env_var(monkeypatch, capsys):
+    monkeypatch.setenv("UART_DISPLAY_MODE", "fast")
+    with pytest.raises(SystemExit):
+        load_config([])
+    assert "display_mode 'fast' from UART_DISPLAY_MODE" in capsys.readouterr().err
+
+
+def test_bad_value_names_ini_file(tmp_path, capsys):
+    path = tmp_path / "uart.ini"
+    path.write_text("[uart]\nkey_repeat = drop\n")
+    with pytest.raises(SystemExit):
+        load_config(["--config", str(path)])
+    assert f"key_repeat 'drop' from {path}" in capsys.readouterr().err
+
+
+def test_uncoercible_value_names_source(monkeypatch, capsys):
+    monkeypatch.setenv("UART_BAUD", "fast")
+    with pytest.raises(SystemExit):
+        load_config([])
+    assert "baudrate 'fast' from UART_BAUD" in capsys.readouterr().err
+
+
+def test_validate_config_checks_ranges():
+    with pytest.raises(ValueError, match="timeout 0 from --timeout"):
+        validate_config(dict(DEFAULTS, timeout=0), {"timeout": "--timeout"})
+    with pytest.raises(ValueError, match="poll_ceiling"):
+        validate_config(dict(DEFAULTS, poll_ceiling=DEFAULTS["poll_floor"] / 2), {})
+    validate_config(dict(DEFAULTS), {})
@@ -0,0 +1,60 @@
+from uart_history import DisplayHistory, ENTRY_SIZE
+
+
+def history(frames, capacity=8):
+    # frames: (time, upper) pairs
+    h = DisplayHistory(budget=capacity * ENTRY_SIZE)
+    for t, upper in frames:
+        h.record(upper, "lower", now=t)
+    return h
+
+
+def uppers(frames):
+    return [(t, upper.rstrip()) for t, upper, _ in frames]
+
+
+def test_repeated_frame_is_not_stored():
+    h = DisplayHistory()
+    assert h.record("A", "x", now=1.0)
+    assert not h.record("A", "x", now=2.0)
+    assert h.record("A", "y", now=3.0)
+    assert len(h) == 2
+    assert h.timestamp(0) == 1.0
+
+
+def test_frame_round_trips_padded():
+    h = history([(1.0, "HELLO")])
+    t, upper, lower = h.frame(0)
+    assert (t, upper, lower) == (1.0, "HELLO".ljust(20), "lower".ljust(20))
+
+
+def test_oldest_evicted_at_capacity():
+    h = history([(t, f"F{t}") for t in range(1, 6)], capacity=3)
+    assert len(h) == 3
+    assert uppers(h.frame(i) for i in range(3)) == [(3, "F3"), (4, "F4"), (5, "F5")]
+
+
+def test_at():
+    h = history([(1.0, "A"), (2.0, "B"), (3.0, "C")])
+    assert h.at(0.5) is None
+    assert uppers([h.at(1.0), h.at(2.5), h.at(9.0)]) == [(1.0, "A"), (2.0, "B"), (3.0, "C")]
+
+
+def test_between_leads_with_frame_on_screen():
+    h = history([(1.0, "A"), (2.0, "B"), (3.0, "C"), (4.0, "D")])
+    assert uppers(h.between(2.5, 3.5)) == [(2.0, "B"), (3.0, "C")]
+    assert uppers(h.between(2.0, 2.0)) == [(2.0, "B")]
+
+
+def test_between_outside_history():
+    h = history([(1.0, "A"), (2.0, "B")])
+    assert uppers(h.between(0.0, 0.5)) == []
+    assert uppers(h.between(0.0, 1.5)) == [(1.0, "A")]
+    assert uppers(h.between(5.0, 6.0)) == [(2.0, "B")]
+    assert DisplayHistory().between(0.0, 1.0) == []
+
+
+def test_between_after_wraparound():
+    h = history([(t, f"F{t}") for t in range(1, 8)], capacity=3)
+    assert uppers(h.between(0.0, 5.5)) == [(5, "F5")]
+    assert uppers(h.between(5.5, 7.0)) == [(5, "F5"), (6, "F6"), (7, "F7")]
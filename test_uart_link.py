@@ -0,0 +1,141 @@
+import pytest
+
+from uart_link import (
+    CircuitBreaker, LINK_CONNECTED, LINK_DEGRADED, LINK_OPEN, LINK_RECONNECTING
+)
+from uart_transport import LoopbackTransport
+from uart_worker import SerialWorker
+
+
+def breaker(**kwargs):
+    changes = []
+    link = CircuitBreaker(on_change=lambda old, new: changes.append(new), **kwargs)
+    return link, changes
+
+
+def test_failures_degrade_then_open():
+    link, changes = breaker(open_after=3)
+    link.record_failure()
+    link.record_failure()
+    assert link.state == LINK_DEGRADED and not link.is_open
+    link.record_failure()
+    assert link.is_open
+    assert changes == [LINK_DEGRADED, LINK_OPEN]
+
+
+def test_success_closes_and_resets():
+    link, _ = breaker(open_after=3)
+    link.record_failure()
+    link.record_failure()
+    link.record_success()
+    assert link.state == LINK_CONNECTED and link.failures == 0
+    link.record_failure()
+    assert link.state == LINK_DEGRADED
+
+
+def test_fatal_failure_opens_at_once():
+    link, _ = breaker(open_after=3)
+    link.record_failure(fatal=True)
+    assert link.is_open
+
+
+def test_probe_due_after_backoff():
+    link, _ = breaker(backoff_min=0.5)
+    assert link.probe_in() is None
+    link.record_failure(fatal=True)
+    assert link.probe_in(now=link.next_probe - 0.5) == pytest.approx(0.5)
+    assert link.probe_in(now=link.next_probe + 1) == 0.0
+
+
+def test_failed_probe_doubles_backoff_up_to_max():
+    link, changes = breaker(backoff_min=1.0, backoff_max=3.0)
+    link.record_failure(fatal=True)
+    backoffs = []
+    for _ in range(3):
+        link.begin_probe()
+        assert link.state == LINK_RECONNECTING
+        link.record_failure()
+        assert link.is_open
+        backoffs.append(link.backoff)
+    assert backoffs == [2.0, 3.0, 3.0]
+    assert changes == [LINK_OPEN] + [LINK_RECONNECTING, LINK_OPEN] * 3
+
+
+def test_probe_success_closes_and_resets_backoff():
+    link, _ = breaker(backoff_min=1.0)
+    link.record_failure(fatal=True)
+    link.begin_probe()
+    link.record_failure()
+    link.begin_probe()
+    link.record_success()
+    assert link.state == LINK_CONNECTED and link.backoff == 1.0
+
+
+def test_begin_probe_reset_restarts_backoff():
+    link, _ = breaker(backoff_min=1.0)
+    link.record_failure(fatal=True)
+    link.begin_probe()
+    link.record_failure()
+    assert link.backoff == 2.0
+    link.begin_probe(reset=True)
+    assert link.backoff == 1.0
+
+
+def test_failures_while_open_leave_it_open():
+    link, changes = breaker()
+    link.record_failure(fatal=True)
+    next_probe = link.next_probe
+    link.record_failure()
+    assert link.is_open and link.next_probe == next_probe
+    assert changes == [LINK_OPEN]
+
+
+# Worker reopen path, driven by hand without starting the thread
+
+def lost_worker(reopen, device_path=None):
+    worker = SerialWorker(LoopbackTransport(), reopen=reopen, device_path=device_path)
+    worker.port_failed(OSError("unplugged"))
+    assert worker.port_lost and worker.breaker.is_open
+    return worker
+
+
+def test_no_reopen_before_probe_due():
+    opened = []
+    worker = lost_worker(lambda: opened.append(1) or LoopbackTransport())
+    assert not worker.check_link()
+    assert opened == []
+
+
+def test_reopen_when_probe_due():
+    fresh = LoopbackTransport()
+    worker = lost_worker(lambda: fresh)
+    worker.ser.timeout = 0.25
+    worker.breaker.next_probe = 0.0
+    assert worker.check_link()
+    assert worker.ser is fresh and fresh.timeout == 0.25
+    assert not worker.port_lost
+    assert worker.breaker.state == LINK_RECONNECTING
+    assert worker.metrics.counters["reconnects"] == 1
+
+
+def test_failed_reopen_backs_off():
+    def reopen():
+        raise OSError("still gone")
+    worker = lost_worker(reopen)
+    backoff = worker.breaker.backoff
+    worker.breaker.next_probe = 0.0
+    assert not worker.check_link()
+    assert worker.port_lost and worker.breaker.is_open
+    assert worker.breaker.backoff == backoff * 2
+
+
+def test_reappearing_device_reopens_without_waiting(tmp_path):
+    node = tmp_path / "ttyUSB0"
+    worker = lost_worker(LoopbackTransport, device_path=str(node))
+    worker.breaker.backoff = 4.0
+    worker.breaker.next_probe = float("inf")
+    assert not worker.check_link()  # Node missing: nothing to reopen
+    node.touch()
+    assert worker.check_link()
+    assert not worker.port_lost
+    assert worker.breaker.backoff == worker.breaker.backoff_min
@@ -0,0 +1,91 @@
+from uart_poller import AdaptivePoller
+
+
+def poller(**kwargs):
+    options = dict(floor=0.1, ceiling=3.0, backoff=2.0, key_boost=2.0,
+                   keepalive=10.0, confirm_polls=1, change_floor=0.75)
+    options.update(kwargs)
+    return AdaptivePoller(**options)
+
+
+def test_unchanged_frames_back_off_to_ceiling():
+    p = poller(initial=0.75)
+    p.on_frame("A")  # First frame counts as a change
+    assert p.interval == 0.75
+    intervals = []
+    for _ in range(4):
+        p.on_frame("A")
+        intervals.append(p.next_interval(now=100.0))
+    assert intervals == [1.5, 3.0, 3.0, 3.0]
+
+
+def test_unprompted_change_speeds_up_no_faster_than_change_floor():
+    p = poller(initial=3.0)
+    p.on_frame("A")
+    assert p.interval == 1.5
+    p.on_frame("B")
+    assert p.interval == 0.75
+    p.on_frame("C")
+    assert p.interval == 0.75
+
+
+def test_steady_change_settles_between_floors():
+    # A clock ticking once a second: changed, unchanged, changed...
+    p = poller(initial=3.0)
+    for second in range(20):
+        p.on_frame(second)
+        p.on_frame(second)
+    assert 0.75 <= p.interval <= 3.0
+    assert p.interval > p.floor
+
+
+def test_key_press_polls_at_floor_for_boost_window():
+    p = poller(initial=3.0)
+    p.on_key(pressed_at=100.0)
+    assert p.next_interval(now=100.5) == 0.1
+    assert p.next_interval(now=101.9) == 0.1
+    # After the window the backed-off interval applies again
+    p.on_frame("A")
+    p.on_frame("A")
+    assert p.next_interval(now=102.5) == 1.5
+
+
+def test_changed_frame_after_key_leaves_floor():
+    p = poller()
+    p.on_frame("A")
+    p.on_key(pressed_at=100.0)
+    p.on_frame("B")
+    assert p.interval == 0.75
+    assert p.next_interval(now=100.5) == 0.1  # Still inside the boost window
+
+
+def test_push_polls_at_keepalive():
+    p = poller()
+    p.push = True
+    assert p.next_interval(now=100.0) == 10.0
+
+
+def test_push_key_press_earns_confirm_polls_only():
+    p = poller(confirm_polls=1)
+    p.push = True
+    p.on_key(pressed_at=100.0)
+    assert p.next_interval(now=100.1) == 0.1
+    assert p.next_interval(now=100.2) == 10.0
+    p.on_key(pressed_at=101.0)
+    assert p.next_interval(now=101.1) == 0.1
+
+
+def test_pushed_change_cancels_key_boost():
+    p = poller(confirm_polls=1)
+    p.push = True
+    p.on_frame("A")
+    p.on_key(pressed_at=100.0)
+    p.on_frame("B")
+    assert p.next_interval(now=100.1) == 10.0
+
+
+def test_limits_are_kept_consistent():
+    p = poller(floor=0.5, ceiling=0.2, keepalive=0.1, change_floor=0.01)
+    assert p.ceiling == 0.5
+    assert p.keepalive == 0.5
+    assert p.change_floor == 0.5
@@ -0,0 +1,55 @@
+from uart_protocol import FrameDecoder, FRAME_DISPLAY, FRAME_ACK, FRAME_NACK, FRAME_JUNK
+
+DISPLAY = b"SIM PAGE 0 #1".ljust(20) + b"LAST KEY 3".ljust(20)
+
+
+def kinds(frames):
+    return [(frame.kind, frame.data) for frame in frames]
+
+
+def test_display_then_ack():
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(DISPLAY + b"\rACK\r")) == [(FRAME_DISPLAY, DISPLAY), (FRAME_ACK, b"ACK")]
+
+
+def test_display_lost_cr_before_ack():
+    # A dropped CR glues the ACK to the display frame in front of it
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(DISPLAY + b"ACK\r")) == [(FRAME_DISPLAY, DISPLAY), (FRAME_ACK, b"ACK")]
+    assert decoder.resyncs == 0
+
+
+def test_display_lost_cr_before_nack():
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(DISPLAY + b"NACK\r")) == [(FRAME_DISPLAY, DISPLAY), (FRAME_NACK, b"NACK")]
+
+
+def test_display_ending_in_n_lost_cr_before_ack():
+    display = DISPLAY[:-1] + b"N"
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(display + b"ACK\r")) == [(FRAME_DISPLAY, display), (FRAME_ACK, b"ACK")]
+
+
+def test_junk_and_display_lost_cr_before_ack():
+    # Tail of a reply read halfway through, then a display that lost its CR
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(b"RD\r" + b"xx" + DISPLAY + b"ACK\r")) == [
+        (FRAME_JUNK, b"RD"), (FRAME_JUNK, b"xx"), (FRAME_DISPLAY, DISPLAY), (FRAME_ACK, b"ACK")
+    ]
+
+
+def test_ack_lost_cr_before_display():
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(b"ACK" + DISPLAY + b"\r")) == [(FRAME_ACK, b"ACK"), (FRAME_DISPLAY, DISPLAY)]
+
+
+def test_short_junk_before_ack():
+    decoder = FrameDecoder()
+    assert kinds(decoder.feed(b"PAGE 0ACK\r")) == [(FRAME_JUNK, b"PAGE 0"), (FRAME_ACK, b"ACK")]
+
+
+def test_frames_split_across_reads():
+    decoder = FrameDecoder()
+    assert decoder.feed(DISPLAY[:17]) == []
+    assert kinds(decoder.feed(DISPLAY[17:] + b"AC")) == []
+    assert kinds(decoder.feed(b"K\r")) == [(FRAME_DISPLAY, DISPLAY), (FRAME_ACK, b"ACK")]
@@ -0,0 +1,70 @@
+from uart_worker import CommandScheduler
+
+
+def names(commands):
+    return [command[:2] for command in commands]
+
+
+def drain_by_get(scheduler):
+    commands = []
+    while (command := scheduler.get(block=False)) is not None:
+        commands.append(command)
+    return commands
+
+
+def test_keys_jump_ahead_of_displays():
+    scheduler = CommandScheduler()
+    scheduler.put_display(0)
+    scheduler.put_key(3, "100")
+    scheduler.put_display(1)
+    scheduler.put_key(5, "100")
+    assert names(drain_by_get(scheduler)) == [("KEY", 3), ("KEY", 5), ("DISPLAY", 0), ("DISPLAY", 1)]
+
+
+def test_repeated_display_collapses_while_queued():
+    scheduler = CommandScheduler()
+    assert scheduler.put_display(0)
+    assert not scheduler.put_display(0)
+    assert scheduler.put_display(1)
+    assert names(drain_by_get(scheduler)) == [("DISPLAY", 0), ("DISPLAY", 1)]
+    # Once taken, the same page can be queued again
+    assert scheduler.put_display(0)
+
+
+def test_keys_never_collapse():
+    scheduler = CommandScheduler()
+    scheduler.put_key(3, "100")
+    scheduler.put_key(3, "100")
+    assert names(drain_by_get(scheduler)) == [("KEY", 3), ("KEY", 3)]
+
+
+def test_key_pending():
+    scheduler = CommandScheduler()
+    scheduler.put_display(0)
+    assert not scheduler.key_pending()
+    scheduler.put_key(3, "100")
+    assert scheduler.key_pending()
+
+
+def test_drain_empties_in_order():
+    scheduler = CommandScheduler()
+    scheduler.put_display(0)
+    scheduler.put_key(3, "100")
+    assert names(scheduler.drain()) == [("KEY", 3), ("DISPLAY", 0)]
+    assert scheduler.get(block=False) is None
+    assert scheduler.put_display(0)
+
+
+def test_get_times_out_empty():
+    assert CommandScheduler().get(timeout=0.01) is None
+
+
+def test_stop_ends_gets_and_wakes():
+    wakeups = []
+    scheduler = CommandScheduler(wakeup=lambda: wakeups.append(1))
+    scheduler.put_display(0)
+    scheduler.put_key(3, "100")
+    scheduler.stop()
+    assert scheduler.stopped
+    assert scheduler.get() is None
+    assert len(wakeups) == 3
@@ -1,25 +1,27 @@
 import tkinter as tk
-import serial
+import logging
 import os
-from threading import Timer
-import time
+import queue
+import sys
+from uart_config import load_config, open_serial
+from uart_log import setup_logging, shutdown_logging
+from uart_poller import AdaptivePoller
+from uart_transport import device_path
+from uart_worker import SerialWorker
 
 # Suppress tkinter deprecation warning
 os.environ["TK_SILENCE_DEPRECATION"] = "1"
 
 # Setup serial communication
+config, _ = load_config(sys.argv[1:])
+setup_logging(config["log_level"], config["log_file"])
+log = logging.getLogger("uart.ui")
 try:
-    ser = serial.Serial(
-        port='/dev/serial0',
-        baudrate=9600,
-        bytesize=serial.EIGHTBITS,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        timeout=1.0  # Increased to 1 second
-    )
-    print("[LOG] Using hardware UART at /dev/serial0.")
-except serial.serialutil.SerialException as e:
-    print(f"[ERROR] Failed to initialize UART: {e}")
+    ser = open_serial(config)
+    log.info("Using UART at %s (%d baud).", config["port"], ser.baudrate)
+except (OSError, ValueError) as e:  # SerialException is an OSError
+    log.error("Failed to initialize UART: %s", e)
+    shutdown_logging()
     exit(1)
 
 # Key configuration
@@ -30,109 +32,79 @@ KEY_LABELS = [
 ]
 
 # Timer configuration
-DISPLAY_UPDATE_INTERVAL = 0.75
-
-# Add at top with other constants
-MAX_ERRORS = 3  # Maximum consecutive errors before showing error message
-error_counter = 0  # Global counter for consecutive errors
-
-# Command to send display data
-def send_display_command(n):
-    global error_counter
-    command = f"DISPLAY {n}\r"
-    print(f"[DEBUG] Sending DISPLAY command: {command.strip()}")
-
-    try:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        ser.write(command.encode())
-     
-        # Read exactly 41 characters (40 display chars + CR)
-        response = ser.read(41)
-        
-        if not response:
-            error_counter += 1
-            print(f"[WARNING] No response from VMC (Attempt {error_counter}/{MAX_ERRORS})")
-            if error_counter >= MAX_ERRORS:
-                upper_label.config(text="Timeout Error")
-                lower_label.config(text="No VMC Response")
-                error_counter = MAX_ERRORS
-            return
-            
-        # Success - reset error counter
-        error_counter = 0
-        
-        # Remove the trailing CR if present
-        if response.endswith(b'\r'):
-            response = response[:-1]
-            
-        response_str = response.decode()
-        print(f"[DEBUG] Raw display response: '{response_str}'")
-
-        if len(response_str) == 40:
-            upper_line = response_str[:20]
-            lower_line = response_str[20:]
-            upper_label.config(text=upper_line)
-            lower_label.config(text=lower_line)
-            print(f"[LOG] Display updated: {response_str}")
-        # elif: response_str == "NACK":
-        #     upper_label.config(text="NACK Received")
-        #     lower_label.config(text="Invalid Command")
-        #     print("[WARNING] Received NACK. Invalid DISPLAY command parameter.")
-        # else:
-        #     upper_label.config(text="Error - Invalid")
-        #     lower_label.config(text="String Length")
-        #     print(f"[WARNING] Invalid response length: {len(response_str)} chars")
-            
-    except (serial.SerialTimeoutException, Exception) as e:
-        error_counter += 1
-        print(f"[WARNING] Communication error (Attempt {error_counter}/{MAX_ERRORS}): {e}")
-        
-        if error_counter >= MAX_ERRORS:
-            upper_label.config(text="Error")
-            lower_label.config(text="Check Connection")
-            error_counter = MAX_ERRORS
-            print("[ERROR] Max consecutive errors reached")
-
-# Modify the periodic update to add a small delay after key presses
-last_key_press_time = 0  # Add this with other globals
+DISPLAY_UPDATE_INTERVAL = 0.75  # Initial poll interval; adapts between poll_floor and poll_ceiling
+RESULT_POLL_INTERVAL = 50  # ms between checks for results from the worker
+
+# The worker thread owns the port; Tk may only be touched from the main
+# loop, so results come back through this queue and are drained by
+# process_results()
+results = queue.SimpleQueue()
+
+def show_display(upper_line, lower_line):
+    results.put(("display", upper_line, lower_line))
+
+def show_key_result(key_number, future):
+    if not future.cancelled():
+        results.put(("key", key_number, future.result()))
+
+worker = SerialWorker(
+    ser, on_display=show_display, key_repeat=config["key_repeat"],
+    display_mode=config["display_mode"], response_timeout=config["timeout"],
+    reopen=lambda: open_serial(config), device_path=device_path(config["port"])
+)
+
+poller = AdaptivePoller(
+    config["poll_floor"], config["poll_ceiling"], initial=DISPLAY_UPDATE_INTERVAL,
+    keepalive=config["poll_keepalive"]
+)
+display_job = None  # Pending root.after() id of the next poll
+
+def schedule_display_update(interval):
+    global display_job
+    if display_job is not None:
+        root.after_cancel(display_job)
+    display_job = root.after(int(interval * 1000), periodic_display_update)
 
 def periodic_display_update():
-    send_display_command(0)
-    Timer(DISPLAY_UPDATE_INTERVAL, periodic_display_update).start()
+    worker.request_display(0)
+    # A VMC that pushes its display only needs a keepalive poll
+    poller.push = worker.push_active
+    schedule_display_update(poller.next_interval())
 
-# Command execution function
+# Command execution function; returns straight away, the label below the
+# button shows the outcome once the VMC answers
 def send_key_command(key_number):
-    global last_key_press_time
-    command = f"KEY {key_number} {KEY_PRESS_DURATION}\r"
-    print(f"[DEBUG] Sending command: {command.strip()}")
-
-    try:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        ser.write(command.encode())
-
-        response = ser.read_until(b'\r').decode().strip()
-        print(f"[DEBUG] Raw key response: '{response}'")  # Debug line
-
-        if response:
-            print(f"[LOG] Received response: {response}")
-            # if response == "ACK":
-            #     key_labels[key_number].config(text=f"Key {key_number}: ACK")
-            # elif response == "NACK":
-            #     key_labels[key_number].config(text=f"Key {key_number}: NACK")
-            # else:
-            #     key_labels[key_number].config(text=f"Key {key_number}: UNKNOWN")
+    key_labels[key_number].config(text=f"Key {key_number}: ...")
+    future = worker.request_key(key_number, KEY_PRESS_DURATION)
+    future.add_done_callback(lambda f: show_key_result(key_number, f))
+
+def process_results():
+    while True:
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            break
+        if result[0] == "display":
+            upper_label.config(text=result[1])
+            lower_label.config(text=result[2])
+            poller.on_frame(result[1] + result[2])
         else:
-            print("[WARNING] No response received from hardware.")
-            # key_labels[key_number].config(text=f"Key {key_number}: No Response")
-        last_key_press_time = time.time()  # Update the timestamp after key press
-    except Exception as e:
-        print(f"[ERROR] Failed to send command: {e}")
-        # key_labels[key_number].config(text=f"Key {key_number}: Error")
+            key_number, outcome = result[1], result[2]
+            text = f"Key {key_number}: {outcome.status}"
+            if outcome.latency is not None:
+                text += f" {outcome.latency * 1000:.0f} ms"
+            key_labels[key_number].config(text=text)
+            if outcome.latency is not None:
+                # The VMC took the press; poll straight away to show its reaction
+                poller.on_key(worker.last_key_press_time)
+                schedule_display_update(poller.floor)
+            log.debug("Key %d %s latency=%s waited=%.3fs",
+                      key_number, outcome.status, outcome.latency, outcome.waited)
+    root.after(RESULT_POLL_INTERVAL, process_results)
 
 # Close the application function
 def close_application(event):
+    worker.stop()
     root.quit()
 
 # GUI Setup
@@ -176,7 +148,7 @@ lower_label.pack(pady=5)
 
 # Create buttons and labels
 buttons = []
-# key_labels = []
+key_labels = []
 
 for i in range(8):  # 8 keys (0-7)
     row = (i // 2) + 2
@@ -201,15 +173,15 @@ for i in range(8):  # 8 keys (0-7)
     buttons.append(button)
 
     # Label below each button
-    # label = tk.Label(
-    #     frame,
-    #     text=f"Key {i}: Waiting",
-    #     bg="#01331A",
-    #     fg="#FAAF40",
-    #     font=("Arial", 10)
-    # )
-    # label.grid(row=row * 2 + 1, column=col, padx=5, pady=5)
-    # key_labels.append(label)
+    label = tk.Label(
+        frame,
+        text=f"Key {i}: Waiting",
+        bg="#01331A",
+        fg="#FAAF40",
+        font=("Arial", 10)
+    )
+    label.grid(row=row * 2 + 1, column=col, padx=5, pady=5)
+    key_labels.append(label)
 
 # Add footer text
 footer = tk.Label(
@@ -222,8 +194,13 @@ footer = tk.Label(
 footer.place(relx=0.5, rely=1.0, anchor="s", y=-5)
 
 # Start periodic display updates
-print("[LOG] Starting periodic display updates.")
-Timer(DISPLAY_UPDATE_INTERVAL, periodic_display_update).start()
-
-print("[LOG] GUI initialized. Ready for interaction.")
-root.mainloop()
\ No newline at end of file
+log.info("Starting periodic display updates.")
+worker.start()
+schedule_display_update(DISPLAY_UPDATE_INTERVAL)
+root.after(RESULT_POLL_INTERVAL, process_results)
+
+log.info("GUI initialized. Ready for interaction.")
+root.mainloop()
+worker.stop()
+worker.join(timeout=2)
+shutdown_logging()
\ No newline at end of file
@@ -1,79 +1,89 @@
-import serial
 import os
-from threading import Timer
+import configparser
+import logging
 import time
+import sys
+
+# Startup milestones are logged with the first frame; for a per-module
+# breakdown of import cost run `python -X importtime uart.py 2> imports.txt`
+STARTED_AT = time.monotonic()
+
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
-import sys
-import uuid
-import psutil  # For CPU usage monitoring
+from uart_config import load_config, open_serial, device_config
+from uart_history import DisplayHistory
+from uart_log import setup_logging, shutdown_logging
+from uart_metrics import MetricsExporter
+from uart_poller import AdaptivePoller
+from uart_telemetry import TelemetrySampler
+from uart_theme import ThemeManager, MAIN_PAGE, MENU_PAGE
+from uart_transport import device_path
+from uart_widgets import HistoryModel, LCDWidget, ModernButton, Sparkline, KEY_PENDING, SHADOW_MARGIN
+from uart_worker import SerialWorker, KEY_PRESS_DURATION, KEY_ERROR, KEY_REJECTED
+
+IMPORTED_AT = time.monotonic()
 
 # Suppress tkinter deprecation warning
 os.environ["TK_SILENCE_DEPRECATION"] = "1"
 
-# Setup serial communication
-try:
-    ser = serial.Serial(
-        port='/dev/serial0',
-        baudrate=9600,
-        bytesize=serial.EIGHTBITS,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        timeout=1.0  # Increased to 1 second
-    )
-    print("[LOG] Using hardware UART at /dev/serial0.")
-except serial.serialutil.SerialException as e:
-    print(f"[ERROR] Failed to initialize UART: {e}")
-    exit(1)
+config, qt_args = load_config(sys.argv[1:])
+setup_logging(config["log_level"], config["log_file"])
+log = logging.getLogger("uart.ui")
+
+
+def open_link():
+    # Returns (ser, broker, device_transports), exactly one of them set.
+    # Called from __main__ once Qt is up, so importing this module never
+    # touches the port.
+    ser = None
+    broker = None
+    device_transports = []
+    devices = []
+    if config["devices"]:
+        # Broker, multi-device and macro modules are imported only by the
+        # setups that use them, to keep them off the startup path
+        from uart_multi import parse_devices
+        devices = parse_devices(config["devices"])
+    if config["broker_socket"]:
+        # uart_broker.py owns the port and keeps polling while we restart
+        from uart_broker import BrokerClient
+        broker = BrokerClient(config["broker_socket"])
+        log.info("Using UART broker at %s.", config["broker_socket"])
+    elif devices:
+        # Several VMCs, one port each, all driven from one engine thread
+        for name, url in devices:
+            device_transports.append((name, url, open_serial(device_config(config, name, url))))
+            log.info("Using UART at %s for device %s.", url, name)
+    else:
+        ser = open_serial(config)
+        log.info("Using UART at %s (%d baud).", config['port'], ser.baudrate)
+    return ser, broker, device_transports
 
 # Key configuration
-KEY_PRESS_DURATION = "1000"  # Default milliseconds duration for key closure
 KEY_LABELS = [
     "Key 0", "Key 1", "Key 2", "Key 3",
     "Key 4", "Key 5", "Key 6", "Key 7"
 ]
 
 # Timer configuration
-DISPLAY_UPDATE_INTERVAL = 0.75
+DISPLAY_UPDATE_INTERVAL = 0.75  # Initial poll interval; adapts between poll_floor and poll_ceiling
 
-# Add at top with other constants
-MAX_ERRORS = 3  # Maximum consecutive errors before showing error message
-error_counter = 0  # Global counter for consecutive errors
+# Commands kept on the wire at once; 1 is strict request/reply
+PIPELINE_DEPTH = 1
 
-# Add this variable at the top with other globals
-last_key_press_time = 0
+SPARKLINE_SAMPLES = 60  # Telemetry samples in the CPU sparkline, one a second
 
-class ModernButton(QPushButton):
-    def __init__(self, text, parent=None):
-        super().__init__(text, parent)
-        self.setMinimumHeight(80)
-        self.setCursor(Qt.PointingHandCursor)
-        
-        # Animation setup
-        self._animation = QPropertyAnimation(self, b"geometry")
-        self._animation.setDuration(100)
-        
-        # Shadow effect
-        self.shadow = QGraphicsDropShadowEffect()
-        self.shadow.setBlurRadius(20)
-        self.shadow.setOffset(0, 0)
-        self.shadow.setColor(QColor(0, 0, 0, 80))
-        self.setGraphicsEffect(self.shadow)
-
-    def enterEvent(self, event):
-        self.shadow.setColor(QColor(250, 175, 64, 180))
-        rect = self.geometry()
-        self._animation.setStartValue(rect)
-        self._animation.setEndValue(QRect(rect.x()-2, rect.y()-2, rect.width()+4, rect.height()+4))
-        self._animation.start()
-
-    def leaveEvent(self, event):
-        self.shadow.setColor(QColor(0, 0, 0, 80))
-        rect = self.geometry()
-        self._animation.setStartValue(rect)
-        self._animation.setEndValue(QRect(rect.x()+2, rect.y()+2, rect.width()-4, rect.height()-4))
-        self._animation.start()
+class UARTSignals(QObject):
+    # Emitted from the serial worker thread, delivered on the GUI thread.
+    # The first argument is the device name ("" with a single port).
+    display_updated = pyqtSignal(str, str, str)
+    status_updated = pyqtSignal(str, str, str)  # The worker's own messages, not VMC frames
+    key_response = pyqtSignal(str, int, str)
+    key_done = pyqtSignal(str, int, object)  # device, key, KeyResult
+    macro_done = pyqtSignal(object)  # MacroReport
+    telemetry_ping = pyqtSignal(object)  # Callable to run on the GUI thread
+    telemetry_sample = pyqtSignal(object)  # TelemetryRing.latest() dict
 
 class MenuOverlay(QWidget):
     def __init__(self, parent=None):
@@ -128,18 +138,102 @@ class MenuOverlay(QWidget):
         self.hide()
 
 class UARTInterface(QMainWindow):
-    def __init__(self):
+    def __init__(self, ser=None, broker=None, device_transports=()):
         super().__init__()
         
         # Set window flags for true fullscreen without decorations
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
         self.showFullScreen()
         
-        # Theme state
-        self.is_dark_theme = True
-        
-        # CPU usage display state
+        # Theme state; font sizes are fixed per screen, colours per theme
+        self.themes = ThemeManager(config["theme"], {"button_font": 36, "display_font": 36})
+
+        # Serial worker owns the port; results come back as signals
+        self.signals = UARTSignals()
+        self.signals.display_updated.connect(self.set_display)
+        self.signals.status_updated.connect(self.set_status)
+        self.signals.key_response.connect(self.on_key_response)
+        self.signals.key_done.connect(self.on_key_done)
+        self.signals.macro_done.connect(self.on_macro_done)
+        self.macro_runner = None
+        self.poller = AdaptivePoller(
+            config["poll_floor"], config["poll_ceiling"], initial=DISPLAY_UPDATE_INTERVAL,
+            keepalive=config["poll_keepalive"]
+        )
+        self.engine = None
+        self.device_frames = {}  # Last frame seen from each device
+        self.histories = {}  # Device -> DisplayHistory of every frame change
+        self.history_model = None  # Built with the menu page
+        if device_transports:
+            from uart_multi import MultiDeviceEngine
+            self.engine = MultiDeviceEngine(
+                on_display=self.signals.display_updated.emit,
+                on_status=self.signals.status_updated.emit,
+                on_key_response=self.signals.key_response.emit,
+                key_repeat=config["key_repeat"],
+                display_mode=config["display_mode"],
+                response_timeout=config["timeout"]
+            )
+            for name, url, transport in device_transports:
+                # Reopened by the engine if the port drops out
+                self.engine.add_device(
+                    name, transport,
+                    reopen=lambda name=name, url=url: open_serial(device_config(config, name, url)),
+                    device_path=device_path(url)
+                )
+            self.workers = self.engine.workers
+            self.current_device = device_transports[0][0]
+            self.engine.start()
+        elif broker:
+            broker.on_display = lambda upper, lower: self.signals.display_updated.emit("", upper, lower)
+            broker.on_status = lambda upper, lower: self.signals.status_updated.emit("", upper, lower)
+            broker.on_key_response = lambda key, response: self.signals.key_response.emit("", key, response)
+            self.workers = {"": broker}
+            self.current_device = ""
+            broker.start()
+        else:
+            worker = SerialWorker(
+                ser,
+                on_display=lambda upper, lower: self.signals.display_updated.emit("", upper, lower),
+                on_status=lambda upper, lower: self.signals.status_updated.emit("", upper, lower),
+                on_key_response=lambda key, response: self.signals.key_response.emit("", key, response),
+                pipeline_depth=PIPELINE_DEPTH,
+                key_repeat=config["key_repeat"],
+                display_mode=config["display_mode"],
+                response_timeout=config["timeout"],
+                reopen=lambda: open_serial(config),
+                device_path=device_path(config["port"])
+            )
+            self.workers = {"": worker}
+            self.current_device = ""
+            worker.start()
+
+        # Optional metrics endpoints (Unix socket / Prometheus text file)
+        self.metrics_exporter = None
+        if config["metrics_socket"] or config["metrics_file"]:
+            self.metrics_exporter = MetricsExporter(
+                {name: w.metrics for name, w in self.workers.items()} if self.engine else self.worker.metrics,
+                socket_path=config["metrics_socket"] or None,
+                file_path=config["metrics_file"] or None
+            )
+            self.metrics_exporter.start()
+
+        # Diagnostics panel state
+        self.show_diagnostics = False
+        
+        # CPU usage display state; the frame is built when first shown
         self.show_cpu_usage = False
+        self.cpu_frame = None
+
+        # System telemetry, sampled off the GUI thread into a ring buffer;
+        # the ping measures how long this event loop takes to get to it
+        self.signals.telemetry_ping.connect(lambda callback: callback())
+        self.signals.telemetry_sample.connect(self.update_cpu_usage)
+        self.telemetry = TelemetrySampler(
+            post=self.signals.telemetry_ping.emit,
+            on_sample=self.signals.telemetry_sample.emit
+        )
+        self.telemetry.start()
         
         # Create stacked widget for multiple pages
         self.stacked_widget = QStackedWidget()
@@ -147,55 +241,24 @@ class UARTInterface(QMainWindow):
         
         # Create main page
         self.main_page = QWidget()
+        self.main_page.setObjectName("mainPage")
         self.setup_main_page()
         self.stacked_widget.addWidget(self.main_page)
         
-        # Create menu page
-        self.menu_page = QWidget()
-        self.setup_menu_page()
-        self.stacked_widget.addWidget(self.menu_page)
+        # The menu page is built the first time it is opened
+        self.menu_page = None
         
         # Apply initial theme
-        self.apply_theme()
+        self.themes.add_page(self.main_page, MAIN_PAGE)
+        self.window_built_at = time.monotonic()
+        self.first_frame_seen = False
 
     def setup_main_page(self):
         # Main page layout
         main_layout = QVBoxLayout(self.main_page)
         main_layout.setSpacing(20)
         main_layout.setContentsMargins(20, 10, 20, 20)
-
-        # Set the dark background for main page
-        self.main_page.setStyleSheet("""
-            QWidget {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                    stop:0 #1a1a1a, stop:1 #2d2d2d);
-            }
-            QFrame {
-                background-color: #1e1e1e;
-                border: 2px solid #3a3a3a;
-                border-radius: 15px;
-                padding: 15px;
-            }
-            QPushButton {
-                background-color: #2e2e2e;
-                color: #ffffff;
-                border: none;
-                border-radius: 15px;
-                padding: 15px;
-                font-size: 36px;  /* Significantly increased font size */
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #3e3e3e;
-            }
-            QPushButton:pressed {
-                background-color: #4a4a4a;
-            }
-            QLabel {
-                color: #ffffff;
-                font-size: 24px;  /* Increased base font size */
-            }
-        """)
+        self.main_layout = main_layout  # The CPU frame is slotted in later
 
         # Add stretch at the top to push content down slightly
         main_layout.addStretch(2)  # Adjust this value to control top spacing
@@ -233,37 +296,32 @@ class UARTInterface(QMainWindow):
         """)
         menu_button.clicked.connect(self.show_menu)
         
+        # Device switch button, only shown when driving several VMCs
+        self.device_button = QPushButton(self.current_device)
+        self.device_button.setStyleSheet("""
+            QPushButton {
+                background-color: transparent;
+                color: #666666;
+                border: none;
+                font-size: 22px;
+                font-weight: bold;
+                padding: 0px;
+            }
+        """)
+        self.device_button.clicked.connect(self.next_device)
+        self.device_button.setVisible(len(self.workers) > 1)
+        header_layout.addWidget(self.device_button)
+
         header_layout.addStretch()
         header_layout.addWidget(menu_button)
         display_layout.addWidget(header_container)
         
         # Display labels
-        self.upper_label = QLabel(" " * 20)
-        self.lower_label = QLabel(" " * 20)
-        self.upper_label.setAlignment(Qt.AlignCenter)
-        self.lower_label.setAlignment(Qt.AlignCenter)
-        self.upper_label.setStyleSheet("font-size: 36px; padding: 10px;")  # Significantly increased font size
-        self.lower_label.setStyleSheet("font-size: 36px; padding: 10px;")  # Significantly increased font size
-        display_layout.addWidget(self.upper_label)
-        display_layout.addWidget(self.lower_label)
+        # 20x2 character display, repainted cell by cell
+        self.lcd = LCDWidget(self.themes)
+        display_layout.addWidget(self.lcd)
         main_layout.addWidget(display_frame)
 
-        # CPU Usage display frame (initially hidden)
-        self.cpu_frame = QFrame()
-        self.cpu_frame.setObjectName("cpuFrame")
-        self.cpu_frame.setFixedHeight(100)  # Smaller than main display
-        cpu_layout = QVBoxLayout(self.cpu_frame)
-        cpu_layout.setSpacing(10)
-        
-        # CPU usage label
-        self.cpu_label = QLabel("CPU Usage: 0%")
-        self.cpu_label.setAlignment(Qt.AlignCenter)
-        self.cpu_label.setStyleSheet("font-size: 24px; padding: 10px;")
-        cpu_layout.addWidget(self.cpu_label)
-        
-        main_layout.addWidget(self.cpu_frame)
-        self.cpu_frame.hide()  # Initially hidden
-
         # Add stretch between display and buttons for balanced spacing
         main_layout.addStretch(3)  # Adjust this value to control spacing between display and buttons
 
@@ -272,15 +330,16 @@ class UARTInterface(QMainWindow):
         button_container.setObjectName("buttonContainer")
         button_container.setFixedHeight(600)  # Increased height to prevent squishing (was 500)
         button_layout = QGridLayout(button_container)
-        button_layout.setSpacing(30)  # Increased spacing between buttons (was 20)
+        # 30px between button faces; each button keeps its shadow margin inside itself
+        button_layout.setSpacing(30 - 2 * SHADOW_MARGIN)
         
         self.buttons = []
         for i in range(8):
             row = (i // 2)
             col = i % 2
-            button = ModernButton(KEY_LABELS[i])
-            button.setMinimumHeight(120)  # Button height (unchanged)
-            button.clicked.connect(lambda checked, n=i: send_key_command(n))
+            button = ModernButton(KEY_LABELS[i], self.themes)
+            button.setMinimumHeight(120 + 2 * SHADOW_MARGIN)  # 120px face plus its shadow margin
+            button.clicked.connect(lambda checked, n=i: self.press_key(n))
             button_layout.addWidget(button, row, col)
             self.buttons.append(button)
 
@@ -304,36 +363,18 @@ class UARTInterface(QMainWindow):
 
         # Setup periodic display updates
         self.display_timer = QTimer()
+        self.display_timer.setSingleShot(True)  # Re-armed with the adaptive interval
         self.display_timer.timeout.connect(self.update_displays)
-        self.display_timer.start(int(DISPLAY_UPDATE_INTERVAL * 1000))
+        self.display_timer.start(0)  # First poll right away, then adaptive
 
     def setup_menu_page(self):
-        self.menu_page.setStyleSheet("""
-            QWidget {
-                background-color: #1a1a1a;
-            }
-            QPushButton {
-                background-color: #2e2e2e;
-                color: #ffffff;
-                border: none;
-                border-radius: 15px;
-                padding: 20px;
-                font-size: 16px;
-                font-weight: bold;
-                min-width: 200px;
-            }
-            QPushButton:hover {
-                background-color: #3e3e3e;
-            }
-        """)
-        
         # Menu page layout
         menu_layout = QVBoxLayout(self.menu_page)
         menu_layout.setAlignment(Qt.AlignCenter)
         menu_layout.setSpacing(20)
         
         # Theme toggle button
-        self.theme_btn = QPushButton("Switch to Light Theme" if self.is_dark_theme else "Switch to Dark Theme")
+        self.theme_btn = QPushButton(f"Switch to {self.themes.next_label} Theme")
         self.theme_btn.clicked.connect(self.toggle_theme)
         menu_layout.addWidget(self.theme_btn)
         
@@ -342,6 +383,51 @@ class UARTInterface(QMainWindow):
         self.cpu_toggle_btn.clicked.connect(self.toggle_cpu_usage)
         menu_layout.addWidget(self.cpu_toggle_btn)
         
+        # Diagnostics toggle button and panel
+        self.diagnostics_btn = QPushButton("Show Diagnostics")
+        self.diagnostics_btn.clicked.connect(self.toggle_diagnostics)
+        menu_layout.addWidget(self.diagnostics_btn)
+
+        self.diagnostics_label = QLabel()
+        self.diagnostics_label.setObjectName("diagnosticsLabel")
+        self.diagnostics_label.setStyleSheet("color: #aaaaaa; font-family: 'Courier'; font-size: 14px;")
+        menu_layout.addWidget(self.diagnostics_label)
+        self.diagnostics_label.hide()
+
+        self.diagnostics_timer = QTimer()
+        self.diagnostics_timer.timeout.connect(self.update_diagnostics)
+
+        # One button per macro in the macro file, with the last run's result
+        self.macros = {}
+        if config["macro_file"]:
+            from uart_macro import load_macros
+            try:
+                self.macros = load_macros(config["macro_file"])
+            except (OSError, ValueError, configparser.Error) as e:
+                log.error("Failed to load macros: %s", e)
+        for name in self.macros:
+            macro_btn = QPushButton(f"Run {name}")
+            macro_btn.clicked.connect(lambda checked, name=name: self.run_macro(name))
+            menu_layout.addWidget(macro_btn)
+        self.macro_label = QLabel()
+        self.macro_label.setStyleSheet("color: #aaaaaa; font-size: 14px;")
+        menu_layout.addWidget(self.macro_label)
+        self.macro_label.setVisible(bool(self.macros))
+
+        # Display history of the current device, newest first
+        self.history_btn = QPushButton("Show History")
+        self.history_btn.clicked.connect(self.toggle_history)
+        menu_layout.addWidget(self.history_btn)
+
+        self.history_model = HistoryModel(self.history_for(self.current_device))
+        self.history_view = QListView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setUniformItemSizes(True)  # Row heights without formatting every row
+        self.history_view.setStyleSheet("color: #aaaaaa; font-family: 'Courier'; font-size: 14px;")
+        self.history_view.setFixedHeight(300)
+        menu_layout.addWidget(self.history_view)
+        self.history_view.hide()
+
         # Return button
         return_btn = QPushButton("Return to Program")
         return_btn.clicked.connect(self.show_main)
@@ -363,306 +449,218 @@ class UARTInterface(QMainWindow):
         menu_layout.addWidget(exit_btn)
 
     def toggle_theme(self):
-        self.is_dark_theme = not self.is_dark_theme
-        self.theme_btn.setText("Switch to Light Theme" if self.is_dark_theme else "Switch to Dark Theme")
-        self.apply_theme()
+        self.themes.set_theme(self.themes.next_name)
+        self.theme_btn.setText(f"Switch to {self.themes.next_label} Theme")
+
+    def setup_cpu_frame(self):
+        # CPU Usage display frame, right under the display frame
+        self.cpu_frame = QFrame()
+        self.cpu_frame.setObjectName("cpuFrame")
+        self.cpu_frame.setFixedHeight(150)  # Smaller than main display
+        cpu_layout = QVBoxLayout(self.cpu_frame)
+        cpu_layout.setSpacing(10)
+        
+        # Latest sample, with total CPU over the last minute below it
+        self.cpu_label = QLabel("CPU Usage: 0%")
+        self.cpu_label.setAlignment(Qt.AlignCenter)
+        self.cpu_label.setStyleSheet("font-size: 24px; padding: 10px;")
+        cpu_layout.addWidget(self.cpu_label)
+        self.cpu_sparkline = Sparkline(self.themes)
+        cpu_layout.addWidget(self.cpu_sparkline)
+        
+        self.main_layout.insertWidget(2, self.cpu_frame)
 
     def toggle_cpu_usage(self):
         self.show_cpu_usage = not self.show_cpu_usage
         self.cpu_toggle_btn.setText("Hide CPU Usage" if self.show_cpu_usage else "Show CPU Usage")
         
         if self.show_cpu_usage:
+            if self.cpu_frame is None:
+                self.setup_cpu_frame()
             self.cpu_frame.show()
+            self.update_cpu_usage(self.telemetry.ring.latest())
         else:
             self.cpu_frame.hide()
 
     def update_displays(self):
-        # Update UART display
-        send_display_command(0)
-        
-        # Update CPU usage if enabled
-        if self.show_cpu_usage:
-            self.update_cpu_usage()
+        # Update UART displays; every device is polled so switching shows a fresh frame
+        for worker in self.workers.values():
+            worker.request_display(0)
+
+        # Only a keepalive is needed once every device pushes its display
+        self.poller.push = all(getattr(w, "push_active", False) for w in self.workers.values())
+        self.display_timer.start(int(self.poller.next_interval() * 1000))
     
-    def update_cpu_usage(self):
-        try:
-            cpu_percent = psutil.cpu_percent(interval=None)
-            self.cpu_label.setText(f"CPU Usage: {cpu_percent:.1f}%")
-        except Exception as e:
-            print(f"[ERROR] Failed to get CPU usage: {e}")
-            self.cpu_label.setText("CPU Usage: Error")
-
-    def apply_theme(self):
-        if self.is_dark_theme:
-            self.apply_dark_theme()
+    def update_cpu_usage(self, sample):
+        # Runs once per telemetry sample; only reads what the sampler stored
+        if not self.show_cpu_usage or sample is None:
+            return
+        text = "CPU Usage: --" if sample["cpu"] != sample["cpu"] else f"CPU Usage: {sample['cpu']:.1f}%"
+        if sample["soc_temp_c"] == sample["soc_temp_c"]:  # Not NaN
+            text += f"  SoC {sample['soc_temp_c']:.1f}\u00b0C"
+        self.cpu_label.setText(text)
+        self.cpu_sparkline.set_values(self.telemetry.ring.series("cpu", SPARKLINE_SAMPLES))
+
+    def toggle_diagnostics(self):
+        self.show_diagnostics = not self.show_diagnostics
+        self.diagnostics_btn.setText("Hide Diagnostics" if self.show_diagnostics else "Show Diagnostics")
+
+        if self.show_diagnostics:
+            self.update_diagnostics()
+            self.diagnostics_label.show()
+            self.diagnostics_timer.start(1000)
         else:
-            self.apply_light_theme()
-
-    def apply_dark_theme(self):
-        # Main page dark theme
-        self.main_page.setStyleSheet("""
-            QWidget {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                    stop:0 #1a1a1a, stop:1 #2d2d2d);
-            }
-            QFrame {
-                background-color: #1e1e1e;
-                border: 2px solid #3a3a3a;
-                border-radius: 15px;
-                padding: 15px;
-            }
-            QPushButton {
-                background-color: #2e2e2e;
-                color: #ffffff;
-                border: none;
-                border-radius: 15px;
-                padding: 15px;
-                font-size: 36px;  /* Significantly increased font size */
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #3e3e3e;
-            }
-            QPushButton:pressed {
-                background-color: #4a4a4a;
-            }
-            QLabel {
-                color: #ffffff;
-            }
-            
-            /* Display frame specific styles */
-            QFrame#displayFrame QLabel {
-                color: #00ff00;
-                font-family: 'Courier';
-                font-size: 36px;  /* Significantly increased font size */
-                font-weight: bold;
-            }
-            
-            /* CPU frame specific styles */
-            QFrame#cpuFrame {
-                background-color: #1e1e1e;
-                border: 2px solid #3a3a3a;
-                border-radius: 15px;
-                padding: 10px;
-            }
-            QFrame#cpuFrame QLabel {
-                color: #ffaa00;
-                font-family: 'Courier';
-                font-size: 24px;
-                font-weight: bold;
-            }
-        """)
-        
-        # Menu page dark theme
-        self.menu_page.setStyleSheet("""
-            QWidget {
-                background-color: #1a1a1a;
-            }
-            QPushButton {
-                background-color: #2e2e2e;
-                color: #ffffff;
-                border: none;
-                border-radius: 15px;
-                padding: 20px;
-                font-size: 16px;
-                font-weight: bold;
-                min-width: 200px;
-            }
-            QPushButton:hover {
-                background-color: #3e3e3e;
-            }
-            QPushButton#exitButton {
-                background-color: #662222;
-            }
-            QPushButton#exitButton:hover {
-                background-color: #883333;
-            }
-        """)
+            self.diagnostics_timer.stop()
+            self.diagnostics_label.hide()
+
+    def update_diagnostics(self):
+        text = self.worker.metrics.summary_text()
+        if self.engine:
+            text = f"Device {self.current_device}\n{text}"
+        text += "\n" + self.telemetry.summary_text()
+        self.diagnostics_label.setText(text)
+
+    def history_for(self, device):
+        history = self.histories.get(device)
+        if history is None:
+            history = self.histories[device] = DisplayHistory()
+        return history
+
+    def toggle_history(self):
+        showing = not self.history_view.isVisible()
+        self.history_view.setVisible(showing)
+        self.history_btn.setText("Hide History" if showing else "Show History")
+        if showing:
+            self.history_view.scrollToTop()
+
+    def run_macro(self, name):
+        # Runs on the current device, alongside the display polling
+        if self.macro_runner:
+            self.macro_runner.cancel()
+            self.macro_label.setText(f"Cancelling {self.macro_runner.macro.name}")
+            return
+        from uart_macro import MacroRunner
+        self.macro_runner = MacroRunner(self.worker, self.macros[name], on_done=self.signals.macro_done.emit)
+        self.macro_runner.start()
+        self.macro_label.setText(f"Running {name} (press any macro to cancel)")
 
-    def apply_light_theme(self):
-        # Main page light theme
-        self.main_page.setStyleSheet("""
-            QWidget {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                    stop:0 #f0f0f0, stop:1 #e0e0e0);
-            }
-            QFrame {
-                background-color: #ffffff;
-                border: 2px solid #dddddd;
-                border-radius: 15px;
-                padding: 15px;
-            }
-            QPushButton {
-                background-color: #f8f8f8;
-                color: #333333;
-                border: none;
-                border-radius: 15px;
-                padding: 15px;
-                font-size: 36px;  /* Significantly increased font size */
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #eeeeee;
-            }
-            QPushButton:pressed {
-                background-color: #e0e0e0;
-            }
-            QLabel {
-                color: #333333;
-            }
-            
-            /* Display frame specific styles */
-            QFrame#displayFrame {
-                background-color: #ffffff;
-            }
-            QFrame#displayFrame QLabel {
-                color: #0066cc;
-                font-family: 'Courier';
-                font-size: 36px;  /* Significantly increased font size */
-                font-weight: bold;
-            }
-            
-            /* Button container specific styles */
-            QFrame#buttonContainer {
-                background-color: #f5f5f5;
-            }
-            
-            /* CPU frame specific styles */
-            QFrame#cpuFrame {
-                background-color: #ffffff;
-                border: 2px solid #dddddd;
-                border-radius: 15px;
-                padding: 10px;
-            }
-            QFrame#cpuFrame QLabel {
-                color: #ff6600;
-                font-family: 'Courier';
-                font-size: 24px;
-                font-weight: bold;
-            }
-        """)
-        
-        # Menu page light theme
-        self.menu_page.setStyleSheet("""
-            QWidget {
-                background-color: #f0f0f0;
-            }
-            QPushButton {
-                background-color: #ffffff;
-                color: #333333;
-                border: none;
-                border-radius: 15px;
-                padding: 20px;
-                font-size: 16px;
-                font-weight: bold;
-                min-width: 200px;
-            }
-            QPushButton:hover {
-                background-color: #f5f5f5;
-            }
-            QPushButton:pressed {
-                background-color: #e8e8e8;
-            }
-            QPushButton#exitButton {
-                background-color: #662222;
-                color: #ffffff;
-            }
-            QPushButton#exitButton:hover {
-                background-color: #883333;
-            }
-        """)
+    def on_macro_done(self, report):
+        self.macro_runner = None
+        self.macro_label.setText(f"{report.macro.name}: {report.summary()}")
+        log.info("%s", report.summary_text())
 
     def show_menu(self):
+        if self.menu_page is None:
+            self.menu_page = QWidget()
+            self.menu_page.setObjectName("menuPage")
+            self.setup_menu_page()
+            self.stacked_widget.addWidget(self.menu_page)
+            self.themes.add_page(self.menu_page, MENU_PAGE)
         self.stacked_widget.setCurrentIndex(1)  # Show menu page
 
     def show_main(self):
         self.stacked_widget.setCurrentIndex(0)  # Show main page
 
-    def closeEvent(self, event):
-        self.display_timer.stop()
-        event.accept()
-
-# Modify your display update function to work with Qt labels
-def send_display_command(n):
-    global error_counter
-    command = f"DISPLAY {n}\r"
-    print(f"[DEBUG] Sending DISPLAY command: {command.strip()}")
-
-    try:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        ser.write(command.encode())
-        response = ser.read(41)  # Read exactly 41 characters (40 display chars + CR)
-        
-        if not response:
-            error_counter += 1
-            print(f"[WARNING] No response from VMC (Attempt {error_counter}/{MAX_ERRORS})")
-            if error_counter >= MAX_ERRORS:
-                window.upper_label.setText("Timeout Error")
-                window.lower_label.setText("No VMC Response")
-                error_counter = MAX_ERRORS
+    @property
+    def worker(self):
+        # Worker for the device currently on screen
+        return self.workers[self.current_device]
+
+    def set_display(self, device, upper_line, lower_line):
+        if not self.first_frame_seen:
+            self.first_frame_seen = True
+            now = time.monotonic()
+            log.info(
+                "First frame %.0f ms after start (imports %.0f ms, setup %.0f ms)",
+                (now - STARTED_AT) * 1000, (IMPORTED_AT - STARTED_AT) * 1000,
+                (self.window_built_at - IMPORTED_AT) * 1000
+            )
+        self.device_frames[device] = (upper_line, lower_line)
+        if self.history_model is not None and device == self.current_device:
+            self.history_model.record(upper_line, lower_line)  # Keeps an open history view in step
+        else:
+            self.history_for(device).record(upper_line, lower_line)
+        if device != self.current_device:
             return
-            
-        error_counter = 0  # Success - reset error counter
-        
-        if response.endswith(b'\r'):
-            response = response[:-1]
-            
-        response_str = response.decode()
-        print(f"[DEBUG] Raw display response: '{response_str}'")
-
-        if len(response_str) == 40:
-            upper_line = response_str[:20]
-            lower_line = response_str[20:]
-            window.upper_label.setText(upper_line)
-            window.lower_label.setText(lower_line)
-            print(f"[LOG] Display updated: {response_str}")
-            
-    except (serial.SerialTimeoutException, Exception) as e:
-        error_counter += 1
-        print(f"[WARNING] Communication error (Attempt {error_counter}/{MAX_ERRORS}): {e}")
-        
-        if error_counter >= MAX_ERRORS:
-            window.upper_label.setText("Error")
-            window.lower_label.setText("Check Connection")
-            error_counter = MAX_ERRORS
-            print("[ERROR] Max consecutive errors reached")
-
-# Command execution function
-def send_key_command(key_number):
-    global last_key_press_time
-    command = f"KEY {key_number} {KEY_PRESS_DURATION}\r"
-    print(f"[DEBUG] Sending command: {command.strip()}")
-
-    try:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        ser.write(command.encode())
-        
-        response = ser.read_until(b'\r').decode().strip()
-        print(f"[DEBUG] Raw key response: '{response}'")
+        self.lcd.set_lines(upper_line, lower_line)
+        self.poller.on_frame(upper_line + lower_line)
+
+    def set_status(self, device, upper_line, lower_line):
+        # Shown like a frame, but kept out of the history and the poller
+        self.device_frames[device] = (upper_line, lower_line)
+        if device == self.current_device:
+            self.lcd.set_lines(upper_line, lower_line)
+
+    def press_key(self, key_number):
+        # Returns at once; the button shows the outcome when the worker
+        # resolves the press
+        device = self.current_device
+        self.buttons[key_number].set_status(KEY_PENDING)
+        future = self.worker.request_key(key_number, KEY_PRESS_DURATION)
+        future.add_done_callback(
+            lambda f: f.cancelled() or self.signals.key_done.emit(device, key_number, f.result())
+        )
+
+    def on_key_done(self, device, key_number, result):
+        if device != self.current_device:
+            return
+        self.buttons[key_number].set_status(result.status)
+        log.debug("Key %d %s latency=%s waited=%.3fs",
+                  key_number, result.status, result.latency, result.waited)
+
+    def on_key_response(self, device, key_number, status):
+        if device != self.current_device or status in (KEY_ERROR, KEY_REJECTED):
+            return  # Never reached the VMC
+        # Poll straight away so the VMC's reaction shows up quickly
+        self.poller.on_key(self.worker.last_key_press_time)
+        self.display_timer.start(int(self.poller.floor * 1000))
+
+    def next_device(self):
+        names = list(self.workers)
+        self.current_device = names[(names.index(self.current_device) + 1) % len(names)]
+        self.device_button.setText(self.current_device)
+        upper_line, lower_line = self.device_frames.get(self.current_device, (" " * 20, " " * 20))
+        self.lcd.set_lines(upper_line, lower_line)
+        for button in self.buttons:
+            button.set_status(None)  # Outcomes belong to the previous device
+        if self.history_model is not None:
+            self.history_model.set_history(self.history_for(self.current_device))
+        if self.show_diagnostics:
+            self.update_diagnostics()
 
-        if response:
-            print(f"[LOG] Received response: {response}")
+    def closeEvent(self, event):
+        self.display_timer.stop()
+        self.telemetry.stop()
+        if self.macro_runner:
+            self.macro_runner.cancel()
+        if self.engine:
+            self.engine.stop()
         else:
-            print("[WARNING] No response received from hardware.")
-            
-        last_key_press_time = time.time()
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to send command: {e}")
+            self.worker.stop()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+        event.accept()
 
 if __name__ == "__main__":
     # Initialize Qt application
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Enable high DPI scaling
     app.setAttribute(Qt.AA_EnableHighDpiScaling)
     app.setAttribute(Qt.AA_UseHighDpiPixmaps)
     
+    try:
+        link = open_link()
+    except (OSError, ValueError) as e:  # SerialException is an OSError
+        log.error("Failed to initialize UART: %s", e)
+        shutdown_logging()
+        sys.exit(1)
+
     # Create main window
-    window = UARTInterface()
+    window = UARTInterface(*link)
     window.show()
     
     # Start Qt event loop
-    sys.exit(app.exec_())
\ No newline at end of file
+    status = app.exec_()
+    shutdown_logging()
+    sys.exit(status)
\ No newline at end of file
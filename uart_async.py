@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import sys
+
+from uart_config import load_config, open_serial
+from uart_log import setup_logging
+from uart_protocol import FrameDecoder, EXPECTED_REPLIES, FRAME_NACK, FRAME_JUNK
+from uart_worker import KEY_PRESS_DURATION
+
+log = logging.getLogger("uart.async")
+
+# Seconds to wait for a reply before giving up on a command
+RESPONSE_TIMEOUT = 1.0
+
+
+class AsyncUARTClient:
+    # asyncio front end for the VMC protocol. The port is switched to
+    # non-blocking mode and read from a loop reader callback, so polling,
+    # key injection and anything else can share one event loop (including
+    # a qasync loop driving the Qt frontends). Replies are decoded with
+    # FrameDecoder and only a frame of a kind the pending command can get
+    # answers it, so the late reply to a command that timed out is counted
+    # in `discarded` rather than handed to the next one.
+    def __init__(self, ser, timeout=RESPONSE_TIMEOUT):
+        self.ser = ser
+        self.timeout = timeout
+        self._loop = None
+        self.decoder = FrameDecoder()
+        self.discarded = 0  # Frames no command was waiting for
+        self._lock = asyncio.Lock()
+        self._waiter = None
+        self._expected = ()
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self.ser.timeout = 0
+        self.ser.write_timeout = 0
+        self._loop.add_reader(self.ser.fileno(), self._on_readable)
+        return self
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.ser.fileno())
+            self._loop = None
+        self.ser.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except OSError as e:
+            if self._waiter is not None and not self._waiter.done():
+                self._waiter.set_exception(e)
+            return
+        for frame in self.decoder.feed(data):
+            if frame.kind == FRAME_JUNK:
+                log.debug("Resyncing, skipped %d bytes: %r", len(frame.data), frame.data)
+            elif self._waiter is not None and not self._waiter.done() and frame.kind in self._expected:
+                self._waiter.set_result(frame)
+            else:
+                # Late reply to a command that already timed out
+                self.discarded += 1
+                log.debug("Dropping unexpected %s: %r", frame.kind, frame.data)
+
+    async def _transact(self, name, command):
+        # Returns the first frame that can answer command `name`
+        async with self._lock:
+            self._waiter = self._loop.create_future()
+            self._expected = EXPECTED_REPLIES[name]
+            try:
+                self.ser.write(command.encode())
+                return await asyncio.wait_for(self._waiter, self.timeout)
+            finally:
+                self._waiter = None
+                self._expected = ()
+
+    async def display(self, n=0):
+        # Returns the (upper, lower) 20-character lines of display n
+        frame = await self._transact("DISPLAY", f"DISPLAY {n}\r")
+        if frame.kind == FRAME_NACK:
+            raise ValueError(f"VMC rejected DISPLAY {n}")
+        return frame.lines
+
+    async def key(self, key_number, duration=KEY_PRESS_DURATION):
+        # Returns the VMC's reply to a key closure, "ACK" or "NACK"; raises
+        # asyncio.TimeoutError if neither arrives
+        frame = await self._transact("KEY", f"KEY {key_number} {duration}\r")
+        return frame.text
+
+    async def poll_display(self, callback, n=0, interval=0.75):
+        # Poll display n forever, handing each frame to callback(upper, lower)
+        while True:
+            try:
+                callback(*(await self.display(n)))
+            except (asyncio.TimeoutError, ValueError) as e:
+                log.warning("Display poll failed: %r", e)
+            await asyncio.sleep(interval)
+
+
+async def open_client(config):
+    # Baud negotiation (if configured) runs blocking before we go async
+    ser = open_serial(config)
+    return await AsyncUARTClient(ser, timeout=config["timeout"]).open()
+
+
+async def main():
+    config, _ = load_config(sys.argv[1:])
+    setup_logging(config["log_level"], config["log_file"])
+    client = await open_client(config)
+    try:
+        await client.poll_display(lambda upper, lower: log.info("%s|%s", upper, lower))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(0)
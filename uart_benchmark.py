@@ -0,0 +1,262 @@
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+
+from uart_capture import READ, read_capture
+from uart_config import load_config, open_serial
+from uart_log import setup_logging, shutdown_logging
+from uart_protocol import FrameDecoder
+from uart_transport import LoopbackTransport
+from uart_poller import POLL_FLOOR
+from uart_worker import SerialWorker, KEY_PRESS_DURATION, frame_time
+from vmc_simulator import VMCSimulator, PAGE_COUNT
+
+RECOVERY_OUTAGE = 2.0  # Seconds the VMC stays silent after the circuit opens
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile of an unsorted list, None if empty
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    # Latency stats in milliseconds
+    ms = [s * 1000 for s in samples]
+    return {
+        "count": len(ms),
+        "mean_ms": sum(ms) / len(ms) if ms else None,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+    }
+
+
+class Recorder:
+    # Collects what the worker reports through its callbacks
+    def __init__(self):
+        self.latencies = {"DISPLAY": [], "KEY": []}
+        self.frames = 0
+        self.key_responses = []
+        self._cond = threading.Condition()
+
+    def on_latency(self, name, latency):
+        with self._cond:
+            self.latencies[name].append(latency)
+            self._cond.notify_all()
+
+    def on_display(self, upper_line, lower_line):
+        with self._cond:
+            self.frames += 1
+            self._cond.notify_all()
+
+    def on_key_response(self, key_number, response):
+        self.key_responses.append(response)
+
+    def wait_for_displays(self, count, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.latencies["DISPLAY"]) >= count, timeout)
+
+
+def bench_display(worker, recorder, count):
+    # Back-to-back DISPLAY polls through send_display_command, or through
+    # the worker thread when pipelining so several are on the wire at once
+    recorder.latencies["DISPLAY"].clear()
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    if worker.pipeline_depth > 1:
+        worker.start()
+        for i in range(count):
+            # Distinct pages so the scheduler doesn't coalesce them
+            while not worker.scheduler.put_display(i % PAGE_COUNT):
+                time.sleep(0.001)
+        recorder.wait_for_displays(count, timeout=count * 1.0)
+    else:
+        for _ in range(count):
+            worker.send_display_command(0)
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    done = len(recorder.latencies["DISPLAY"])
+    return {
+        "polls": count,
+        "answered": done,
+        "seconds": wall,
+        "polls_per_second": done / wall if wall else None,
+        "cpu_ms_per_poll": cpu * 1000 / count if count else None,
+        "round_trip": summarize(recorder.latencies["DISPLAY"]),
+    }
+
+
+def bench_keys(worker, recorder, count):
+    recorder.latencies["KEY"].clear()
+    for i in range(count):
+        worker.send_key_command(i % 8, KEY_PRESS_DURATION)
+    return {
+        "presses": count,
+        "acks": recorder.key_responses.count("ACK"),
+        "key_to_ack": summarize(recorder.latencies["KEY"]),
+    }
+
+
+def bench_recovery(worker, recorder, simulator, outage=RECOVERY_OUTAGE):
+    # Silence the VMC until the circuit opens and for `outage` seconds
+    # more, then measure how long the running worker (circuit breaker,
+    # probe backoff and all) takes to deliver a frame once it comes back.
+    # Polls are requested at the frontends' fastest rate throughout.
+    worker.start()
+
+    def poll_until(done, timeout):
+        deadline = time.monotonic() + timeout
+        while not done() and time.monotonic() < deadline:
+            worker.request_display(0)
+            time.sleep(POLL_FLOOR)
+        return done()
+
+    simulator.silent = True
+    poll_until(lambda: worker.breaker.is_open, timeout=30.0)
+    poll_until(lambda: False, timeout=outage)
+    backoff = worker.breaker.backoff
+    polls_before = worker.metrics.counters["polls_sent"]
+    answered = len(recorder.latencies["DISPLAY"])
+    simulator.silent = False
+    start = time.monotonic()
+    recovered = poll_until(lambda: len(recorder.latencies["DISPLAY"]) > answered, timeout=30.0)
+    elapsed = time.monotonic() - start
+    worker.stop()
+    worker.join()
+    return {
+        "outage_s": outage,
+        "probe_backoff_s": backoff,
+        "recovered": recovered,
+        "recovery_ms": elapsed * 1000,
+        "polls_to_recover": worker.metrics.counters["polls_sent"] - polls_before,
+        "link_state": worker.breaker.state,
+    }
+
+
+def bench_decode(path, rounds=10):
+    # Push a field capture's received bytes through the frame decoder in
+    # the chunks they actually arrived in
+    chunks = [payload for _, kind, payload in read_capture(path) if kind == READ]
+    total = sum(len(chunk) for chunk in chunks)
+    frames = resyncs = 0
+    cpu_start = time.process_time()
+    for _ in range(rounds):
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            decoder.feed(chunk)
+        frames, resyncs = decoder.frames_decoded, decoder.resyncs
+    cpu = time.process_time() - cpu_start
+    return {
+        "capture": path,
+        "chunks": len(chunks),
+        "bytes": total,
+        "frames": frames,
+        "resyncs": resyncs,
+        "mb_per_second": total * rounds / cpu / 1e6 if cpu else None,
+        "us_per_frame": cpu * 1e6 / (frames * rounds) if frames else None,
+    }
+
+
+def write_results(results, path):
+    text = json.dumps(results, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main():
+    config, argv = load_config(sys.argv[1:])
+    parser = argparse.ArgumentParser(
+        description="Latency/throughput benchmark for the UART engine. Runs "
+                    "against a simulated VMC unless --hardware is given."
+    )
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--pipeline-depth", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated VMC reply delay")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop", type=float, default=0.0)
+    parser.add_argument("--garble", type=float, default=0.0)
+    parser.add_argument("--no-recovery", action="store_true", help="Skip the timeout recovery run")
+    parser.add_argument("--outage", type=float, default=RECOVERY_OUTAGE,
+                        help="Seconds the VMC stays silent after the circuit opens")
+    parser.add_argument("--hardware", action="store_true", help="Benchmark the configured --port")
+    parser.add_argument("--decode", metavar="CAPTURE", help="Only benchmark decoding this capture file")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    setup_logging(config["log_level"], config["log_file"])
+
+    if args.decode:
+        results = {"timestamp": time.time(), "python": platform.python_version(),
+                   "machine": platform.machine(), "decode": bench_decode(args.decode)}
+        shutdown_logging()
+        write_results(results, args.output)
+        return
+
+    simulator = None
+    if args.hardware:
+        transport = open_serial(config)
+    else:
+        transport, vmc_end = LoopbackTransport.pair(baudrate=config["baudrate"])
+        simulator = VMCSimulator(
+            vmc_end, latency=args.latency, jitter=args.jitter, drop_rate=args.drop,
+            garble_rate=args.garble, seed=1, wire_baud=config["baudrate"]
+        )
+        simulator.start()
+
+    recorder = Recorder()
+    worker = SerialWorker(
+        transport,
+        on_display=recorder.on_display,
+        on_key_response=recorder.on_key_response,
+        on_latency=recorder.on_latency,
+        pipeline_depth=args.pipeline_depth,
+        response_timeout=config["timeout"]
+    )
+    # Same read slicing the worker thread sets up for itself
+    transport.timeout = frame_time(transport.baudrate)
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "transport": config["port"] if args.hardware else "loop:// (simulated VMC)",
+        "baudrate": transport.baudrate,
+        "pipeline_depth": args.pipeline_depth,
+        "log_level": config["log_level"],
+        "simulator": None if args.hardware else {
+            "latency": args.latency, "jitter": args.jitter,
+            "drop_rate": args.drop, "garble_rate": args.garble,
+        },
+    }
+
+    # Engine logging runs at the configured level, as it would in the field
+    if args.pipeline_depth > 1:
+        results["display"] = bench_display(worker, recorder, args.polls)
+        worker.stop()
+        worker.join()
+    else:
+        results["keys"] = bench_keys(worker, recorder, args.keys)
+        results["display"] = bench_display(worker, recorder, args.polls)
+        if simulator and not args.no_recovery:
+            results["recovery"] = bench_recovery(worker, recorder, simulator, args.outage)
+
+    if simulator:
+        simulator.stop()
+    transport.close()
+    shutdown_logging()
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+import configparser
+import itertools
+import logging
+import os
+import queue
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from uart_config import load_config, open_serial
+from uart_log import setup_logging, shutdown_logging
+from uart_macro import MacroRunner, load_macros
+from uart_metrics import LinkMetrics, MetricsExporter
+from uart_poller import AdaptivePoller
+from uart_transport import device_path
+from uart_worker import (
+    SerialWorker, KeyResult, KEY_PRESS_DURATION,
+    KEY_NACK, KEY_TIMEOUT, KEY_ERROR, KEY_REJECTED, KEY_STATUSES, KEY_REPEAT_QUEUE, DISPLAY_AUTO, RESPONSE_TIMEOUT
+)
+
+log = logging.getLogger("uart.broker")
+
+# Wire protocol, one newline-terminated line per message:
+#   client -> broker   KEY <n> [<ms> [<id>]]  press a key
+#                      DISPLAY <n>            ask for an extra poll of page n
+#                      MACRO <name>           run a macro from the macro file
+#                      CANCEL                 stop the running macro
+#   broker -> client   FRAME <upper>\t<lower>
+#                      STATUS <upper>\t<lower>  the link's own message, e.g. Connection Lost
+#                      KEY <n> <ACK|NACK|TIMEOUT|ERROR|REJECTED> [<id> <latency_ms|-> <waited_ms>]
+#                      MACRO <name> <DONE|ABORTED|CANCELLED> <summary>
+#                      ERR <message>
+# A client gets the latest frame as soon as it connects. Frames and
+# status messages go to every client; a KEY reply only to the client that pressed the key,
+# carrying the id it sent and the worker's timings.
+
+MAX_CLIENT_BUFFER = 64 * 1024  # Bytes queued for a client before we drop it
+
+
+def _key_reply(result, tag=None):
+    line = f"KEY {result.key} {result.status}"
+    if tag is not None:
+        latency = "-" if result.latency is None else f"{result.latency * 1000:.3f}"
+        line += f" {tag} {latency} {result.waited * 1000:.3f}"
+    return line + "\n"
+
+
+class _Client:
+    __slots__ = ("sock", "inbuf", "outbuf")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+
+class UARTBroker:
+    # Owns the port and the polling loop, and fans every display frame out
+    # to any number of local clients over a Unix socket. Clients come and
+    # go (a GUI restart, a CLI, a test script) without the link or the
+    # polling ever stopping.
+    def __init__(self, transport, socket_path, poller=None, pipeline_depth=1, macros=None,
+                 reopen=None, device_path=None, display_mode=DISPLAY_AUTO,
+                 key_repeat=KEY_REPEAT_QUEUE, response_timeout=RESPONSE_TIMEOUT):
+        self.socket_path = socket_path
+        self.poller = poller or AdaptivePoller()
+        self.macros = macros or {}
+        self.macro_runner = None
+        self.worker = SerialWorker(
+            transport,
+            on_display=self._on_display,
+            on_status=self._on_status,
+            on_key_response=self._on_key_response,
+            pipeline_depth=pipeline_depth,
+            reopen=reopen,
+            device_path=device_path,
+            display_mode=display_mode,
+            key_repeat=key_repeat,
+            response_timeout=response_timeout
+        )
+        self.last_frame = None
+        self.clients = {}
+        self._events = queue.SimpleQueue()  # From the worker thread
+        self._running = True
+
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socket_path)
+        self.server.listen(8)
+        self.server.setblocking(False)
+        self._selector.register(self.server, selectors.EVENT_READ)
+
+    # Worker thread side
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _on_display(self, upper_line, lower_line):
+        self._events.put(("FRAME", upper_line, lower_line))
+        self._wake()
+
+    def _on_status(self, upper_line, lower_line):
+        self._events.put(("STATUS", upper_line, lower_line))
+        self._wake()
+
+    def _on_key_response(self, key_number, status):
+        self._events.put(("KEY", key_number, status))
+        self._wake()
+
+    def _on_key_done(self, client, tag, future):
+        if not future.cancelled():
+            self._events.put(("KEY_DONE", client, tag, future.result()))
+            self._wake()
+
+    def _on_macro_done(self, report):
+        self._events.put(("MACRO", report))
+        self._wake()
+
+    # Event loop side
+
+    def stop(self):
+        # May be called again from a signal handler after the loop is gone
+        if self._running:
+            self._running = False
+            self._wake()
+
+    def _broadcast(self, line):
+        data = line.encode()
+        for client in list(self.clients.values()):
+            self._send(client, data)
+
+    def _send(self, client, data):
+        if not client.outbuf:
+            try:
+                sent = client.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._drop(client)
+                return
+            data = data[sent:]
+            if not data:
+                return
+            self._selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        client.outbuf += data
+        if len(client.outbuf) > MAX_CLIENT_BUFFER:
+            log.warning("Dropping client that stopped reading")
+            self._drop(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(client)
+            return
+        del client.outbuf[:sent]
+        if not client.outbuf:
+            self._selector.modify(client.sock, selectors.EVENT_READ, client)
+
+    def _drop(self, client):
+        if client.sock in self.clients:
+            del self.clients[client.sock]
+            self._selector.unregister(client.sock)
+            client.sock.close()
+            log.info("Client disconnected (%d connected)", len(self.clients))
+
+    def _accept(self):
+        sock, _ = self.server.accept()
+        sock.setblocking(False)
+        client = _Client(sock)
+        self.clients[sock] = client
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        log.info("Client connected (%d connected)", len(self.clients))
+        if self.last_frame:
+            self._send(client, f"FRAME {self.last_frame[0]}\t{self.last_frame[1]}\n".encode())
+
+    def _read(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        client.inbuf += data
+        while b"\n" in client.inbuf:
+            line, _, rest = bytes(client.inbuf).partition(b"\n")
+            client.inbuf[:] = rest
+            self._command(client, line.decode(errors="replace").split())
+
+    def _command(self, client, parts):
+        try:
+            if 2 <= len(parts) <= 4 and parts[0].upper() == "KEY":
+                duration = parts[2] if len(parts) >= 3 else KEY_PRESS_DURATION
+                tag = parts[3] if len(parts) == 4 else None
+                future = self.worker.request_key(int(parts[1]), str(int(duration)))
+                future.add_done_callback(lambda f: self._on_key_done(client, tag, f))
+                return
+            if len(parts) == 2 and parts[0].upper() == "DISPLAY":
+                self.worker.request_display(int(parts[1]))
+                return
+        except ValueError:
+            pass
+        if len(parts) == 2 and parts[0].upper() == "MACRO":
+            self._run_macro(client, parts[1])
+            return
+        if len(parts) == 1 and parts[0].upper() == "CANCEL":
+            if self.macro_runner:
+                self.macro_runner.cancel()
+            return
+        self._send(client, f"ERR bad command: {' '.join(parts)}\n".encode())
+
+    def _run_macro(self, client, name):
+        # One macro at a time; its presses share the queue with everyone's
+        if name not in self.macros:
+            self._send(client, f"ERR no macro {name}\n".encode())
+        elif self.macro_runner:
+            self._send(client, f"ERR macro {self.macro_runner.macro.name} is running\n".encode())
+        else:
+            self.macro_runner = MacroRunner(self.worker, self.macros[name], on_done=self._on_macro_done)
+            self.macro_runner.start()
+
+    def _drain_events(self):
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if event[0] == "MACRO":
+                report = event[1]
+                self.macro_runner = None
+                self._broadcast(f"MACRO {report.macro.name} {report.summary()}\n")
+            elif event[0] == "KEY_DONE":
+                _, client, tag, result = event
+                if self.clients.get(client.sock) is client:
+                    self._send(client, _key_reply(result, tag).encode())
+            elif event[0] == "STATUS":
+                _, upper_line, lower_line = event
+                self._broadcast(f"STATUS {upper_line}\t{lower_line}\n")
+            elif event[0] == "FRAME":
+                _, upper_line, lower_line = event
+                self.last_frame = (upper_line, lower_line)
+                self.poller.on_frame(upper_line + lower_line)
+                self._broadcast(f"FRAME {upper_line}\t{lower_line}\n")
+            else:
+                _, key_number, status = event
+                if status not in (KEY_ERROR, KEY_REJECTED):  # Those never reached the VMC
+                    self.poller.on_key(self.worker.last_key_press_time)
+                    self._next_poll = time.monotonic() + self.poller.floor
+
+    def serve_forever(self):
+        self.worker.start()
+        self._next_poll = time.monotonic()
+        log.info("Broker listening on %s", self.socket_path)
+        try:
+            while self._running:
+                timeout = max(0.0, self._next_poll - time.monotonic())
+                for key, mask in self._selector.select(timeout):
+                    if key.fileobj is self.server:
+                        self._accept()
+                    elif key.fileobj == self._wake_r:
+                        self._drain_events()
+                    else:
+                        if mask & selectors.EVENT_WRITE:
+                            self._flush(key.data)
+                        if mask & selectors.EVENT_READ:
+                            self._read(key.data)
+                if time.monotonic() >= self._next_poll:
+                    self.worker.request_display(0)
+                    self.poller.push = self.worker.push_active
+                    self._next_poll = time.monotonic() + self.poller.next_interval()
+        finally:
+            if self.macro_runner:
+                self.macro_runner.cancel()
+            self.worker.stop()
+            for client in list(self.clients.values()):
+                self._drop(client)
+            self._selector.close()
+            self.server.close()
+            os.unlink(self.socket_path)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+
+
+class BrokerClient(threading.Thread):
+    # Client end of the broker socket with the same surface the frontends
+    # use on a SerialWorker (request_key, request_display, stop, metrics,
+    # last_key_press_time), so a GUI can sit on a broker instead of a port.
+    def __init__(self, socket_path, on_display=None, on_key_response=None, on_macro_done=None):
+        super().__init__(daemon=True)
+        self.on_display = on_display
+        self.on_status = None  # Called like on_display for the broker link's own messages
+        self.on_key_response = on_key_response
+        self.on_macro_done = on_macro_done  # Called with (name, summary) for broker-run macros
+        self.on_error = None  # Called with each ERR message
+        self.metrics = LinkMetrics()  # What this client has seen
+        self.last_key_press_time = 0
+        self._key_sent = {}  # request id -> future awaiting the broker's reply
+        self._ids = itertools.count(1)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self._lock = threading.Lock()
+
+    def _send(self, line):
+        with self._lock:
+            self.sock.sendall(line.encode())
+
+    def request_display(self, n):
+        # The broker polls on its own schedule and fans frames out to
+        # every client; asking again would only add traffic on the link
+        pass
+
+    def request_key(self, key_number, duration=KEY_PRESS_DURATION):
+        # Same contract as SerialWorker.request_key; repeats are left to the
+        # broker's worker
+        future = Future()
+        tag = str(next(self._ids))
+        self._key_sent[tag] = future
+        self.metrics.count("keys_sent")
+        try:
+            self._send(f"KEY {key_number} {duration} {tag}\n")
+        except OSError:
+            del self._key_sent[tag]
+            future.set_result(KeyResult(key_number, KEY_ERROR, None, 0.0))
+        return future
+
+    def run_macro(self, name):
+        # Runs on the broker; the outcome arrives through on_macro_done
+        self._send(f"MACRO {name}\n")
+
+    def cancel_macro(self):
+        self._send("CANCEL\n")
+
+    def stop(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _handle(self, line):
+        kind, _, rest = line.partition(" ")
+        if kind == "FRAME":
+            upper_line, _, lower_line = rest.partition("\t")
+            self.metrics.count("frames_decoded")
+            if self.on_display:
+                self.on_display(upper_line, lower_line)
+        elif kind == "STATUS":
+            upper_line, _, lower_line = rest.partition("\t")
+            callback = self.on_status or self.on_display
+            if callback:
+                callback(upper_line, lower_line)
+        elif kind == "KEY":
+            key, status, *timing = rest.split()
+            key_number = int(key)
+            self.last_key_press_time = time.monotonic()
+            if status not in KEY_STATUSES:
+                status = KEY_ERROR
+            future = self._key_sent.pop(timing[0], None) if len(timing) == 3 else None
+            if future:
+                latency = None if timing[1] == "-" else float(timing[1]) / 1000
+                if latency is not None:
+                    self.metrics.observe_rtt("KEY", latency)
+                future.set_result(KeyResult(key_number, status, latency, float(timing[2]) / 1000))
+            if status == KEY_TIMEOUT:
+                self.metrics.count("timeouts")
+            elif status == KEY_NACK:
+                self.metrics.count("nacks")
+            if self.on_key_response:
+                self.on_key_response(key_number, status)
+        elif kind == "MACRO":
+            name, _, summary = rest.partition(" ")
+            if self.on_macro_done:
+                self.on_macro_done(name, summary)
+        elif kind == "ERR":
+            log.warning("Broker: %s", rest)
+            if self.on_error:
+                self.on_error(rest)
+
+    def run(self):
+        buf = bytearray()
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except OSError:
+                break
+            if not data:
+                break
+            self.metrics.on_read(len(data))
+            buf += data
+            while b"\n" in buf:
+                line, _, rest = bytes(buf).partition(b"\n")
+                buf[:] = rest
+                self._handle(line.decode(errors="replace"))
+        log.warning("Lost connection to broker")
+        for future in list(self._key_sent.values()):
+            future.set_result(KeyResult(None, KEY_ERROR, None, 0.0))
+        self._key_sent.clear()
+        self.sock.close()
+
+
+def main():
+    config, argv = load_config(sys.argv[1:])
+    setup_logging(config["log_level"], config["log_file"])
+    command = argv[0] if argv else "serve"
+    socket_path = config["broker_socket"] or "/tmp/uart-broker.sock"
+
+    if command == "serve":
+        try:
+            transport = open_serial(config)
+        except (OSError, ValueError) as e:
+            log.error("Failed to initialize UART: %s", e)
+            shutdown_logging()
+            sys.exit(1)
+        macros = {}
+        if config["macro_file"]:
+            try:
+                macros = load_macros(config["macro_file"])
+            except (OSError, ValueError, configparser.Error) as e:
+                log.error("Failed to load macros: %s", e)
+        broker = UARTBroker(
+            transport, socket_path,
+            poller=AdaptivePoller(config["poll_floor"], config["poll_ceiling"],
+                                  keepalive=config["poll_keepalive"]),
+            macros=macros,
+            reopen=lambda: open_serial(config),
+            device_path=device_path(config["port"]),
+            display_mode=config["display_mode"],
+            key_repeat=config["key_repeat"],
+            response_timeout=config["timeout"]
+        )
+        exporter = None
+        if config["metrics_socket"] or config["metrics_file"]:
+            exporter = MetricsExporter(
+                broker.worker.metrics,
+                socket_path=config["metrics_socket"] or None,
+                file_path=config["metrics_file"] or None
+            )
+            exporter.start()
+        signal.signal(signal.SIGTERM, lambda *_: broker.stop())
+        try:
+            broker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if exporter:
+                exporter.stop()
+
+    elif command in ("watch", "key", "macro"):
+        try:
+            client = BrokerClient(socket_path)
+        except OSError as e:
+            log.error("No broker at %s: %s", socket_path, e)
+            shutdown_logging()
+            sys.exit(1)
+
+    if command == "watch":
+        # Print frames as the broker sends them
+        client.on_display = lambda upper, lower: print(f"{upper}|{lower}", flush=True)
+        client.start()
+        try:
+            client.join()
+        except KeyboardInterrupt:
+            client.stop()
+
+    elif command == "key" and len(argv) in (2, 3):
+        done = threading.Event()
+        client.on_key_response = lambda key, status: (print(status), done.set())
+        client.start()
+        client.request_key(int(argv[1]), argv[2] if len(argv) == 3 else KEY_PRESS_DURATION)
+        done.wait(5.0)
+        client.stop()
+
+    elif command == "macro" and len(argv) == 2:
+        done = threading.Event()
+        client.on_macro_done = lambda name, summary: (print(f"{name}: {summary}"), done.set())
+        client.on_error = lambda message: done.set()
+        client.start()
+        client.run_macro(argv[1])
+        try:
+            done.wait()
+        except KeyboardInterrupt:
+            client.cancel_macro()
+            done.wait(5.0)
+        client.stop()
+
+    elif command != "serve":
+        print("usage: uart_broker.py [serve | watch | key <n> [ms] | macro <name>]"
+              " [--port ...] [--broker-socket PATH]")
+        sys.exit(2)
+
+    shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+from uart_transport import Transport
+
+log = logging.getLogger("uart.capture")
+
+# File layout: MAGIC once, then records of RECORD header + payload.
+# Timestamps are time.monotonic_ns() on the capturing machine; each
+# session (one open of the port) starts with a SESSION record whose
+# payload is the wall-clock time.time_ns() at that moment, so monotonic
+# offsets can be mapped back to "14:02" when reading a field capture.
+MAGIC = b"UARTCAP1"
+RECORD = struct.Struct("<QcH")  # monotonic ns, kind, payload length
+READ = b"R"  # Bytes the engine read from the VMC
+WRITE = b"W"  # Bytes the engine wrote to the VMC
+SESSION = b"S"
+
+MAX_PAYLOAD = 0xFFFF  # Longer reads/writes are split over several records
+CAPTURE_BUFFER = 64 * 1024  # Bytes buffered before hitting the disk
+FLUSH_INTERVAL = 1.0  # Seconds; bounds what a crash can lose
+
+
+class CaptureTransport:
+    # Wraps an open transport (pyserial or ours) and appends every byte
+    # read and written to a capture file. Costs one struct.pack and a
+    # buffered write per non-empty read or write, so it can stay on.
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab", buffering=CAPTURE_BUFFER)
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        if new:
+            self._file.write(MAGIC)
+        self._record(SESSION, struct.pack("<Q", time.time_ns()))
+
+    # Settings the engine changes go straight to the real port
+    @property
+    def baudrate(self):
+        return self.inner.baudrate
+
+    @baudrate.setter
+    def baudrate(self, value):
+        self.inner.baudrate = value
+
+    @property
+    def timeout(self):
+        return self.inner.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.inner.timeout = value
+
+    @property
+    def write_timeout(self):
+        return self.inner.write_timeout
+
+    @write_timeout.setter
+    def write_timeout(self, value):
+        self.inner.write_timeout = value
+
+    def __getattr__(self, name):
+        # in_waiting, fileno, flush, reset_*_buffer, is_open...
+        return getattr(self.inner, name)
+
+    def _record(self, kind, data):
+        now = time.monotonic_ns()
+        with self._lock:
+            if self._file.closed:
+                return
+            for start in range(0, max(len(data), 1), MAX_PAYLOAD):
+                chunk = data[start:start + MAX_PAYLOAD]
+                self._file.write(RECORD.pack(now, kind, len(chunk)))
+                self._file.write(chunk)
+            if now / 1e9 - self._flushed_at >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = now / 1e9
+
+    def read(self, size=1):
+        data = self.inner.read(size)
+        if data:
+            self._record(READ, data)
+        return data
+
+    def read_until(self, expected=b'\r', size=None):
+        data = self.inner.read_until(expected, size)
+        if data:
+            self._record(READ, data)
+        return data
+
+    def write(self, data):
+        self._record(WRITE, bytes(data))
+        return self.inner.write(data)
+
+    def close(self):
+        try:
+            self.inner.close()
+        finally:
+            # Whatever the port does, the capture must not lose its tail
+            with self._lock:
+                if not self._file.closed:
+                    self._file.close()
+
+
+def read_capture(path):
+    # Yields (monotonic_ns, kind, payload) for every record in the file.
+    # A record cut short by a crash mid-write ends the capture quietly.
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a UART capture")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp, kind, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield timestamp, kind, payload
+
+
+class ReplayTransport(Transport):
+    # Plays the READ side of a capture back to the engine at the recorded
+    # pace, scaled by `speed` (2.0 is twice as fast, 0 is as fast as the
+    # engine reads). Whatever the engine writes is discarded, so the GUI,
+    # benchmark or decoder sees exactly the bytes the VMC sent in the field.
+    # Sessions are played back to back; `skip` drops the first seconds.
+    def __init__(self, path, speed=1.0, skip=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.speed = speed
+        self._chunks = deque()  # (offset seconds, bytearray) still to deliver
+        self._cond = threading.Condition()
+        self._finished = False
+
+        base = 0.0  # Where the current session starts on the replay clock
+        session_start = None
+        last = 0.0
+        for timestamp, kind, payload in read_capture(path):
+            if kind == SESSION or session_start is None:
+                base, session_start = last, timestamp
+            offset = base + (timestamp - session_start) / 1e9
+            last = offset
+            if kind == READ and offset >= skip:
+                self._chunks.append((offset - skip, bytearray(payload)))
+        self.duration = max(0.0, last - skip)
+        self._started_at = time.monotonic()
+        log.info("Replaying %s: %.1f s of traffic at %gx", path, self.duration, speed)
+
+    def _elapsed(self):
+        if not self.speed:
+            return float("inf")
+        return (time.monotonic() - self._started_at) * self.speed
+
+    def _due_in(self):
+        # Seconds of real time until the next chunk is due, None if none left
+        if not self._chunks:
+            return None
+        if not self.speed:
+            return 0.0
+        return max(0.0, (self._chunks[0][0] - self._elapsed()) / self.speed)
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            elapsed = self._elapsed()
+            return sum(len(data) for offset, data in self._chunks if offset <= elapsed)
+
+    def _recv(self, size, timeout):
+        with self._cond:
+            wait = self._due_in()
+            if wait is None:
+                if not self._finished:
+                    self._finished = True
+                    log.info("Replay of %s finished", self.path)
+                # The VMC goes quiet, like a frozen link would
+                self._cond.wait(timeout if timeout is not None else 1.0)
+                return b""
+            if timeout is not None and wait > timeout:
+                self._cond.wait(timeout)
+                return b""
+            if wait:
+                self._cond.wait(wait)
+            offset, data = self._chunks[0]
+            chunk = bytes(data[:size])
+            del data[:size]
+            if not data:
+                self._chunks.popleft()
+            return chunk
+
+    def _send(self, data):
+        pass
+
+    def reset_input_buffer(self):
+        pass  # Everything due is part of the recording
+
+    def close(self):
+        super().close()
+        with self._cond:
+            self._cond.notify_all()
+
+
+def dump(path, out=sys.stdout):
+    # One line per record: wall-clock time, direction and the bytes
+    wall_base = mono_base = None
+    for timestamp, kind, payload in read_capture(path):
+        if kind == SESSION:
+            wall_base, mono_base = struct.unpack("<Q", payload)[0], timestamp
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(wall_base / 1e9))
+            out.write(f"--- session {stamp}\n")
+            continue
+        wall = (wall_base + timestamp - mono_base) / 1e9
+        stamp = time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall * 1000) % 1000:03d}"
+        arrow = "<-" if kind == READ else "->"
+        out.write(f"{stamp} {arrow} {payload!r}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: uart_capture.py CAPTURE_FILE")
+        sys.exit(2)
+    dump(sys.argv[1])
@@ -0,0 +1,225 @@
+import argparse
+import configparser
+import logging
+import os
+import time
+
+from uart_capture import CaptureTransport
+from uart_poller import POLL_FLOOR, POLL_CEILING, POLL_KEEPALIVE
+from uart_transport import Transport, open_transport
+
+log = logging.getLogger("uart.config")
+
+# Link settings, overridden in order by the config file, the environment
+# and the command line
+DEFAULTS = {
+    "port": "/dev/serial0",  # Device path or transport URL, e.g. tcp://host:4001
+    "baudrate": 9600,
+    "timeout": 1.0,  # Seconds to wait for each VMC reply
+    "negotiate_baud": 0,  # Rate to step up to after opening; 0 disables
+    "poll_floor": POLL_FLOOR,  # Fastest DISPLAY poll interval, seconds
+    "poll_ceiling": POLL_CEILING,  # Slowest DISPLAY poll interval, seconds
+    "poll_keepalive": POLL_KEEPALIVE,  # DISPLAY poll interval while the VMC pushes, seconds
+    "display_mode": "auto",  # How display updates arrive: auto, poll or listen (VMC pushes)
+    "log_level": "INFO",
+    "log_file": "",  # Rotating log file; empty logs to stderr
+    "metrics_socket": "",  # Unix socket serving Prometheus text; empty disables
+    "metrics_file": "",  # Prometheus textfile-collector output; empty disables
+    "devices": "",  # name=url,... to drive several VMCs instead of `port`
+    "broker_socket": "",  # uart_broker.py socket; frontends use it instead of a port when set
+    "capture_file": "",  # Append all link traffic here for replay:// later; empty disables
+    "theme": "dark",  # Initial frontend theme, a key of uart_theme.THEMES
+    "key_repeat": "queue",  # Press of a key still in progress: queue, coalesce or reject
+    "macro_file": "",  # INI file of key macros (see uart_macro.py); empty disables
+}
+
+CONFIG_PATHS = ["/etc/uart.ini", os.path.expanduser("~/.config/uart.ini")]
+
+ENV_VARS = {
+    "port": "UART_PORT",
+    "baudrate": "UART_BAUD",
+    "timeout": "UART_TIMEOUT",
+    "negotiate_baud": "UART_NEGOTIATE_BAUD",
+    "poll_floor": "UART_POLL_FLOOR",
+    "poll_ceiling": "UART_POLL_CEILING",
+    "poll_keepalive": "UART_POLL_KEEPALIVE",
+    "display_mode": "UART_DISPLAY_MODE",
+    "log_level": "UART_LOG_LEVEL",
+    "log_file": "UART_LOG_FILE",
+    "metrics_socket": "UART_METRICS_SOCKET",
+    "metrics_file": "UART_METRICS_FILE",
+    "devices": "UART_DEVICES",
+    "broker_socket": "UART_BROKER_SOCKET",
+    "capture_file": "UART_CAPTURE_FILE",
+    "theme": "UART_THEME",
+    "key_repeat": "UART_KEY_REPEAT",
+    "macro_file": "UART_MACRO_FILE",
+}
+
+# Seconds to let both ends settle after changing rate
+BAUD_SWITCH_DELAY = 0.05
+
+
+# Settings limited to a fixed set of values
+CHOICES = {
+    "display_mode": ("auto", "poll", "listen"),
+    "key_repeat": ("queue", "coalesce", "reject"),
+}
+
+# Numeric settings that must be above zero; negotiate_baud may be 0 (off)
+POSITIVE = ("baudrate", "timeout", "poll_floor", "poll_ceiling", "poll_keepalive")
+
+
+def _coerce(key, value, source):
+    try:
+        return type(DEFAULTS[key])(value)
+    except ValueError:
+        raise ValueError(f"{key} {value!r} from {source}: expected {type(DEFAULTS[key]).__name__}")
+
+
+def validate_config(config, sources):
+    # Checks the merged config; sources maps each key to where its value
+    # came from ("default", an INI path, an env var or a CLI flag) so
+    # the error points at the file or variable to fix
+    def fail(key, problem):
+        raise ValueError(f"{key} {config[key]!r} from {sources.get(key, 'default')}: {problem}")
+
+    for key, choices in CHOICES.items():
+        if config[key] not in choices:
+            fail(key, f"expected one of {', '.join(choices)}")
+    for key in POSITIVE:
+        if config[key] <= 0:
+            fail(key, "must be above zero")
+    if config["negotiate_baud"] < 0:
+        fail("negotiate_baud", "must be 0 (off) or a baud rate")
+    if config["poll_ceiling"] < config["poll_floor"]:
+        fail("poll_ceiling", f"below poll_floor {config['poll_floor']}")
+
+
+def load_config(argv=None):
+    # Returns (config, remaining_args); anything we don't recognise is left
+    # for Qt/Tk to parse
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--config", default=os.environ.get("UART_CONFIG"),
+                        help="INI file with a [uart] section")
+    parser.add_argument("--port")
+    parser.add_argument("--baud", dest="baudrate", type=int)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--negotiate-baud", dest="negotiate_baud", type=int)
+    parser.add_argument("--poll-floor", dest="poll_floor", type=float)
+    parser.add_argument("--poll-ceiling", dest="poll_ceiling", type=float)
+    parser.add_argument("--poll-keepalive", dest="poll_keepalive", type=float)
+    parser.add_argument("--display-mode", dest="display_mode", choices=CHOICES["display_mode"])
+    parser.add_argument("--log-level", dest="log_level")
+    parser.add_argument("--log-file", dest="log_file")
+    parser.add_argument("--metrics-socket", dest="metrics_socket")
+    parser.add_argument("--metrics-file", dest="metrics_file")
+    parser.add_argument("--devices")
+    parser.add_argument("--broker-socket", dest="broker_socket")
+    parser.add_argument("--capture-file", dest="capture_file")
+    parser.add_argument("--theme")
+    parser.add_argument("--key-repeat", dest="key_repeat", choices=CHOICES["key_repeat"])
+    parser.add_argument("--macro-file", dest="macro_file")
+    args, remaining = parser.parse_known_args(argv)
+    flags = {action.dest: action.option_strings[0] for action in parser._actions}
+
+    config = dict(DEFAULTS)
+    sources = {}
+    try:
+        # One file at a time so a bad value can be traced to its file
+        for path in CONFIG_PATHS + ([args.config] if args.config else []):
+            ini = configparser.ConfigParser()
+            if not ini.read(path) or not ini.has_section("uart"):
+                continue
+            for key in DEFAULTS:
+                if ini.has_option("uart", key):
+                    sources[key] = path
+                    config[key] = _coerce(key, ini.get("uart", key), path)
+
+        for key, var in ENV_VARS.items():
+            if os.environ.get(var):
+                sources[key] = var
+                config[key] = _coerce(key, os.environ[var], var)
+
+        for key in DEFAULTS:
+            value = getattr(args, key)
+            if value is not None:
+                sources[key] = flags[key]
+                config[key] = value
+
+        validate_config(config, sources)
+    except ValueError as e:
+        # Exits like a bad command-line option would, minus the usage
+        # text, which says nothing about a bad INI or env value
+        parser.exit(2, f"{parser.prog}: error: {e}\n")
+
+    return config, remaining
+
+
+def open_serial(config):
+    ser = open_transport(config["port"], config["baudrate"], config["timeout"])
+    # Only a real serial port has a line rate we can change
+    if (config["negotiate_baud"] and config["negotiate_baud"] != ser.baudrate
+            and not isinstance(ser, Transport)):
+        negotiate_baud(ser, config["negotiate_baud"])
+    if config["capture_file"]:
+        # Wrapped after negotiation so the capture starts at the final rate
+        ser = CaptureTransport(ser, config["capture_file"])
+    return ser
+
+
+def device_config(config, name, url):
+    # Config for one device of a multi-device setup, so each link goes
+    # through open_serial() too. Every device gets its own capture file
+    # ("vmc.cap" -> "vmc-left.cap"), one file can only hold one link.
+    device = dict(config, port=url)
+    if config["capture_file"]:
+        root, ext = os.path.splitext(config["capture_file"])
+        device["capture_file"] = f"{root}-{name}{ext}"
+    return device
+
+
+def _probe(ser):
+    # True if the VMC answers a DISPLAY poll at the current rate
+    ser.reset_input_buffer()
+    ser.write(b"DISPLAY 0\r")
+    response = ser.read_until(b'\r')
+    return len(response) == 41 and response.endswith(b'\r')
+
+
+def _request_baud(ser, rate):
+    ser.reset_input_buffer()
+    ser.write(f"BAUD {rate}\r".encode())
+    ser.flush()
+    return ser.read_until(b'\r').strip() == b"ACK"
+
+
+def negotiate_baud(ser, rate):
+    # Ask the VMC to switch to `rate`. Firmware that supports this answers
+    # "BAUD n" with ACK at the old rate and then switches; older firmware
+    # NACKs or ignores it and we simply stay where we are. Returns the rate
+    # the link ends up on.
+    original = ser.baudrate
+    try:
+        if not _request_baud(ser, rate):
+            log.info("VMC declined %d baud, staying at %d", rate, original)
+            return original
+
+        time.sleep(BAUD_SWITCH_DELAY)
+        ser.baudrate = rate
+        if _probe(ser):
+            log.info("UART link negotiated up to %d baud", rate)
+            return rate
+
+        # The VMC accepted but we can't hear it; ask it back down at the
+        # new rate in case it did switch, then verify at the old one
+        log.warning("No response at %d baud, falling back to %d", rate, original)
+        _request_baud(ser, original)
+        time.sleep(BAUD_SWITCH_DELAY)
+        ser.baudrate = original
+        if not _probe(ser):
+            log.warning("VMC not responding after baud fallback")
+    except OSError as e:
+        log.warning("Baud negotiation failed: %s", e)
+        ser.baudrate = original
+    return ser.baudrate
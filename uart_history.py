@@ -0,0 +1,91 @@
+import time
+from array import array
+
+from uart_protocol import DISPLAY_WIDTH, LINE_WIDTH
+
+HISTORY_BUDGET = 256 * 1024  # Bytes of frame text and timestamps kept per device
+ENTRY_SIZE = DISPLAY_WIDTH + 8  # 40 chars + a float64 timestamp
+
+
+class DisplayHistory:
+    # The frames a VMC has shown, oldest evicted first once the budget is
+    # used up. A frame is stored only when it differs from the one before,
+    # so a static screen costs nothing, and every entry keeps the
+    # time.monotonic() it first appeared. Text lives in one preallocated
+    # bytearray and timestamps in one array('d'); nothing is allocated per
+    # frame. Entries are indexed oldest (0) to newest (len - 1).
+    def __init__(self, budget=HISTORY_BUDGET):
+        self.capacity = max(1, budget // ENTRY_SIZE)
+        self._text = bytearray(self.capacity * DISPLAY_WIDTH)
+        self._times = array("d", bytes(8 * self.capacity))
+        self._start = 0  # Slot of the oldest entry
+        self._count = 0
+        self._last = None  # Encoded newest frame
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _encode(upper_line, lower_line):
+        text = upper_line[:LINE_WIDTH].ljust(LINE_WIDTH) + lower_line[:LINE_WIDTH].ljust(LINE_WIDTH)
+        return text.encode("ascii", "replace")
+
+    def _slot(self, i):
+        return (self._start + i) % self.capacity
+
+    def changed(self, upper_line, lower_line):
+        return self._encode(upper_line, lower_line) != self._last
+
+    def drop_oldest(self):
+        if self._count:
+            self._start = self._slot(1)
+            self._count -= 1
+
+    def record(self, upper_line, lower_line, now=None):
+        # Returns True if the frame was new and got stored
+        data = self._encode(upper_line, lower_line)
+        if data == self._last:
+            return False
+        if self._count == self.capacity:
+            self.drop_oldest()
+        slot = self._slot(self._count)
+        self._text[slot * DISPLAY_WIDTH:(slot + 1) * DISPLAY_WIDTH] = data
+        self._times[slot] = time.monotonic() if now is None else now
+        self._count += 1
+        self._last = data
+        return True
+
+    def timestamp(self, i):
+        return self._times[self._slot(i)]
+
+    def frame_bytes(self, i):
+        # The stored 40 bytes of entry i, as a view into the buffer
+        slot = self._slot(i)
+        return memoryview(self._text)[slot * DISPLAY_WIDTH:(slot + 1) * DISPLAY_WIDTH]
+
+    def frame(self, i):
+        # (timestamp, upper_line, lower_line)
+        text = self.frame_bytes(i).tobytes().decode("ascii")
+        return self.timestamp(i), text[:LINE_WIDTH], text[LINE_WIDTH:]
+
+    def index_after(self, t):
+        # Index of the first entry stamped after t (len() if none)
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self.timestamp(mid) <= t:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def at(self, t):
+        # The frame on screen at monotonic time t, None if before the history
+        i = self.index_after(t) - 1
+        return self.frame(i) if i >= 0 else None
+
+    def between(self, t0, t1):
+        # Frames that appeared between monotonic t0 and t1, oldest first,
+        # led by the one already on screen at t0
+        first = max(self.index_after(t0) - 1, 0)
+        return [self.frame(i) for i in range(first, self.index_after(t1))]
@@ -0,0 +1,79 @@
+import logging
+import time
+
+log = logging.getLogger("uart.link")
+
+# Link states
+LINK_CONNECTED = "connected"
+LINK_DEGRADED = "degraded"  # Recent failures, still sending
+LINK_OPEN = "open"  # Circuit open: commands fail fast, nothing touches the port
+LINK_RECONNECTING = "reconnecting"  # Probing: the next command decides
+
+OPEN_AFTER = 3  # Consecutive failures that open the circuit
+PROBE_BACKOFF_MIN = 0.1  # Seconds before the first probe of an open circuit
+PROBE_BACKOFF_MAX = 5.0
+PROBE_BACKOFF_FACTOR = 2.0
+
+
+class CircuitBreaker:
+    # Connection state for one link. Successes and failures come from the
+    # worker as commands complete; once OPEN_AFTER failures in a row (or
+    # one lost port) open the circuit, the worker stops sending until
+    # probe_in() reaches zero, then lets one command through as a probe.
+    # Each failed probe doubles the wait, up to PROBE_BACKOFF_MAX.
+    def __init__(self, open_after=OPEN_AFTER, backoff_min=PROBE_BACKOFF_MIN,
+                 backoff_max=PROBE_BACKOFF_MAX, on_change=None):
+        self.open_after = open_after
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.on_change = on_change  # (old_state, new_state)
+        self.state = LINK_CONNECTED
+        self.failures = 0
+        self.backoff = backoff_min
+        self.next_probe = 0.0
+
+    def _set(self, state):
+        if state != self.state:
+            old, self.state = self.state, state
+            if self.on_change:
+                self.on_change(old, state)
+
+    @property
+    def is_open(self):
+        return self.state == LINK_OPEN
+
+    def record_success(self):
+        self.failures = 0
+        self.backoff = self.backoff_min
+        self._set(LINK_CONNECTED)
+
+    def record_failure(self, fatal=False):
+        # fatal: the port itself failed, no point retrying before a probe
+        self.failures += 1
+        if self.state == LINK_RECONNECTING:
+            self.backoff = min(self.backoff * PROBE_BACKOFF_FACTOR, self.backoff_max)
+            self._trip()
+        elif self.state == LINK_OPEN:
+            pass
+        elif fatal or self.failures >= self.open_after:
+            self._trip()
+        else:
+            self._set(LINK_DEGRADED)
+
+    def _trip(self):
+        self.next_probe = time.monotonic() + self.backoff
+        self._set(LINK_OPEN)
+
+    def probe_in(self, now=None):
+        # Seconds until a probe is due; None unless the circuit is open
+        if self.state != LINK_OPEN:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.next_probe - now)
+
+    def begin_probe(self, reset=False):
+        # reset: something changed (the device came back), so the next
+        # failure starts the backoff over
+        if reset:
+            self.backoff = self.backoff_min
+        self._set(LINK_RECONNECTING)
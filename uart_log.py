@@ -0,0 +1,109 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+QUEUE_SIZE = 1000  # Records held for the writer thread before we start dropping
+MAX_BYTES = 1024 * 1024  # Rotate the log file at this size
+BACKUP_COUNT = 3
+RATE_LIMIT_INTERVAL = 30.0  # Seconds between repeats of the same warning
+RATE_LIMIT_TRACKED = 1024  # Distinct messages remembered before stale ones are forgotten
+
+_listener = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to the writer thread without ever blocking the caller.
+    # Unlike the stock QueueHandler it doesn't format in prepare(), so the
+    # message is only built on the writer thread; our log arguments are
+    # plain strings and numbers, so handing them across as-is is safe.
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets the first of a run of identical warnings through, then at most
+    # one per interval, noting how many were swallowed in between. Records
+    # are compared by their formatted message, so events that only share
+    # a template ("Link %s -> %s") are never mistaken for repeats.
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self._seen = {}  # (logger, message) -> [last_emitted, suppressed]
+        self._lock = threading.Lock()
+
+    def _forget_stale(self, now):
+        for key in [key for key, entry in self._seen.items() if now - entry[0] >= self.interval]:
+            del self._seen[key]
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        message = record.getMessage()
+        key = (record.name, message)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None:
+                if len(self._seen) >= RATE_LIMIT_TRACKED:
+                    self._forget_stale(now)
+                self._seen[key] = [now, 0]
+                return True
+            if now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed, entry[0], entry[1] = entry[1], now, 0
+        if suppressed:
+            record.msg, record.args = f"{message} ({suppressed} repeats suppressed)", None
+        return True
+
+
+def setup_logging(level="INFO", path=None, max_bytes=MAX_BYTES, backups=BACKUP_COUNT):
+    # Route everything under the "uart" logger through a bounded queue to a
+    # background writer: a rotating file if path is given, else stderr.
+    # Levels are checked before a record is even created, so filtered-out
+    # debug calls cost next to nothing.
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if path:
+        target = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    handler.addFilter(RateLimitFilter())
+
+    logger = logging.getLogger("uart")
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, target)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    # Flush whatever is still queued; call on the way out
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,206 @@
+import configparser
+import logging
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from uart_worker import KeyResult, KEY_PRESS_DURATION, KEY_ACK, KEY_TIMEOUT
+
+log = logging.getLogger("uart.macro")
+
+# Macro files are INI with one [macros] section, one macro per option:
+#
+#   [macros]
+#   vend_test = KEY 3 500, WAIT 500, KEY 1 x3
+#   coin = KEY 2 200
+#
+# Steps are separated by commas or newlines:
+#   KEY <n> [ms] [x<count>]   press key n for ms (default KEY_PRESS_DURATION),
+#                             count times back to back
+#   WAIT <ms>                 pause before the next step
+# Each press starts when the previous press's closure plus any wait has
+# elapsed, measured from the start of the macro.
+
+# key is None for a wait with no press before it. duration and delay are
+# ms: how long the key is closed, then how long to wait before the next step.
+MacroStep = namedtuple("MacroStep", "key duration delay")
+Macro = namedtuple("Macro", "name steps")
+
+# How one press went: requested and actual are seconds from the start of
+# the macro to the command going on the wire
+StepTiming = namedtuple("StepTiming", "key requested actual status latency")
+
+MACRO_DONE = "DONE"
+MACRO_ABORTED = "ABORTED"  # A press came back anything but ACK
+MACRO_CANCELLED = "CANCELLED"
+
+SPIN_WINDOW = 0.002  # Seconds before a step spent polling the clock instead of sleeping
+REPLY_GUARD = 5.0  # Seconds to wait on a press whose worker never settles it
+
+
+def parse_steps(text):
+    steps = []
+    for item in text.replace("\n", ",").split(","):
+        parts = item.split()
+        if not parts:
+            continue
+        name, args = parts[0].upper(), parts[1:]
+        if name == "WAIT" and len(args) == 1:
+            delay = int(args[0])
+            if delay < 0:
+                raise ValueError(f"negative wait: {item.strip()}")
+            if steps:
+                steps[-1] = steps[-1]._replace(delay=steps[-1].delay + delay)
+            else:
+                steps.append(MacroStep(None, 0, delay))
+            continue
+        if name == "KEY" and 1 <= len(args) <= 3:
+            count = 1
+            if args[-1].lower().startswith("x"):
+                count = int(args.pop()[1:])
+            if len(args) in (1, 2) and count > 0:
+                duration = int(args[1]) if len(args) == 2 else int(KEY_PRESS_DURATION)
+                if duration <= 0:
+                    raise ValueError(f"press duration must be positive: {item.strip()}")
+                steps.extend([MacroStep(int(args[0]), duration, 0)] * count)
+                continue
+        raise ValueError(f"bad step: {item.strip()}")
+    return steps
+
+
+def load_macros(path):
+    # Returns {name: Macro} in file order
+    ini = configparser.ConfigParser()
+    ini.optionxform = str  # Macro names keep their case
+    with open(path) as f:
+        ini.read_file(f)
+    macros = {}
+    if ini.has_section("macros"):
+        for name, text in ini.items("macros"):
+            try:
+                macros[name] = Macro(name, parse_steps(text))
+            except ValueError as e:
+                raise ValueError(f"{path}: macro {name}: {e}") from None
+    return macros
+
+
+class MacroReport:
+    def __init__(self, macro):
+        self.macro = macro
+        self.status = None
+        self.steps = []  # StepTiming per press sent
+        self.started_at = None
+        self.duration = 0.0
+
+    @property
+    def presses(self):
+        return sum(1 for step in self.macro.steps if step.key is not None)
+
+    def errors(self):
+        # Achieved minus requested start of each press, in seconds
+        return [step.actual - step.requested for step in self.steps]
+
+    def summary(self):
+        errors = self.errors()
+        text = f"{self.status} {len(self.steps)}/{self.presses} presses in {self.duration:.3f} s"
+        if errors:
+            text += (f", start error mean {sum(errors) / len(errors) * 1000:.1f} ms"
+                     f" max {max(errors, key=abs) * 1000:.1f} ms")
+        return text
+
+    def summary_text(self):
+        lines = [f"Macro {self.macro.name}: {self.summary()}",
+                 " key  requested     actual   error  status   latency"]
+        for step in self.steps:
+            latency = f"{step.latency * 1000:.1f} ms" if step.latency is not None else "-"
+            lines.append(
+                f"{step.key:>4} {step.requested * 1000:>8.1f} ms {step.actual * 1000:>8.1f} ms"
+                f" {(step.actual - step.requested) * 1000:>+6.1f}  {step.status:<8} {latency}"
+            )
+        return "\n".join(lines)
+
+
+class MacroRunner(threading.Thread):
+    # Plays a macro through anything with request_key() returning a key
+    # future (SerialWorker, BrokerClient). Every press is scheduled at a
+    # fixed offset from the macro's start on the monotonic clock, so a
+    # late reply or a slow queue delays that press only, not the rest of
+    # the sequence. Stops at the first press that isn't ACKed.
+    def __init__(self, worker, macro, on_done=None):
+        super().__init__(daemon=True)
+        self.worker = worker
+        self.macro = macro
+        self.on_done = on_done
+        self.report = MacroReport(macro)
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _sleep_until(self, deadline):
+        # Sleep most of the way, then poll the clock for the last moments,
+        # which Event.wait overshoots by a scheduler tick. False if cancelled.
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return not self._cancel.is_set()
+            if remaining > SPIN_WINDOW:
+                if self._cancel.wait(remaining - SPIN_WINDOW):
+                    return False
+            elif self._cancel.is_set():
+                return False
+
+    def _press(self, step):
+        future = self.worker.request_key(step.key, str(step.duration))
+        try:
+            return future.result(REPLY_GUARD)
+        except FutureTimeout:
+            return KeyResult(step.key, KEY_TIMEOUT, None, 0.0)
+
+    def run(self):
+        report = self.report
+        report.started_at = start = time.monotonic()
+        report.status = MACRO_DONE
+        log.info("Running macro %s (%d steps)", self.macro.name, len(self.macro.steps))
+        offset = 0.0
+        for step in self.macro.steps:
+            if step.key is not None:
+                if not self._sleep_until(start + offset):
+                    report.status = MACRO_CANCELLED
+                    break
+                requested_at = time.monotonic()
+                result = self._press(step)
+                # The worker may hold the press in its queue behind a poll
+                actual = requested_at + result.waited - start
+                report.steps.append(StepTiming(step.key, offset, actual, result.status, result.latency))
+                if result.status != KEY_ACK:
+                    log.warning("Macro %s aborted: key %d %s", self.macro.name, step.key, result.status)
+                    report.status = MACRO_ABORTED
+                    break
+            offset += (step.duration + step.delay) / 1000
+        report.duration = time.monotonic() - start
+        log.info("Macro %s: %s", self.macro.name, report.summary())
+        if self.on_done:
+            self.on_done(report)
+
+
+if __name__ == "__main__":
+    # Check a macro file and show what each macro will do
+    if len(sys.argv) != 2:
+        print("usage: uart_macro.py MACRO_FILE")
+        sys.exit(2)
+    try:
+        macros = load_macros(sys.argv[1])
+    except (OSError, ValueError, configparser.Error) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    for macro in macros.values():
+        total = sum(step.duration + step.delay for step in macro.steps)
+        steps = ", ".join(
+            (f"KEY {step.key} {step.duration}" if step.key is not None else "")
+            + (f" WAIT {step.delay}" if step.delay else "")
+            for step in macro.steps
+        )
+        print(f"{macro.name}: {total} ms: {steps.strip()}")
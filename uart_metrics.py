@@ -0,0 +1,247 @@
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("uart.metrics")
+
+# Round-trip histogram bucket upper bounds, milliseconds
+RTT_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+RATE_WINDOW = 10.0  # Seconds of traffic averaged for the byte rates
+EXPORT_INTERVAL = 5.0  # Seconds between Prometheus text file rewrites
+
+COUNTERS = (
+    "polls_sent", "keys_sent", "frames_decoded", "timeouts", "nacks", "resyncs",
+    "skipped", "circuit_opens", "reconnects", "pushes", "push_misses"
+)
+
+
+class Histogram:
+    def __init__(self, bounds=RTT_BUCKETS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th sample
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class LinkMetrics:
+    # Counters, round-trip histograms and byte rates for one UART link.
+    # Updated from the serial worker, read from the GUI and exporters.
+    def __init__(self, baudrate=9600):
+        self.baudrate = baudrate
+        self.started_at = time.monotonic()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.rtt = {"DISPLAY": Histogram(), "KEY": Histogram()}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.link_state = "connected"  # Set by the worker's circuit breaker
+        self.push_active = False  # Set by the worker while the VMC pushes its display
+        self._traffic = deque()  # (time, bytes_in, bytes_out) samples
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe_rtt(self, name, seconds):
+        with self._lock:
+            self.rtt[name].observe(seconds * 1000)
+
+    def on_read(self, n):
+        with self._lock:
+            self.bytes_in += n
+            self._sample()
+
+    def on_write(self, n):
+        with self._lock:
+            self.bytes_out += n
+            self._sample()
+
+    def _sample(self):
+        now = time.monotonic()
+        self._traffic.append((now, self.bytes_in, self.bytes_out))
+        while self._traffic and now - self._traffic[0][0] > RATE_WINDOW:
+            self._traffic.popleft()
+
+    def _rates(self):
+        # Bytes per second in/out over the rate window
+        if len(self._traffic) < 2:
+            return 0.0, 0.0
+        t0, in0, out0 = self._traffic[0]
+        span = max(time.monotonic() - t0, 1e-3)
+        return (self.bytes_in - in0) / span, (self.bytes_out - out0) / span
+
+    def snapshot(self):
+        with self._lock:
+            rate_in, rate_out = self._rates()
+            capacity = self.baudrate / 10.0  # 8N1: 10 bits per byte
+            return {
+                "uptime_s": time.monotonic() - self.started_at,
+                "baudrate": self.baudrate,
+                "link_state": self.link_state,
+                "link_up": int(self.link_state in ("connected", "degraded")),
+                "push_active": int(self.push_active),
+                **self.counters,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "rx_bytes_per_s": rate_in,
+                "tx_bytes_per_s": rate_out,
+                "rx_utilization": rate_in / capacity,
+                "tx_utilization": rate_out / capacity,
+                "display_rtt_p50_ms": self.rtt["DISPLAY"].quantile(0.5),
+                "display_rtt_p99_ms": self.rtt["DISPLAY"].quantile(0.99),
+                "key_rtt_p50_ms": self.rtt["KEY"].quantile(0.5),
+                "key_rtt_p99_ms": self.rtt["KEY"].quantile(0.99),
+            }
+
+    def prometheus_families(self, labels=""):
+        # {metric family: (type, [sample lines])}; labels like 'device="a"'
+        snap = self.snapshot()
+        tag = "{" + labels + "}" if labels else ""
+        families = {}
+        for name in COUNTERS + ("bytes_in", "bytes_out"):
+            families[f"uart_{name}_total"] = ("counter", [f"uart_{name}_total{tag} {snap[name]}"])
+        for name in ("rx_utilization", "tx_utilization", "baudrate", "link_up", "push_active"):
+            families[f"uart_{name}"] = ("gauge", [f"uart_{name}{tag} {snap[name]}"])
+        with self._lock:
+            for command, hist in self.rtt.items():
+                metric = f"uart_{command.lower()}_rtt_ms"
+                extra = (labels + "," if labels else "")
+                lines = []
+                cumulative = 0
+                for bound, n in zip(hist.bounds + ("+Inf",), hist.buckets):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{{extra}le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{tag} {hist.total}")
+                lines.append(f"{metric}_count{tag} {hist.count}")
+                families[metric] = ("histogram", lines)
+        return families
+
+    def prometheus_text(self, labels=""):
+        return render_prometheus([self.prometheus_families(labels)])
+
+    def summary_text(self):
+        # Short human-readable block for the diagnostics panel
+        snap = self.snapshot()
+
+        def ms(value):
+            # Histogram quantiles are bucket upper bounds
+            return "-" if value is None else f"<={value:g} ms"
+
+        return (
+            f"Polls {snap['polls_sent']}  Keys {snap['keys_sent']}  Frames {snap['frames_decoded']}\n"
+            f"Timeouts {snap['timeouts']}  NACKs {snap['nacks']}  Resyncs {snap['resyncs']}\n"
+            f"Link {snap['link_state']}  Opens {snap['circuit_opens']}  "
+            f"Reconnects {snap['reconnects']}  Skipped {snap['skipped']}\n"
+            f"Display {'push' if snap['push_active'] else 'poll'}  Pushes {snap['pushes']}  "
+            f"Missed {snap['push_misses']}\n"
+            f"DISPLAY RTT p50 {ms(snap['display_rtt_p50_ms'])}  p99 {ms(snap['display_rtt_p99_ms'])}\n"
+            f"KEY RTT p50 {ms(snap['key_rtt_p50_ms'])}  p99 {ms(snap['key_rtt_p99_ms'])}\n"
+            f"RX {snap['rx_bytes_per_s']:.0f} B/s ({snap['rx_utilization']:.0%})  "
+            f"TX {snap['tx_bytes_per_s']:.0f} B/s ({snap['tx_utilization']:.0%}) "
+            f"of {snap['baudrate']} baud"
+        )
+
+
+def render_prometheus(family_sets):
+    # Merge families from several links so each metric's samples stay
+    # together under a single TYPE line, as the text format requires
+    merged = {}
+    for families in family_sets:
+        for metric, (kind, lines) in families.items():
+            merged.setdefault(metric, (kind, []))[1].extend(lines)
+    out = []
+    for metric, (kind, lines) in merged.items():
+        out.append(f"# TYPE {metric} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def prometheus_text(metrics):
+    # metrics is one LinkMetrics, or {device name: LinkMetrics}
+    if isinstance(metrics, dict):
+        return render_prometheus(
+            m.prometheus_families(f'device="{name}"') for name, m in metrics.items()
+        )
+    return metrics.prometheus_text()
+
+
+class MetricsExporter(threading.Thread):
+    # Publishes metrics in Prometheus text format. With socket_path, any
+    # client connecting to the Unix socket gets the current text and the
+    # connection is closed (e.g. `socat - UNIX-CONNECT:path`). With
+    # file_path, the text is rewritten atomically every EXPORT_INTERVAL
+    # seconds for node_exporter's textfile collector. `metrics` may be a
+    # dict of per-device LinkMetrics, exported with a device label.
+    def __init__(self, metrics, socket_path=None, file_path=None, interval=EXPORT_INTERVAL):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.socket_path = socket_path
+        self.file_path = file_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._server = None
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(socket_path)
+            self._server.listen(4)
+            self._server.settimeout(interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.close()
+            os.unlink(self.socket_path)
+
+    def write_file(self):
+        tmp = self.file_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus_text(self.metrics))
+        os.replace(tmp, self.file_path)
+
+    def run(self):
+        next_write = 0.0
+        while not self._stop_event.is_set():
+            if self.file_path and time.monotonic() >= next_write:
+                try:
+                    self.write_file()
+                except OSError as e:
+                    log.warning("Failed to write metrics file: %s", e)
+                next_write = time.monotonic() + self.interval
+            if self._server is None:
+                self._stop_event.wait(self.interval)
+                continue
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with conn:
+                try:
+                    conn.sendall(prometheus_text(self.metrics).encode())
+                except OSError as e:
+                    log.debug("Metrics client went away: %s", e)
@@ -0,0 +1,157 @@
+import logging
+import os
+import selectors
+import threading
+
+from uart_config import open_serial, device_config
+from uart_transport import device_path
+from uart_worker import SerialWorker, KEY_REPEAT_QUEUE, DISPLAY_AUTO, RESPONSE_TIMEOUT
+
+log = logging.getLogger("uart.multi")
+
+DEVICE_PIPELINE_DEPTH = 2  # Lets a key go out while a poll is still owed
+SELECT_TIMEOUT = 0.02  # Seconds; bounds how late an expired command is noticed
+
+
+def parse_devices(spec):
+    # "left=/dev/ttyAMA0,right=tcp://10.0.0.5:4001" -> [(name, url), ...]
+    devices = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, url = item.partition("=")
+        if not sep or not name or not url:
+            raise ValueError(f"Bad device spec {item!r}, expected name=url")
+        devices.append((name, url))
+    return devices
+
+
+class MultiDeviceEngine(threading.Thread):
+    # Drives several VMC links from one thread. Each device keeps its own
+    # SerialWorker for state (scheduler, decoder, in-flight table, error
+    # counter, metrics), but the worker threads are never started: this
+    # loop waits on every port at once with a selector and steps each
+    # worker's pipeline as its port becomes readable.
+    def __init__(self, on_display=None, on_key_response=None, on_latency=None,
+                 key_repeat=KEY_REPEAT_QUEUE, display_mode=DISPLAY_AUTO, on_status=None,
+                 response_timeout=RESPONSE_TIMEOUT):
+        super().__init__(daemon=True)
+        self.on_display = on_display  # (device, upper, lower)
+        self.on_status = on_status  # (device, upper, lower) for the worker's own messages
+        self.on_key_response = on_key_response  # (device, key, response)
+        self.on_latency = on_latency  # (device, command, seconds)
+        self.key_repeat = key_repeat
+        self.display_mode = display_mode
+        self.response_timeout = response_timeout
+        self.workers = {}
+        self._down = set()  # Devices whose port failed
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._running = True
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # Already a wakeup pending
+
+    def _callback(self, callback, name):
+        if callback is None:
+            return None
+        return lambda *args: callback(name, *args)
+
+    def add_device(self, name, transport, pipeline_depth=DEVICE_PIPELINE_DEPTH,
+                   reopen=None, device_path=None):
+        # transport must have a real file descriptor (serial, pty, tcp);
+        # reopen/device_path as for SerialWorker
+        transport.timeout = 0
+        worker = SerialWorker(
+            transport,
+            on_display=self._callback(self.on_display, name),
+            on_status=self._callback(self.on_status, name),
+            on_key_response=self._callback(self.on_key_response, name),
+            on_latency=self._callback(self.on_latency, name),
+            pipeline_depth=pipeline_depth,
+            wakeup=self._wake,
+            key_repeat=self.key_repeat,
+            display_mode=self.display_mode,
+            response_timeout=self.response_timeout,
+            reopen=reopen,
+            device_path=device_path
+        )
+        self.workers[name] = worker
+        self._selector.register(transport.fileno(), selectors.EVENT_READ, worker)
+        self._wake()
+        return worker
+
+    def open_devices(self, devices, config):
+        # Through open_serial() so baud negotiation and capture apply per device
+        for name, url in devices:
+            self.add_device(
+                name, open_serial(device_config(config, name, url)),
+                reopen=lambda name=name, url=url: open_serial(device_config(config, name, url)),
+                device_path=device_path(url)
+            )
+            log.info("Device %s on %s", name, url)
+
+    def stop(self):
+        self._running = False
+        self._wake()
+
+    def _port_failed(self, name, worker, error):
+        # Port gone (unplugged, peer closed); stop selecting on it until
+        # the worker reopens it
+        log.error("Device %s failed: %s", name, error)
+        self._selector.unregister(worker.ser.fileno())
+        self._down.add(name)
+        worker.port_failed(error)
+
+    def run(self):
+        while self._running:
+            for name, worker in list(self.workers.items()):
+                if worker.check_link() and name in self._down and not worker.port_lost:
+                    # Reopened; pick the new port up where the old one was
+                    self._selector.register(worker.ser.fileno(), selectors.EVENT_READ, worker)
+                    self._down.discard(name)
+                    log.info("Device %s reconnected", name)
+                if name in self._down:
+                    if worker.breaker.is_open:
+                        worker.fill_pipeline()  # Fails what was asked of it meanwhile
+                    continue
+                try:
+                    worker.fill_pipeline()
+                except OSError as e:
+                    self._port_failed(name, worker, e)
+                except Exception as e:
+                    worker.fail_in_flight(e)
+
+            ready = {key.data for key, _ in self._selector.select(SELECT_TIMEOUT)}
+            if None in ready:
+                try:
+                    while os.read(self._wake_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+
+            for name, worker in list(self.workers.items()):
+                if name in self._down:
+                    continue
+                try:
+                    data = worker.ser.read(worker.ser.in_waiting or 1) if worker in ready else b""
+                    # Called even without input so deadlines still expire
+                    worker.handle_input(data)
+                except OSError as e:
+                    self._port_failed(name, worker, e)
+                except Exception as e:
+                    worker.fail_in_flight(e)
+
+        for name, worker in self.workers.items():
+            worker.abandon_keys()
+            if name not in self._down:
+                self._selector.unregister(worker.ser.fileno())
+            if not worker.port_lost:
+                worker.ser.close()
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
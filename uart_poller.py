@@ -0,0 +1,63 @@
+import time
+
+# Seconds between polls at the fastest and slowest rate
+POLL_FLOOR = 0.1
+POLL_CEILING = 3.0
+POLL_KEEPALIVE = 10.0  # Seconds between polls while the VMC pushes its display
+CHANGE_FLOOR = 0.75  # Fastest polling for display changes no key press prompted
+
+BACKOFF_FACTOR = 1.5  # Interval growth per unchanged frame
+KEY_BOOST_WINDOW = 2.0  # Seconds to poll at the floor after a key press
+PUSH_CONFIRM_POLLS = 1  # Floor-rate polls after a key press while the VMC pushes
+
+
+class AdaptivePoller:
+    # Picks the delay before the next DISPLAY poll. Right after a key press
+    # it polls at the floor so the VMC's reaction shows up quickly; while
+    # the frame stays the same it backs off exponentially towards the
+    # ceiling. A change nobody prompted (a clock, an animation) speeds it
+    # up again by the same factor, but no faster than change_floor, so
+    # busy content settles near its own rate of change. With `push` set
+    # (the VMC sends its display unsolicited) polling drops to a
+    # keepalive; a key press then earns only confirm_polls polls at the
+    # floor, and none once a changed frame has arrived since the press.
+    def __init__(self, floor=POLL_FLOOR, ceiling=POLL_CEILING, initial=None,
+                 backoff=BACKOFF_FACTOR, key_boost=KEY_BOOST_WINDOW, keepalive=POLL_KEEPALIVE,
+                 confirm_polls=PUSH_CONFIRM_POLLS, change_floor=CHANGE_FLOOR):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.change_floor = min(max(change_floor, floor), self.ceiling)
+        self.backoff = backoff
+        self.key_boost = key_boost
+        self.keepalive = max(keepalive, self.ceiling)
+        self.push = False
+        self.confirm_polls = confirm_polls
+        self._boost_polls = 0  # Floor-rate polls handed out since the last key press
+        self.interval = min(max(initial or floor, floor), self.ceiling)
+        self.last_frame = None
+        self.last_key_press_time = None
+
+    def on_frame(self, frame):
+        if frame != self.last_frame:
+            self.last_frame = frame
+            self.interval = max(self.interval / self.backoff, self.change_floor)
+            if self.push:
+                self.last_key_press_time = None  # The press's reaction was pushed
+        else:
+            self.interval = min(self.interval * self.backoff, self.ceiling)
+
+    def on_key(self, pressed_at=None):
+        # pressed_at is a time.monotonic() timestamp
+        self.last_key_press_time = time.monotonic() if pressed_at is None else pressed_at
+        self.interval = self.floor
+        self._boost_polls = 0
+
+    def next_interval(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_key_press_time is not None and now - self.last_key_press_time < self.key_boost:
+            if not self.push:
+                return self.floor
+            if self._boost_polls < self.confirm_polls:
+                self._boost_polls += 1
+                return self.floor
+        return self.keepalive if self.push else self.interval
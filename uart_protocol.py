@@ -0,0 +1,180 @@
+from collections import deque, namedtuple
+
+FRAME_TERMINATOR = b'\r'
+DISPLAY_WIDTH = 40  # 2 lines of 20 characters
+LINE_WIDTH = 20
+
+# Frame kinds
+FRAME_DISPLAY = "DISPLAY"
+FRAME_ACK = "ACK"
+FRAME_NACK = "NACK"
+FRAME_JUNK = "JUNK"
+
+# Longest run without a terminator we keep before treating it as line noise
+MAX_PENDING = 256
+
+
+class Frame(namedtuple("Frame", "kind data")):
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return self.data.decode(errors="replace")
+
+    @property
+    def lines(self):
+        text = self.text
+        return text[:LINE_WIDTH], text[LINE_WIDTH:]
+
+
+def classify(line):
+    # Split one terminated line into frames. Anything in front of a
+    # recognisable frame (the tail of a reply we started reading halfway
+    # through, line noise) comes back as a JUNK frame so the caller can
+    # count it, and the real frame behind it is still recovered.
+    if len(line) == DISPLAY_WIDTH:
+        return [Frame(FRAME_DISPLAY, line)]
+    stripped = line.strip()
+    if not stripped:
+        return []  # Blank line, e.g. a stray CR
+    if stripped == b"ACK":
+        return [Frame(FRAME_ACK, stripped)]
+    if stripped == b"NACK":
+        return [Frame(FRAME_NACK, stripped)]
+    # An ACK/NACK glued to what precedes it: that reply lost its CR, and
+    # if it was a display frame it is the 40 bytes in front of the suffix.
+    # A display ending in "N" followed by ACK also ends in NACK, so a
+    # split leaving exactly one display frame wins.
+    tail = line.rstrip()
+    splits = [(tail[:-len(kind)], kind) for kind in (FRAME_NACK, FRAME_ACK)
+              if tail.endswith(kind.encode())]
+    if splits:
+        prefix, kind = next((split for split in splits if len(split[0]) == DISPLAY_WIDTH), splits[0])
+        return _split_prefix(prefix) + [Frame(kind, kind.encode())]
+    return _split_prefix(line)
+
+
+def _split_prefix(data):
+    # Frames in a run with no terminator of its own: a display frame at
+    # the end if there is room for one, anything before it as junk (or
+    # an ACK/NACK that lost its CR)
+    head, frames = data, []
+    if len(data) >= DISPLAY_WIDTH:
+        head, frames = data[:-DISPLAY_WIDTH], [Frame(FRAME_DISPLAY, data[-DISPLAY_WIDTH:])]
+    stripped = head.strip()
+    if stripped in (b"ACK", b"NACK"):
+        frames.insert(0, Frame(stripped.decode(), stripped))
+    elif stripped:
+        frames.insert(0, Frame(FRAME_JUNK, head))
+    return frames
+
+
+class FrameDecoder:
+    # Incremental decoder over a persistent receive buffer. Bytes are never
+    # thrown away to get back in sync: frames are cut on the CR terminator
+    # as they complete and a partial frame simply waits for the rest.
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0  # Offset of the first unconsumed byte
+        self.frames_decoded = 0
+        self.resyncs = 0
+
+    def __len__(self):
+        return len(self._buffer) - self._start
+
+    def clear(self):
+        del self._buffer[:]
+        self._start = 0
+
+    def feed(self, data):
+        # Append received bytes and return every frame they complete
+        self._buffer += data
+        frames = []
+        view = memoryview(self._buffer)
+        try:
+            while True:
+                end = self._buffer.find(FRAME_TERMINATOR, self._start)
+                if end < 0:
+                    break
+                frames.extend(classify(bytes(view[self._start:end])))
+                self._start = end + 1
+        finally:
+            view.release()
+
+        if len(self) > MAX_PENDING:
+            # No terminator in sight; keep the last display's worth and resync
+            keep = len(self._buffer) - DISPLAY_WIDTH
+            frames.append(Frame(FRAME_JUNK, bytes(self._buffer[self._start:keep])))
+            self._start = keep
+
+        # Compact once the consumed prefix dominates the buffer
+        if self._start and self._start * 2 >= len(self._buffer):
+            del self._buffer[:self._start]
+            self._start = 0
+
+        for frame in frames:
+            if frame.kind == FRAME_JUNK:
+                self.resyncs += 1
+            else:
+                self.frames_decoded += 1
+        return frames
+
+
+# Reply kinds that can answer each command
+EXPECTED_REPLIES = {
+    "DISPLAY": (FRAME_DISPLAY, FRAME_NACK),
+    "KEY": (FRAME_ACK, FRAME_NACK),
+}
+
+
+class InFlight:
+    __slots__ = ("command", "sent_at", "deadline")
+
+    def __init__(self, command, sent_at, deadline):
+        self.command = command  # e.g. ("DISPLAY", 0) or ("KEY", 3, "1000")
+        self.sent_at = sent_at
+        self.deadline = deadline
+
+    def accepts(self, frame):
+        return frame.kind in EXPECTED_REPLIES[self.command[0]]
+
+
+class InFlightTable:
+    # Commands written but not yet answered, oldest first. The VMC answers
+    # in order and its replies carry no ids, so a frame belongs to the
+    # oldest command that could have produced it; anything older that
+    # can't take it lost its reply on the wire.
+    def __init__(self):
+        self._entries = deque()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, command, now, timeout):
+        entry = InFlight(command, now, now + timeout)
+        self._entries.append(entry)
+        return entry
+
+    def match(self, frame, in_order=False):
+        # Returns (entry, lost) where entry is None for an unsolicited frame.
+        # in_order: only the oldest command may take the frame.
+        lost = []
+        entries = list(self._entries)[:1] if in_order else self._entries
+        for i, entry in enumerate(entries):
+            if entry.accepts(frame):
+                for _ in range(i):
+                    lost.append(self._entries.popleft())
+                return self._entries.popleft(), lost
+        return None, lost
+
+    def expire(self, now):
+        # Remove and return entries whose deadline has passed
+        expired = []
+        while self._entries and self._entries[0].deadline <= now:
+            expired.append(self._entries.popleft())
+        return expired
+
+    def clear(self):
+        entries = list(self._entries)
+        self._entries.clear()
+        return entries
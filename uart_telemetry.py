@@ -0,0 +1,225 @@
+import glob
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+
+log = logging.getLogger("uart.telemetry")
+
+SAMPLE_INTERVAL = 1.0  # Seconds between samples
+HISTORY = 600  # Samples kept, 10 minutes at the default interval
+LAG_WARNING = 0.25  # Seconds of event-loop lag worth a log line
+
+NAN = float("nan")
+THERMAL_ZONES = "/sys/class/thermal/thermal_zone*"
+SOC_ZONE_TYPES = ("cpu-thermal", "soc-thermal", "cpu", "soc", "x86_pkg_temp")
+
+
+class TelemetryRing:
+    # Fixed-size history of samples, one preallocated array('d') per
+    # column, overwritten oldest first. Missing readings are NaN.
+    def __init__(self, columns, capacity=HISTORY):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self._data = {name: array("d", [NAN]) * capacity for name in ("time",) + self.columns}
+        self._next = 0  # Slot the next sample goes in
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        with self._lock:
+            i = self._next
+            self._data["time"][i] = timestamp
+            for name in self.columns:
+                self._data[name][i] = values.get(name, NAN)
+            self._next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _order(self, n=None):
+        # Slot indexes of the last n samples, oldest first
+        n = self.count if n is None else min(n, self.count)
+        start = (self._next - n) % self.capacity
+        return [(start + k) % self.capacity for k in range(n)]
+
+    def series(self, name, n=None):
+        with self._lock:
+            column = self._data[name]
+            return [column[i] for i in self._order(n)]
+
+    def latest(self):
+        # {column: value} for the newest sample, None if empty
+        with self._lock:
+            if not self.count:
+                return None
+            i = (self._next - 1) % self.capacity
+            return {name: column[i] for name, column in self._data.items()}
+
+    def window(self, t0, t1):
+        # [{column: value}] for samples taken between monotonic t0 and t1
+        with self._lock:
+            times = self._data["time"]
+            return [
+                {name: column[i] for name, column in self._data.items()}
+                for i in self._order() if t0 <= times[i] <= t1
+            ]
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _soc_zone():
+    # The thermal zone that tracks the SoC, or the first one there is
+    zones = sorted(glob.glob(THERMAL_ZONES))
+    for wanted in SOC_ZONE_TYPES:
+        for zone in zones:
+            try:
+                if _read(os.path.join(zone, "type")).strip() == wanted:
+                    return os.path.join(zone, "temp")
+            except OSError:
+                continue
+    return os.path.join(zones[0], "temp") if zones else None
+
+
+class TelemetrySampler(threading.Thread):
+    # Samples per-core CPU, this process's RSS, SoC temperature and event
+    # loop lag into a TelemetryRing from its own thread, so none of it
+    # runs on the GUI thread. Readings come from /proc and /sys (a few
+    # small reads per sample); psutil is used instead where /proc is
+    # missing, if it is installed.
+    #
+    # Loop lag: `post` must run a callable on the event loop being
+    # watched (for Qt, emitting a signal connected to a slot that calls
+    # it). Each sample posts a ping and the lag is how late it ran; a ping
+    # still pending at the next sample counts as lagging by at least that.
+    def __init__(self, post=None, on_sample=None, interval=SAMPLE_INTERVAL, capacity=HISTORY):
+        super().__init__(daemon=True)
+        self.post = post
+        self.on_sample = on_sample  # Called with the latest() dict, on this thread
+        self.interval = interval
+        self.cores = os.cpu_count() or 1
+        self.ring = TelemetryRing(
+            ["cpu"] + [f"cpu{n}" for n in range(self.cores)] + ["rss_mb", "soc_temp_c", "loop_lag_ms"],
+            capacity
+        )
+        self._temp_path = _soc_zone()
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._cpu_times = None
+        self._ping_sent = None
+        self._lag = NAN
+        self._halt = threading.Event()
+
+    def stop(self):
+        self._halt.set()
+
+    # Readings
+
+    def _cpu(self):
+        # {"cpu": total %, "cpuN": per core %} since the previous sample
+        try:
+            times = {}
+            for line in _read("/proc/stat").splitlines():
+                if not line.startswith("cpu"):
+                    break
+                name, *fields = line.split()
+                fields = [int(v) for v in fields]
+                idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+                times[name] = (sum(fields) - idle, sum(fields))
+        except OSError:
+            return self._cpu_psutil()
+        previous, self._cpu_times = self._cpu_times, times
+        if previous is None:
+            return {}
+        usage = {}
+        for name, (busy, total) in times.items():
+            if name in previous and total > previous[name][1]:
+                usage[name] = 100.0 * (busy - previous[name][0]) / (total - previous[name][1])
+        return usage
+
+    def _cpu_psutil(self):
+        try:
+            import psutil
+        except ImportError:
+            return {}
+        per_core = psutil.cpu_percent(percpu=True)
+        usage = {f"cpu{n}": value for n, value in enumerate(per_core)}
+        usage["cpu"] = sum(per_core) / len(per_core) if per_core else NAN
+        return usage
+
+    def _rss_mb(self):
+        try:
+            return int(_read("/proc/self/statm").split()[1]) * self._page_size / 2**20
+        except OSError:
+            try:
+                import psutil
+            except ImportError:
+                return NAN
+            return psutil.Process().memory_info().rss / 2**20
+
+    def _soc_temp(self):
+        if self._temp_path is None:
+            return NAN
+        try:
+            return int(_read(self._temp_path)) / 1000.0  # millidegrees
+        except (OSError, ValueError):
+            return NAN
+
+    def _pong(self, sent_at):
+        # Runs on the watched loop
+        self._lag = time.monotonic() - sent_at
+        self._ping_sent = None
+
+    def _loop_lag(self, now):
+        lag = self._lag
+        if self._ping_sent is not None:
+            lag = max(lag if not math.isnan(lag) else 0.0, now - self._ping_sent)
+        return lag
+
+    # Sampling
+
+    def sample(self):
+        now = time.monotonic()
+        values = self._cpu()
+        values["rss_mb"] = self._rss_mb()
+        values["soc_temp_c"] = self._soc_temp()
+        lag = self._loop_lag(now)
+        values["loop_lag_ms"] = lag * 1000
+        self.ring.append(now, values)
+
+        if lag >= LAG_WARNING:
+            log.warning(
+                "Event loop lagging %.0f ms (CPU %.0f%%, SoC %.1f C, RSS %.0f MB)",
+                lag * 1000, values.get("cpu", NAN), values["soc_temp_c"], values["rss_mb"]
+            )
+        if self.post and self._ping_sent is None:
+            self._ping_sent = now
+            self.post(lambda sent_at=now: self._pong(sent_at))
+        if self.on_sample:
+            self.on_sample(self.ring.latest())
+
+    def run(self):
+        next_at = time.monotonic()
+        delay = 0
+        while not self._halt.wait(delay):
+            try:
+                self.sample()
+            except Exception as e:
+                log.error("Telemetry sample failed: %s", e)
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at = time.monotonic()  # Fell behind; don't try to catch up
+                delay = 0
+
+    def summary_text(self):
+        latest = self.ring.latest()
+        if latest is None:
+            return "Telemetry: no samples yet"
+        cores = " ".join(f"{latest[f'cpu{n}']:.0f}" for n in range(self.cores))
+        return (
+            f"CPU {latest['cpu']:.0f}% (cores {cores})  RSS {latest['rss_mb']:.0f} MB\n"
+            f"SoC {latest['soc_temp_c']:.1f} C  Loop lag {latest['loop_lag_ms']:.0f} ms"
+        )
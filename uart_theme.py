@@ -0,0 +1,199 @@
+import logging
+from string import Template
+
+from PyQt5.QtWidgets import QWidget
+
+log = logging.getLogger("uart.theme")
+
+# Colour sets, in the order the theme button cycles through them. A new
+# theme is one more entry here; the page templates below pick it up.
+THEMES = {
+    "dark": {
+        "label": "Dark",
+        "page_from": "#1a1a1a",
+        "page_to": "#2d2d2d",
+        "frame_bg": "#1e1e1e",
+        "frame_border": "#3a3a3a",
+        "button_bg": "#2e2e2e",
+        "button_fg": "#ffffff",
+        "button_hover": "#3e3e3e",
+        "button_pressed": "#4a4a4a",
+        "button_shadow": "#50000000",  # #AARRGGBB
+        "button_glow": "#b4faaf40",
+        "key_pending": "#ffaa00",  # Key status dot, see ModernButton.set_status
+        "key_ack": "#00ff00",
+        "key_nack": "#ff3333",
+        "key_timeout": "#888888",
+        "text": "#ffffff",
+        "display_bg": "#1e1e1e",
+        "display_fg": "#00ff00",
+        "container_bg": "#1e1e1e",
+        "cpu_fg": "#ffaa00",
+        "menu_bg": "#1a1a1a",
+        "menu_button_bg": "#2e2e2e",
+        "menu_button_fg": "#ffffff",
+        "menu_button_hover": "#3e3e3e",
+        "menu_button_pressed": "#2e2e2e",
+    },
+    "light": {
+        "label": "Light",
+        "page_from": "#f0f0f0",
+        "page_to": "#e0e0e0",
+        "frame_bg": "#ffffff",
+        "frame_border": "#dddddd",
+        "button_bg": "#f8f8f8",
+        "button_fg": "#333333",
+        "button_hover": "#eeeeee",
+        "button_pressed": "#e0e0e0",
+        "button_shadow": "#50000000",
+        "button_glow": "#b4faaf40",
+        "key_pending": "#ff9900",
+        "key_ack": "#22aa22",
+        "key_nack": "#cc2222",
+        "key_timeout": "#999999",
+        "text": "#333333",
+        "display_bg": "#ffffff",
+        "display_fg": "#0066cc",
+        "container_bg": "#f5f5f5",
+        "cpu_fg": "#ff6600",
+        "menu_bg": "#f0f0f0",
+        "menu_button_bg": "#ffffff",
+        "menu_button_fg": "#333333",
+        "menu_button_hover": "#f5f5f5",
+        "menu_button_pressed": "#e8e8e8",
+    },
+}
+
+# Page stylesheets. $scope is the page under one theme, so every theme's
+# rules can live in the same sheet; ${button_font} comes from the
+# frontend, which knows its screen size (as does display_font, which the
+# LCD widget reads).
+MAIN_PAGE = Template("""
+    $scope, $scope QWidget {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
+            stop:0 $page_from, stop:1 $page_to);
+    }
+    $scope QFrame {
+        background-color: $frame_bg;
+        border: 2px solid $frame_border;
+        border-radius: 15px;
+        padding: 15px;
+    }
+    $scope QPushButton {
+        background-color: $button_bg;
+        color: $button_fg;
+        border: none;
+        border-radius: 15px;
+        padding: 15px;
+        font-size: ${button_font}px;
+        font-weight: bold;
+    }
+    $scope QPushButton:hover {
+        background-color: $button_hover;
+    }
+    $scope QPushButton:pressed {
+        background-color: $button_pressed;
+    }
+    $scope QLabel {
+        color: $text;
+    }
+    $scope QFrame#displayFrame {
+        background-color: $display_bg;
+    }
+    $scope QFrame#buttonContainer {
+        background-color: $container_bg;
+    }
+    $scope QFrame#cpuFrame {
+        background-color: $frame_bg;
+        border: 2px solid $frame_border;
+        border-radius: 15px;
+        padding: 10px;
+    }
+    $scope QFrame#cpuFrame QLabel {
+        color: $cpu_fg;
+        font-family: 'Courier';
+        font-size: 24px;
+        font-weight: bold;
+    }
+""")
+
+MENU_PAGE = Template("""
+    $scope, $scope QWidget {
+        background-color: $menu_bg;
+    }
+    $scope QPushButton {
+        background-color: $menu_button_bg;
+        color: $menu_button_fg;
+        border: none;
+        border-radius: 15px;
+        padding: 20px;
+        font-size: 16px;
+        font-weight: bold;
+        min-width: 200px;
+    }
+    $scope QPushButton:hover {
+        background-color: $menu_button_hover;
+    }
+    $scope QPushButton:pressed {
+        background-color: $menu_button_pressed;
+    }
+    $scope QPushButton#exitButton {
+        background-color: #662222;
+        color: #ffffff;
+    }
+    $scope QPushButton#exitButton:hover {
+        background-color: #883333;
+    }
+""")
+
+_compiled = {}  # (template, page, sizes) -> stylesheet text
+
+
+def compile_stylesheet(template, page, sizes):
+    # Every theme's rules in one sheet, each scoped to the page carrying a
+    # matching `theme` property. Rendered once per process.
+    key = (template.template, page, tuple(sorted(sizes.items())))
+    if key not in _compiled:
+        _compiled[key] = "\n".join(
+            template.substitute(colors, scope=f'QWidget#{page}[theme="{name}"]', **sizes)
+            for name, colors in THEMES.items()
+        )
+    return _compiled[key]
+
+
+class ThemeManager:
+    # Each page gets its stylesheet once, when it is built. Switching theme
+    # then only flips the page's `theme` property and re-polishes the
+    # existing widgets against rules Qt has already parsed, instead of
+    # handing it a new sheet to parse for the whole tree.
+    def __init__(self, name="dark", sizes=None):
+        if name not in THEMES:
+            log.warning("Unknown theme %r, using %s", name, next(iter(THEMES)))
+            name = next(iter(THEMES))
+        self.name = name
+        self.sizes = sizes or {}
+        self.pages = []
+
+    @property
+    def next_name(self):
+        names = list(THEMES)
+        return names[(names.index(self.name) + 1) % len(names)]
+
+    @property
+    def next_label(self):
+        return THEMES[self.next_name]["label"]
+
+    def add_page(self, page, template):
+        page.setProperty("theme", self.name)
+        page.setStyleSheet(compile_stylesheet(template, page.objectName(), self.sizes))
+        self.pages.append(page)
+
+    def set_theme(self, name):
+        self.name = name
+        for page in self.pages:
+            page.setProperty("theme", name)
+            style = page.style()
+            for widget in [page] + page.findChildren(QWidget):
+                style.unpolish(widget)
+                style.polish(widget)
+            page.update()
@@ -0,0 +1,260 @@
+import fcntl
+import os
+import select
+import socket
+import struct
+import termios
+import threading
+import time
+import tty
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_BAUDRATE = 9600
+DEFAULT_TIMEOUT = 1.0
+
+
+class TransportError(IOError):
+    pass
+
+
+class Transport:
+    # The slice of the pyserial API the engine uses, so any backend can
+    # stand in for a serial.Serial. Subclasses implement _recv/_send and
+    # in_waiting; read() follows pyserial's timeout rules (None blocks,
+    # 0 never blocks, otherwise wait up to `timeout` seconds).
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, timeout=DEFAULT_TIMEOUT):
+        self.baudrate = baudrate  # Nominal; used for wire-time estimates
+        self.timeout = timeout
+        self.write_timeout = None
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        raise NotImplementedError
+
+    def _recv(self, size, timeout):
+        # Return up to size bytes, waiting at most timeout for the first one
+        raise NotImplementedError
+
+    def _send(self, data):
+        raise NotImplementedError
+
+    def read(self, size=1):
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < size:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            chunk = self._recv(size - len(data), remaining)
+            if chunk:
+                data += chunk
+            elif remaining is not None and remaining <= 0:
+                break
+        return bytes(data)
+
+    def read_until(self, expected=b'\r', size=None):
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not data.endswith(expected) and (size is None or len(data) < size):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            chunk = self._recv(1, remaining)
+            if chunk:
+                data += chunk
+            elif remaining is not None and remaining <= 0:
+                break
+        return bytes(data)
+
+    def write(self, data):
+        self._send(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        while self.in_waiting:
+            self._recv(self.in_waiting, 0)
+
+    def reset_output_buffer(self):
+        pass
+
+    def fileno(self):
+        raise TransportError(f"{type(self).__name__} has no file descriptor")
+
+    def close(self):
+        self.is_open = False
+
+
+class FdTransport(Transport):
+    # Shared plumbing for backends that sit on a readable file descriptor
+    def __init__(self, fd, **kwargs):
+        super().__init__(**kwargs)
+        self._fd = fd
+
+    @property
+    def in_waiting(self):
+        buf = fcntl.ioctl(self._fd, termios.FIONREAD, b"\0\0\0\0")
+        return struct.unpack("I", buf)[0]
+
+    def fileno(self):
+        return self._fd
+
+    def _wait_readable(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        return bool(readable)
+
+    def _recv(self, size, timeout):
+        if not self._wait_readable(timeout):
+            return b""
+        data = self._read_fd(size)
+        if not data:
+            raise TransportError("Connection closed by peer")
+        return data
+
+    def _read_fd(self, size):
+        return os.read(self._fd, size)
+
+    def _send(self, data):
+        view = memoryview(data)
+        while view:
+            select.select([], [self._fd], [], self.write_timeout)
+            written = self._write_fd(view)
+            view = view[written:]
+
+    def _write_fd(self, data):
+        return os.write(self._fd, data)
+
+
+class PtyTransport(FdTransport):
+    # A raw tty device opened without pyserial, e.g. the slave side of a
+    # pseudo-terminal
+    def __init__(self, path, **kwargs):
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(fd)
+        super().__init__(fd, **kwargs)
+        self.path = path
+
+    def flush(self):
+        termios.tcdrain(self._fd)
+
+    def reset_input_buffer(self):
+        termios.tcflush(self._fd, termios.TCIFLUSH)
+
+    def reset_output_buffer(self):
+        termios.tcflush(self._fd, termios.TCOFLUSH)
+
+    def close(self):
+        if self.is_open:
+            os.close(self._fd)
+        super().close()
+
+
+class TcpTransport(FdTransport):
+    # Raw TCP to a terminal server (ser2net and the like)
+    def __init__(self, host, port, connect_timeout=5.0, **kwargs):
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(False)
+        super().__init__(self.sock.fileno(), **kwargs)
+
+    def _read_fd(self, size):
+        return self.sock.recv(size)
+
+    def _write_fd(self, data):
+        try:
+            return self.sock.send(data)
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        if self.is_open:
+            self.sock.close()
+        super().close()
+
+
+class LoopbackTransport(Transport):
+    # In-memory link. On its own, writes come straight back as reads (like
+    # pyserial's loop://); pair() gives two connected ends, one for the
+    # engine and one for a simulator.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cond = threading.Condition()
+        self._rx = bytearray()
+        self.peer = self
+
+    @classmethod
+    def pair(cls, **kwargs):
+        a, b = cls(**kwargs), cls(**kwargs)
+        a.peer, b.peer = b, a
+        return a, b
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._rx)
+
+    def _recv(self, size, timeout):
+        with self._cond:
+            if not self._rx:
+                if not self.is_open:
+                    raise TransportError("Loopback closed")
+                self._cond.wait_for(lambda: self._rx or not self.is_open, timeout)
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def _send(self, data):
+        peer = self.peer
+        with peer._cond:
+            peer._rx += data
+            peer._cond.notify_all()
+
+    def reset_input_buffer(self):
+        with self._cond:
+            del self._rx[:]
+
+    def close(self):
+        super().close()
+        with self._cond:
+            self._cond.notify_all()
+
+
+def device_path(url):
+    # The device node behind a serial:// or pty:// URL, None for the rest
+    parts = urlsplit(url if "://" in url else "serial://" + url)
+    return parts.path if parts.scheme in ("serial", "pty") else None
+
+
+def open_transport(url, baudrate=DEFAULT_BAUDRATE, timeout=DEFAULT_TIMEOUT):
+    # serial:///dev/serial0?baud=9600, pty:///dev/pts/3, tcp://host:port,
+    # loop://, replay:///path/capture.bin?speed=4&skip=120 -- a bare path
+    # is treated as serial://
+    parts = urlsplit(url if "://" in url else "serial://" + url)
+    query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+    baudrate = int(query.get("baud", baudrate))
+    timeout = float(query.get("timeout", timeout))
+
+    if parts.scheme == "serial":
+        import serial  # Only the hardware backend needs pyserial
+        return serial.Serial(
+            port=parts.path,
+            baudrate=baudrate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=timeout
+        )
+    if parts.scheme == "pty":
+        return PtyTransport(parts.path, baudrate=baudrate, timeout=timeout)
+    if parts.scheme == "tcp":
+        if not parts.hostname or not parts.port:
+            raise ValueError(f"tcp transport needs host:port: {url}")
+        return TcpTransport(parts.hostname, parts.port, baudrate=baudrate, timeout=timeout)
+    if parts.scheme == "loop":
+        return LoopbackTransport(baudrate=baudrate, timeout=timeout)
+    if parts.scheme == "replay":
+        from uart_capture import ReplayTransport
+        return ReplayTransport(
+            parts.path, speed=float(query.get("speed", 1.0)), skip=float(query.get("skip", 0.0)),
+            baudrate=baudrate, timeout=timeout
+        )
+    raise ValueError(f"Unknown transport: {url}")
@@ -0,0 +1,401 @@
+import time
+
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QPointF, QPropertyAnimation, QRect, QRectF, QSize, QTimer,
+    pyqtProperty
+)
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter, QPen, QPixmap, QPolygonF
+from PyQt5.QtWidgets import (
+    QGraphicsBlurEffect, QGraphicsPixmapItem, QGraphicsScene, QPushButton, QSizePolicy, QWidget
+)
+
+from uart_theme import THEMES
+from uart_worker import KEY_ACK, KEY_NACK, KEY_TIMEOUT, KEY_REJECTED, KEY_ERROR
+
+SHADOW_BLUR = 20  # Same blur radius the old QGraphicsDropShadowEffect used
+SHADOW_MARGIN = 10  # Room left around the button face for its shadow
+CORNER_RADIUS = 15
+HOVER_GROWTH = 2  # Pixels the face grows on each side while hovered
+HOVER_DURATION = 100  # ms
+STATUS_HOLD = 1500  # ms a key's ACK/NACK/timeout dot stays up
+STATUS_DOT = 8  # px radius
+
+KEY_PENDING = "pending"
+# Key outcome -> theme colour of the dot. A rejected press never reached
+# the VMC, so it gets the same grey as one the VMC never answered.
+STATUS_COLORS = {
+    KEY_PENDING: "key_pending",
+    KEY_ACK: "key_ack",
+    KEY_NACK: "key_nack",
+    KEY_TIMEOUT: "key_timeout",
+    KEY_REJECTED: "key_timeout",
+    KEY_ERROR: "key_nack",
+}
+
+LCD_COLUMNS = 20
+LCD_ROWS = 2
+LCD_FONT_SIZE = 36  # px, unless the theme sizes give a display_font
+BLINK_INTERVAL = 400  # ms, about an HD44780's cursor blink
+SPARKLINE_WIDTH = 2  # px
+ATLAS_FIRST = 32  # Printable ASCII; anything else is drawn as '?'
+ATLAS_LAST = 126
+
+_pixmaps = {}  # Rendered shadows and faces, shared by every button
+_atlases = {}  # Glyph atlases, one per font, colours and pixel ratio
+
+
+def _rounded_rect(width, height, color, blur=0, margin=0):
+    # A filled rounded rect in a pixmap `margin` px larger on every side,
+    # blurred once if asked. Cached, so each size/colour is rendered once.
+    key = (width, height, color, blur, margin)
+    pixmap = _pixmaps.get(key)
+    if pixmap is not None:
+        return pixmap
+
+    pixmap = QPixmap(width + 2 * margin, height + 2 * margin)
+    pixmap.fill(Qt.transparent)
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setPen(Qt.NoPen)
+    painter.setBrush(QColor(color))
+    painter.drawRoundedRect(QRectF(margin, margin, width, height), CORNER_RADIUS, CORNER_RADIUS)
+    painter.end()
+
+    if blur:
+        # One offscreen blur pass per size and colour instead of one per paint
+        item = QGraphicsPixmapItem(pixmap)
+        effect = QGraphicsBlurEffect()
+        effect.setBlurRadius(blur)
+        item.setGraphicsEffect(effect)
+        scene = QGraphicsScene()
+        scene.addItem(item)
+        bounds = QRectF(pixmap.rect())
+        pixmap = QPixmap(pixmap.size())
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        scene.render(painter, bounds, bounds)
+        painter.end()
+
+    _pixmaps[key] = pixmap
+    return pixmap
+
+
+class ModernButton(QPushButton):
+    # Paints its own face, shadow and hover glow from cached pixmaps. The
+    # hover animation runs on `glow`, which only triggers a repaint, so
+    # hovering never relayouts the grid or runs a blur. Fonts still come
+    # from the page stylesheet; colours from the current theme.
+    def __init__(self, text, themes, parent=None, shadow_margin=SHADOW_MARGIN):
+        super().__init__(text, parent)
+        self.themes = themes
+        self.shadow_margin = shadow_margin
+        self._glow = 0.0
+        self.status = None
+        self._status_timer = QTimer(self)
+        self._status_timer.setSingleShot(True)
+        self._status_timer.timeout.connect(lambda: self.set_status(None))
+        self.setMinimumHeight(80 + 2 * shadow_margin)
+        self.setCursor(Qt.PointingHandCursor)
+
+        # Animation setup
+        self._animation = QPropertyAnimation(self, b"glow")
+        self._animation.setDuration(HOVER_DURATION)
+
+    def _get_glow(self):
+        return self._glow
+
+    def _set_glow(self, value):
+        self._glow = value
+        self.update()
+
+    glow = pyqtProperty(float, _get_glow, _set_glow)
+
+    def _animate_glow(self, end):
+        self._animation.stop()
+        self._animation.setStartValue(self._glow)
+        self._animation.setEndValue(end)
+        self._animation.start()
+
+    def set_status(self, status):
+        # A dot in the corner of the face: pending until the key's future
+        # resolves, then its outcome for STATUS_HOLD ms. Paint-only, so it
+        # costs one repaint of this button per change.
+        self.status = status
+        if status is None or status == KEY_PENDING:
+            self._status_timer.stop()
+        else:
+            self._status_timer.start(STATUS_HOLD)
+        self.update()
+
+    def enterEvent(self, event):
+        self._animate_glow(1.0)
+        super().enterEvent(event)
+
+    def leaveEvent(self, event):
+        self._animate_glow(0.0)
+        super().leaveEvent(event)
+
+    def paintEvent(self, event):
+        colors = THEMES[self.themes.name]
+        margin = self.shadow_margin
+        width = self.width() - 2 * margin
+        height = self.height() - 2 * margin
+        if width <= 0 or height <= 0:
+            return
+
+        painter = QPainter(self)
+        glow = self._glow
+        origin = QPointF(margin - SHADOW_BLUR, margin - SHADOW_BLUR)
+        # Cross-fade the resting shadow into the hover glow
+        if glow < 1.0:
+            painter.setOpacity(1.0 - glow)
+            painter.drawPixmap(origin, _rounded_rect(
+                width, height, colors["button_shadow"], SHADOW_BLUR, SHADOW_BLUR))
+        if glow > 0.0:
+            painter.setOpacity(glow)
+            painter.drawPixmap(origin, _rounded_rect(
+                width, height, colors["button_glow"], SHADOW_BLUR, SHADOW_BLUR))
+        painter.setOpacity(1.0)
+
+        if self.isDown():
+            face_color = colors["button_pressed"]
+        elif self.underMouse():
+            face_color = colors["button_hover"]
+        else:
+            face_color = colors["button_bg"]
+        grow = HOVER_GROWTH * glow
+        face = QRectF(margin - grow, margin - grow, width + 2 * grow, height + 2 * grow)
+        face_pixmap = _rounded_rect(width, height, face_color)
+        painter.drawPixmap(face, face_pixmap, QRectF(face_pixmap.rect()))
+
+        painter.setPen(QColor(colors["button_fg"]))
+        painter.setFont(self.font())
+        painter.drawText(face, Qt.AlignCenter, self.text())
+
+        if self.status is not None:
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(colors[STATUS_COLORS[self.status]]))
+            inset = CORNER_RADIUS / 2 + STATUS_DOT
+            painter.drawEllipse(
+                QPointF(face.right() - inset, face.top() + inset), STATUS_DOT, STATUS_DOT
+            )
+        painter.end()
+
+
+def _glyph_atlas(font, cell_width, cell_height, fg, bg, dpr):
+    # Every printable character pre-rendered into one pixmap: normal cells
+    # on the first row, inverted ones (for a block cursor) on the second
+    key = (font.key(), cell_width, cell_height, fg, bg, dpr)
+    atlas = _atlases.get(key)
+    if atlas is not None:
+        return atlas
+
+    count = ATLAS_LAST - ATLAS_FIRST + 1
+    atlas = QPixmap(int(cell_width * count * dpr), int(cell_height * 2 * dpr))
+    atlas.setDevicePixelRatio(dpr)
+    painter = QPainter(atlas)
+    painter.setFont(font)
+    for row, (ink, paper) in enumerate(((fg, bg), (bg, fg))):
+        painter.fillRect(QRect(0, row * cell_height, cell_width * count, cell_height), QColor(paper))
+        painter.setPen(QColor(ink))
+        for i in range(count):
+            painter.drawText(
+                QRect(i * cell_width, row * cell_height, cell_width, cell_height),
+                Qt.AlignCenter, chr(ATLAS_FIRST + i)
+            )
+    painter.end()
+    _atlases[key] = atlas
+    return atlas
+
+
+class LCDWidget(QWidget):
+    # The VMC's 20x2 character display. Characters are copied out of a
+    # glyph atlas rendered once per theme, and a new frame only repaints
+    # the cells that differ from what is already on screen, so a poll that
+    # returns the same text costs 40 character compares and no painting.
+    def __init__(self, themes, parent=None, columns=LCD_COLUMNS, rows=LCD_ROWS):
+        super().__init__(parent)
+        self.themes = themes
+        self.columns = columns
+        self.rows = rows
+        self.lines = [" " * columns] * rows
+        self.cursor_cell = None  # (row, column) or None
+        self.cursor_blink = False
+        self._blink_on = True
+        self._blink_timer = QTimer(self)
+        self._blink_timer.timeout.connect(self._toggle_blink)
+
+        self.glyph_font = QFont("Courier")
+        self.glyph_font.setStyleHint(QFont.Monospace)
+        self.glyph_font.setPixelSize(themes.sizes.get("display_font", LCD_FONT_SIZE))
+        self.glyph_font.setBold(True)
+        metrics = QFontMetrics(self.glyph_font)
+        self.cell_width = metrics.horizontalAdvance("M")
+        self.cell_height = metrics.height()
+        self.row_gap = self.cell_height // 3
+
+        self.setAttribute(Qt.WA_OpaquePaintEvent)  # paintEvent covers every pixel it is asked for
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
+
+    def sizeHint(self):
+        return QSize(
+            self.columns * self.cell_width + 20,
+            self.rows * self.cell_height + (self.rows - 1) * self.row_gap + 20
+        )
+
+    def minimumSizeHint(self):
+        return self.sizeHint()
+
+    def _cell_rect(self, row, column):
+        # The grid sits centred in the widget
+        grid_width = self.columns * self.cell_width
+        grid_height = self.rows * self.cell_height + (self.rows - 1) * self.row_gap
+        x = (self.width() - grid_width) // 2 + column * self.cell_width
+        y = (self.height() - grid_height) // 2 + row * (self.cell_height + self.row_gap)
+        return QRect(x, y, self.cell_width, self.cell_height)
+
+    def set_lines(self, *lines):
+        # Pads or cuts each line to the display width, like the LCD would
+        for row, line in enumerate(lines[:self.rows]):
+            line = line[:self.columns].ljust(self.columns)
+            old = self.lines[row]
+            if line == old:
+                continue
+            self.lines[row] = line
+            for column in range(self.columns):
+                if line[column] != old[column]:
+                    self.update(self._cell_rect(row, column))
+
+    def set_cursor(self, row, column, blink=False):
+        # An underline cursor, or a blinking block with blink set
+        if self.cursor_cell is not None:
+            self.update(self._cell_rect(*self.cursor_cell))
+        self.cursor_cell = (row, column)
+        self.cursor_blink = blink
+        self._blink_on = True
+        self.update(self._cell_rect(row, column))
+        if blink:
+            self._blink_timer.start(BLINK_INTERVAL)
+        else:
+            self._blink_timer.stop()
+
+    def clear_cursor(self):
+        if self.cursor_cell is not None:
+            self.update(self._cell_rect(*self.cursor_cell))
+        self.cursor_cell = None
+        self._blink_timer.stop()
+
+    def _toggle_blink(self):
+        self._blink_on = not self._blink_on
+        self.update(self._cell_rect(*self.cursor_cell))
+
+    def paintEvent(self, event):
+        colors = THEMES[self.themes.name]
+        dpr = self.devicePixelRatioF()
+        atlas = _glyph_atlas(
+            self.glyph_font, self.cell_width, self.cell_height,
+            colors["display_fg"], colors["display_bg"], dpr
+        )
+        width, height = self.cell_width * dpr, self.cell_height * dpr
+        dirty = event.rect()
+
+        painter = QPainter(self)
+        painter.fillRect(dirty, QColor(colors["display_bg"]))
+        for row, line in enumerate(self.lines):
+            for column, char in enumerate(line):
+                cell = self._cell_rect(row, column)
+                if not cell.intersects(dirty):
+                    continue
+                index = ord(char) - ATLAS_FIRST
+                if not 0 <= index <= ATLAS_LAST - ATLAS_FIRST:
+                    index = ord("?") - ATLAS_FIRST
+                at_cursor = self.cursor_cell == (row, column)
+                inverted = at_cursor and self.cursor_blink and self._blink_on
+                source = QRectF(index * width, height if inverted else 0, width, height)
+                painter.drawPixmap(QRectF(cell), atlas, source)
+                if at_cursor and not self.cursor_blink:
+                    painter.fillRect(
+                        cell.x(), cell.bottom() - 2, cell.width(), 3, QColor(colors["display_fg"])
+                    )
+        painter.end()
+
+
+class Sparkline(QWidget):
+    # A bare line chart of the last few values, scaled to a fixed range.
+    # One polyline per paint and no axes or text; gaps (NaN) break the line.
+    def __init__(self, themes, color_key="cpu_fg", low=0.0, high=100.0, parent=None):
+        super().__init__(parent)
+        self.themes = themes
+        self.color_key = color_key
+        self.low = low
+        self.high = high
+        self.values = []
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setFixedHeight(40)
+
+    def set_values(self, values):
+        self.values = values
+        self.update()
+
+    def paintEvent(self, event):
+        count = len(self.values)
+        if count < 2:
+            return
+        width, height = self.width() - 1, self.height() - SPARKLINE_WIDTH
+        span = (self.high - self.low) or 1.0
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor(THEMES[self.themes.name][self.color_key]), SPARKLINE_WIDTH))
+        run = QPolygonF()
+        for i, value in enumerate(self.values):
+            if value != value:  # NaN
+                if run.size() > 1:
+                    painter.drawPolyline(run)
+                run = QPolygonF()
+                continue
+            level = min(max((value - self.low) / span, 0.0), 1.0)
+            run.append(QPointF(width * i / (count - 1), SPARKLINE_WIDTH / 2 + height * (1.0 - level)))
+        if run.size() > 1:
+            painter.drawPolyline(run)
+        painter.end()
+
+
+class HistoryModel(QAbstractListModel):
+    # A DisplayHistory as a list, newest frame first. Rows are formatted
+    # from the history's buffer only when the view asks for them, so a
+    # view over thousands of frames touches just the rows on screen.
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self.history = history
+
+    def set_history(self, history):
+        self.beginResetModel()
+        self.history = history
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.history)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        timestamp, upper_line, lower_line = self.history.frame(len(self.history) - 1 - index.row())
+        wall = time.time() - (time.monotonic() - timestamp)
+        stamp = time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall * 1000) % 1000:03d}"
+        return f"{stamp}  {upper_line}|{lower_line}"
+
+    def record(self, upper_line, lower_line):
+        # DisplayHistory.record, telling attached views which rows moved
+        history = self.history
+        if not history.changed(upper_line, lower_line):
+            return False
+        if len(history) == history.capacity:
+            last = len(history) - 1
+            self.beginRemoveRows(QModelIndex(), last, last)
+            history.drop_oldest()
+            self.endRemoveRows()
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        history.record(upper_line, lower_line)
+        self.endInsertRows()
+        return True
@@ -0,0 +1,712 @@
+import heapq
+import logging
+import itertools
+import os
+import select
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+from uart_link import CircuitBreaker, LINK_OPEN, LINK_RECONNECTING
+from uart_metrics import LinkMetrics
+from uart_protocol import (
+    FrameDecoder, InFlightTable, EXPECTED_REPLIES,
+    FRAME_DISPLAY, FRAME_NACK, FRAME_JUNK
+)
+
+log = logging.getLogger("uart.worker")
+
+# Key configuration
+KEY_PRESS_DURATION = "1000"  # Default milliseconds duration for key closure
+
+MAX_ERRORS = 3  # Maximum consecutive errors before showing error message
+
+DISPLAY_FRAME_SIZE = 41  # 40 display chars + CR
+RESPONSE_TIMEOUT = 1.0  # Default seconds to wait for a full reply
+REAPPEAR_CHECK = 0.05  # Seconds between looks for a lost device node coming back
+
+# How display updates reach the worker
+DISPLAY_POLL = "poll"  # Only as replies to DISPLAY polls
+DISPLAY_LISTEN = "listen"  # The VMC pushes frames unsolicited; polls are a keepalive
+DISPLAY_AUTO = "auto"  # Poll, switching to listen while the VMC is seen pushing
+DISPLAY_MODES = (DISPLAY_AUTO, DISPLAY_POLL, DISPLAY_LISTEN)
+
+LISTEN_SLICE = 0.02  # Seconds between reads when listening on a port with no fd to wait on
+PUSH_CONFIRM = 2  # Unsolicited frames that show the VMC pushes
+PUSH_MISSES = 2  # Polls in a row showing a change never pushed, before polling again
+LATE_REPLY_FACTOR = 2  # Reply timeouts an abandoned poll's reply may still turn up in
+
+# Returned by _next_frame when a queued key cut a DISPLAY wait short
+PREEMPTED = object()
+
+# Command priorities, lower runs first
+PRIORITY_KEY = 0
+PRIORITY_DISPLAY = 1
+
+# What to do with a press of a key whose previous press hasn't completed
+KEY_REPEAT_QUEUE = "queue"  # Send it again after the first
+KEY_REPEAT_COALESCE = "coalesce"  # Fold it into the pending press
+KEY_REPEAT_REJECT = "reject"  # Drop it, reporting KEY_REJECTED
+KEY_REPEAT_POLICIES = (KEY_REPEAT_QUEUE, KEY_REPEAT_COALESCE, KEY_REPEAT_REJECT)
+
+# Outcomes of a key press
+KEY_ACK = "ACK"
+KEY_NACK = "NACK"
+KEY_TIMEOUT = "TIMEOUT"
+KEY_REJECTED = "REJECTED"
+KEY_ERROR = "ERROR"
+KEY_STATUSES = (KEY_ACK, KEY_NACK, KEY_TIMEOUT, KEY_REJECTED, KEY_ERROR)
+
+# What a key press future resolves to. latency is the send-to-reply round
+# trip (None without a reply), waited the time spent queued before sending.
+KeyResult = namedtuple("KeyResult", "key status latency waited")
+
+
+def frame_time(baudrate, size=DISPLAY_FRAME_SIZE):
+    # Seconds one frame of `size` bytes spends on the wire (8N1 = 10 bits/byte)
+    return size * 10.0 / baudrate
+
+
+class CommandScheduler:
+    # Single queue in front of the port. KEY commands jump ahead of DISPLAY
+    # polls, and a DISPLAY poll for a page that is already queued is
+    # collapsed into the pending one. `wakeup` is called after every put
+    # and on stop, for owners that wait on something other than the
+    # condition.
+    def __init__(self, wakeup=None):
+        self.wakeup = wakeup
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._pending_displays = set()
+        self._stopped = False
+
+    def put_display(self, n):
+        with self._cond:
+            if n in self._pending_displays:
+                return False
+            self._pending_displays.add(n)
+            heapq.heappush(self._heap, (PRIORITY_DISPLAY, next(self._seq), ("DISPLAY", n)))
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+        return True
+
+    def put_key(self, key_number, duration, future=None):
+        # future, if given, travels with the command to report its outcome
+        command = ("KEY", key_number, duration, future, time.monotonic())
+        with self._cond:
+            heapq.heappush(self._heap, (PRIORITY_KEY, next(self._seq), command))
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    def key_pending(self):
+        with self._cond:
+            return bool(self._heap) and self._heap[0][0] == PRIORITY_KEY
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def get(self, block=True, timeout=None):
+        # Returns the next command, or None once stopped (or, when not
+        # blocking or after `timeout` seconds, if nothing is queued)
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: self._heap or self._stopped, timeout)
+            if self._stopped or not self._heap:
+                return None
+            command = heapq.heappop(self._heap)[2]
+            if command[0] == "DISPLAY":
+                self._pending_displays.discard(command[1])
+            return command
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self.wakeup:
+            self.wakeup()
+
+    def drain(self):
+        # Everything still queued, emptying the queue
+        with self._cond:
+            commands = [entry[2] for entry in sorted(self._heap)]
+            self._heap.clear()
+            self._pending_displays.clear()
+            return commands
+
+
+class SerialWorker(threading.Thread):
+    # Owns the serial port and runs every VMC round trip off the GUI thread.
+    # Commands come in through the scheduler; results go back through
+    # callbacks, which the Qt frontends wire to signals so they land on the
+    # GUI thread. on_display only ever gets frames decoded from the VMC;
+    # the worker's own messages ("Timeout Error", "Connection Lost") go to
+    # on_status, or to on_display if that isn't set. on_key_response gets
+    # (key, status) for every press, with status one of the KEY_*
+    # outcomes, whether or not the VMC answered.
+    #
+    # With pipeline_depth > 1 up to that many commands are kept on the wire
+    # at once and replies are matched to them in order, instead of waiting
+    # out each round trip before sending the next command.
+    #
+    # A CircuitBreaker tracks the link. While it is open, commands fail
+    # straight away instead of each sitting out a timeout; when a probe is
+    # due, or the device node at `device_path` reappears after being
+    # unplugged, a lost port is reopened with `reopen()` (a callable
+    # returning a fresh transport) and the next command goes out as a probe.
+    #
+    # Unless display_mode is "poll", the worker also reads while idle, so
+    # frames the VMC sends unsolicited are shown as they arrive. A DISPLAY
+    # frame no command asked for (and not the late reply to an abandoned
+    # poll) is a push; after PUSH_CONFIRM of them push_active is set and
+    # the frontend can slow its polls to a keepalive. In "auto" mode a
+    # poll reply showing a change that was never pushed, PUSH_MISSES times
+    # in a row, clears it again. "listen" assumes pushes from the start.
+    def __init__(self, ser, on_display=None, on_key_response=None,
+                 on_latency=None, pipeline_depth=1, metrics=None, wakeup=None,
+                 key_repeat=KEY_REPEAT_QUEUE, reopen=None, device_path=None,
+                 display_mode=DISPLAY_AUTO, on_status=None, response_timeout=RESPONSE_TIMEOUT):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.on_display = on_display
+        self.on_status = on_status
+        self.on_key_response = on_key_response
+        self.on_latency = on_latency
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.response_timeout = response_timeout  # Seconds a command waits for its reply
+        self.metrics = metrics or LinkMetrics(ser.baudrate)
+        self.scheduler = CommandScheduler(wakeup)
+        self.decoder = FrameDecoder()
+        self.in_flight = InFlightTable()
+        self._frames = deque()
+        self.error_counter = 0  # Counter for consecutive errors
+        self.last_key_press_time = 0
+        if key_repeat not in KEY_REPEAT_POLICIES:
+            raise ValueError(f"Unknown key repeat policy {key_repeat!r}")
+        self.key_repeat = key_repeat
+        self._key_futures = {}  # key -> futures of presses not yet completed
+        self._key_lock = threading.Lock()
+        self.reopen = reopen
+        self.device_path = device_path
+        self.port_lost = False
+        self._device_missing = False
+        self.breaker = CircuitBreaker(on_change=self._link_changed)
+        if display_mode not in DISPLAY_MODES:
+            raise ValueError(f"Unknown display mode {display_mode!r}")
+        self.display_mode = display_mode
+        self.push_active = False
+        self._pushes = 0  # Unsolicited frames since push was last ruled out
+        self._misses = 0
+        self._late_until = deque()  # Deadlines of abandoned polls' replies
+        self._last_lines = None  # Newest frame from the VMC
+        self._wake_r = self._wake_w = None  # Pipe run() waits on with the port
+        self._wake_lock = threading.Lock()  # Keeps _wake off a closed pipe
+        if display_mode == DISPLAY_LISTEN:
+            self._set_push(True)
+
+    def request_display(self, n):
+        # Polls for a page that is already queued collapse into one
+        self.scheduler.put_display(n)
+
+    def request_key(self, key_number, duration=KEY_PRESS_DURATION):
+        # Queues the press and returns at once with a Future that resolves
+        # to a KeyResult, on the worker thread, when the VMC answers (or
+        # doesn't). A repeat of a key still in progress follows key_repeat.
+        with self._key_lock:
+            pending = self._key_futures.setdefault(key_number, [])
+            if pending and self.key_repeat == KEY_REPEAT_COALESCE:
+                return pending[-1]
+            rejected = bool(pending) and self.key_repeat == KEY_REPEAT_REJECT
+            future = Future()
+            if not rejected:
+                pending.append(future)
+        if rejected:
+            self._resolve_key(key_number, future, KEY_REJECTED, None, 0.0)
+            return future
+        self.scheduler.put_key(key_number, duration, future)
+        return future
+
+    def stop(self):
+        self.scheduler.stop()
+
+    def run(self):
+        # Read in slices of one frame time so a queued key can cut a stuck
+        # DISPLAY wait short instead of sitting out the full timeout
+        self.ser.timeout = frame_time(self.ser.baudrate)
+        if self.scheduler.wakeup is None:
+            # Written on every put, so an idle wait can block on the port
+            # and the queue at once
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self.scheduler.wakeup = self._wake
+        if self.pipeline_depth > 1:
+            self._run_pipelined()
+        else:
+            while True:
+                command = self.wait_idle()
+                if self.scheduler.stopped:
+                    break
+                if self.check_link() and command is None:
+                    command = ("DISPLAY", 0)  # Nothing queued to probe with
+                if command is None:
+                    self.listen()
+                    continue
+                if not self._admit(command):
+                    continue
+                if command[0] == "DISPLAY":
+                    self.send_display_command(command[1])
+                elif command[0] == "KEY":
+                    self.send_key_command(command[1], command[2], command[3], command[4])
+        self.abandon_keys()
+        if not self.port_lost:
+            self.ser.close()
+        with self._wake_lock:
+            if self._wake_r is not None:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_r = self._wake_w = None
+
+    def _wake(self):
+        with self._wake_lock:
+            if self._wake_w is None:
+                return  # Worker already gone
+            try:
+                os.write(self._wake_w, b"\0")
+            except BlockingIOError:
+                pass  # Already a wakeup pending
+
+    # Connection state
+
+    def _link_changed(self, old, new):
+        level = logging.INFO if LINK_RECONNECTING in (old, new) else logging.WARNING
+        log.log(level, "Link %s -> %s", old, new)
+        self.metrics.link_state = new
+        if new == LINK_OPEN and old != LINK_RECONNECTING:
+            self.metrics.count("circuit_opens")
+        if self.port_lost and new == LINK_OPEN:
+            self._show_status("Connection Lost", "Reconnecting...")
+
+    def probe_wait(self):
+        # How long the worker may idle before it has link checks to make;
+        # None while the circuit is closed
+        wait = self.breaker.probe_in()
+        if wait is not None and self.port_lost and self.device_path:
+            wait = min(wait, REAPPEAR_CHECK)
+        return wait
+
+    def _listening(self):
+        # Whether idle waits should also watch the port for pushed frames
+        return self.display_mode != DISPLAY_POLL and not self.port_lost and not self.breaker.is_open
+
+    def _port_fd(self):
+        # The port's file descriptor, or None for backends without one
+        try:
+            return self.ser.fileno()
+        except (AttributeError, OSError):
+            return None
+
+    def idle_wait(self):
+        # How long the worker may block on the scheduler alone. A port with
+        # no fd to wait on is listened to by slicing the wait.
+        wait = self.probe_wait()
+        if self._listening() and (self._wake_r is None or self._port_fd() is None):
+            wait = LISTEN_SLICE if wait is None else min(wait, LISTEN_SLICE)
+        return wait
+
+    def wait_idle(self):
+        # With nothing on the wire: returns the next command, blocking
+        # until one is queued, the VMC sends something unprompted or a link
+        # check is due (then None). Blocks in select() on the port and the
+        # wake pipe, so an idle worker costs no wakeups between polls.
+        command = self.scheduler.get(block=False)
+        if command is not None or self.scheduler.stopped:
+            return command
+        fd = self._port_fd() if self._listening() else None
+        if self._wake_r is None or (self._listening() and fd is None):
+            return self.scheduler.get(timeout=self.idle_wait())
+        try:
+            if fd is None:
+                select.select([self._wake_r], [], [], self.probe_wait())
+            elif not self.ser.in_waiting:
+                select.select([self._wake_r, fd], [], [], self.probe_wait())
+        except OSError as e:
+            self.port_failed(e)
+            return None
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+        return self.scheduler.get(block=False)
+
+    def listen(self):
+        # Handle whatever the VMC sent while nothing was on the wire
+        if not self._listening():
+            return
+        try:
+            waiting = self.ser.in_waiting
+            if waiting:
+                self._frames.extend(self._feed(self.ser.read(waiting)))
+        except OSError as e:
+            self.port_failed(e)
+            return
+        while self._frames:
+            self._handle_stray(self._frames.popleft())
+
+    def port_failed(self, error):
+        # The port itself errored (unplugged adapter, dropped TCP peer):
+        # close it and open the circuit until it can be reopened
+        log.error("Port failed: %s", error)
+        if not self.port_lost and self.reopen:
+            self.port_lost = True
+            try:
+                self.ser.close()
+            except OSError:
+                pass
+        self.breaker.record_failure(fatal=True)
+        for entry in self.in_flight.clear():
+            self._complete(entry, None, time.monotonic())
+
+    def check_link(self):
+        # Called whenever the worker is free. While the circuit is open,
+        # starts a probe once the backoff runs out or the lost device node
+        # reappears, reopening the port first if it was lost. Returns True
+        # when a probe was started.
+        if not self.breaker.is_open:
+            return False
+        reappeared = False
+        if self.port_lost and self.device_path:
+            present = os.path.exists(self.device_path)
+            reappeared = present and self._device_missing
+            self._device_missing = not present
+            if not present:
+                return False  # Nothing to reopen yet
+        if not reappeared and self.breaker.probe_in() > 0:
+            return False
+        if self.port_lost:
+            timeout = self.ser.timeout
+            try:
+                ser = self.reopen()
+            except Exception as e:
+                log.info("Reopen failed: %s", e)
+                self.breaker.begin_probe(reset=reappeared)
+                self.breaker.record_failure()
+                return False
+            ser.timeout = timeout
+            self.ser = ser
+            self.port_lost = False
+            self.metrics.count("reconnects")
+            log.info("Port reopened")
+        self.breaker.begin_probe(reset=reappeared)
+        return True
+
+    def _admit(self, command):
+        # False, after failing the command, if the circuit is open
+        if not self.breaker.is_open:
+            return True
+        if command[0] == "DISPLAY":
+            self.metrics.count("skipped")
+        else:
+            log.warning("Link down, dropping key %s", command[1])
+            self._resolve_key(command[1], command[3], KEY_ERROR, None, time.monotonic() - command[4])
+        return False
+
+    def abandon_keys(self):
+        # On the way out: presses still queued or on the wire will never
+        # complete, so settle their futures rather than leave callers waiting
+        commands = [entry.command for entry in self.in_flight.clear()] + self.scheduler.drain()
+        for command in commands:
+            if command[0] == "KEY":
+                self._resolve_key(command[1], command[3], KEY_ERROR, None, 0.0)
+
+    def _run_pipelined(self):
+        while not self.scheduler.stopped:
+            try:
+                self.check_link()
+                # Only block for work when nothing is on the wire
+                self.fill_pipeline(block=True)
+                if not self.port_lost:
+                    self.handle_input(self.ser.read(self.ser.in_waiting or 1))
+            except OSError as e:
+                self.port_failed(e)
+            except Exception as e:
+                self.fail_in_flight(e)
+
+    # The pipelined engine is split into these non-blocking steps so an
+    # outside event loop (see uart_multi) can drive several links at once.
+
+    def fill_pipeline(self, block=False):
+        # Send queued commands until the pipeline is full
+        while len(self.in_flight) < self.pipeline_depth:
+            if block and not self.in_flight:
+                command = self.wait_idle()
+            else:
+                command = self.scheduler.get(block=False)
+            if command is None:
+                break
+            if self._admit(command):
+                self._send_pipelined(command)
+
+    def handle_input(self, data):
+        # Match freshly read bytes to in-flight commands and expire the rest
+        now = time.monotonic()
+        # A pushed frame could pass for the reply to a poll queued behind
+        # a key press, so when pushes are possible only the oldest command
+        # may take a DISPLAY frame
+        in_order = self.display_mode != DISPLAY_POLL
+        for frame in self._feed(data):
+            entry, lost = self.in_flight.match(frame, in_order and frame.kind == FRAME_DISPLAY)
+            for stale in lost:
+                self._complete(stale, None, now)
+            if entry is None:
+                self._handle_stray(frame)
+            else:
+                self._complete(entry, frame, now)
+        for entry in self.in_flight.expire(now):
+            self._complete(entry, None, now)
+
+    def fail_in_flight(self, error):
+        log.warning("Communication error: %s", error)
+        for entry in self.in_flight.clear():
+            self._complete(entry, None, time.monotonic())
+        self._count_error("Error", "Check Connection")
+        self.breaker.record_failure()
+
+    def _send_pipelined(self, command):
+        if command[0] == "DISPLAY":
+            wire = f"DISPLAY {command[1]}\r"
+        else:
+            wire = f"KEY {command[1]} {command[2]}\r"
+        log.debug("Sending command: %r (%d in flight)", wire, len(self.in_flight))
+        # Replies queue up behind the ones already owed, so allow for them
+        timeout = self.response_timeout + len(self.in_flight) * frame_time(self.ser.baudrate)
+        self.in_flight.add(command, time.monotonic(), timeout)
+        self._write(wire, command[0])
+
+    def _complete(self, entry, frame, now):
+        command = entry.command
+        latency = None
+        if frame is not None:
+            latency = now - entry.sent_at
+            self._report_latency(command[0], latency)
+        if command[0] == "DISPLAY":
+            self._display_result(command[1], frame)
+        else:
+            self._key_result(command[1], frame, latency, command[3], entry.sent_at - command[4])
+
+    def _write(self, command, name):
+        data = command.encode()
+        self.ser.write(data)
+        self.metrics.on_write(len(data))
+        self.metrics.count("polls_sent" if name == "DISPLAY" else "keys_sent")
+
+    def _feed(self, data):
+        # Decode freshly read bytes, keeping the link counters up to date
+        if not data:
+            return ()
+        self.metrics.on_read(len(data))
+        frames = self.decoder.feed(data)
+        for frame in frames:
+            self.metrics.count("resyncs" if frame.kind == FRAME_JUNK else "frames_decoded")
+        return frames
+
+    def _report_latency(self, name, latency):
+        self.metrics.observe_rtt(name, latency)
+        log.debug("%s round trip: %.1f ms", name, latency * 1000)
+        if self.on_latency:
+            self.on_latency(name, latency)
+
+    def _next_frame(self, kinds, preemptible=False):
+        # Wait for the next frame of one of `kinds`. Frames of other kinds
+        # that turn up meanwhile (e.g. the late reply to a preempted poll)
+        # are handled as they come instead of being flushed away.
+        deadline = time.monotonic() + self.response_timeout
+        while True:
+            while self._frames:
+                frame = self._frames.popleft()
+                if frame.kind in kinds:
+                    return frame
+                self._handle_stray(frame)
+            if time.monotonic() >= deadline:
+                return None
+            if preemptible and self.scheduler.key_pending():
+                return PREEMPTED
+            self._frames.extend(self._feed(self.ser.read(self.ser.in_waiting or 1)))
+
+    def _handle_stray(self, frame):
+        if frame.kind == FRAME_DISPLAY:
+            self._on_push()
+            self._update_display(frame)
+        elif frame.kind == FRAME_JUNK:
+            log.debug("Resyncing, skipped %d bytes: %r", len(frame.data), frame.data)
+        else:
+            log.debug("Late %s with no command waiting", frame.kind)
+
+    def _show_status(self, upper_line, lower_line):
+        callback = self.on_status or self.on_display
+        if callback:
+            callback(upper_line, lower_line)
+
+    def _update_display(self, frame):
+        log.debug("Display updated: %r", frame.data)
+        self._last_lines = frame.lines
+        if self.on_display:
+            self.on_display(*frame.lines)
+
+    # Push detection
+
+    def _set_push(self, active):
+        self.push_active = active
+        self.metrics.push_active = active
+
+    def _expect_late(self):
+        # A poll was given up on; its reply may still arrive
+        self._late_until.append(time.monotonic() + LATE_REPLY_FACTOR * self.response_timeout)
+
+    def _on_push(self):
+        # A DISPLAY frame turned up with no poll waiting for it
+        if self.display_mode == DISPLAY_POLL:
+            return
+        now = time.monotonic()
+        while self._late_until and self._late_until[0] <= now:
+            self._late_until.popleft()
+        if self._late_until:
+            self._late_until.popleft()  # Most likely that poll's reply
+            return
+        self.metrics.count("pushes")
+        self._pushes += 1
+        self._misses = 0
+        if not self.push_active and self._pushes >= PUSH_CONFIRM:
+            log.info("VMC pushes display updates, polling slowed to a keepalive")
+            self._set_push(True)
+
+    def _check_push(self, frame):
+        # A poll reply while listening: if it shows something never pushed,
+        # the VMC may have stopped pushing
+        if not self.push_active or self._last_lines is None or frame.lines == self._last_lines:
+            self._misses = 0
+            return
+        self.metrics.count("push_misses")
+        self._misses += 1
+        log.debug("Poll found a display change that was not pushed")
+        if self.display_mode == DISPLAY_AUTO and self._misses >= PUSH_MISSES:
+            log.warning("VMC stopped pushing display updates, back to polling")
+            self._pushes = 0
+            self._misses = 0
+            self._set_push(False)
+
+    def _count_error(self, upper_line, lower_line):
+        self.error_counter += 1
+        log.warning("Consecutive errors: %d/%d", self.error_counter, MAX_ERRORS)
+        if self.error_counter >= MAX_ERRORS:
+            self._show_status(upper_line, lower_line)
+            self.error_counter = MAX_ERRORS
+            log.error("Max consecutive errors reached")
+
+    def _display_result(self, n, frame):
+        if frame is None:
+            self.metrics.count("timeouts")
+            log.warning("No response from VMC to DISPLAY %s", n)
+            self._count_error("Timeout Error", "No VMC Response")
+            self.breaker.record_failure()
+            self._expect_late()
+            return
+
+        self.error_counter = 0  # Success - reset error counter
+        self.breaker.record_success()
+
+        if frame.kind == FRAME_NACK:
+            self.metrics.count("nacks")
+            log.warning("Received NACK. Invalid DISPLAY command parameter: %s", n)
+            return
+
+        self._check_push(frame)
+        self._update_display(frame)
+
+    def _resolve_key(self, key_number, future, status, latency, waited):
+        # Every press ends here, answered or not: settle its future and
+        # report the outcome
+        if future is not None:
+            if future.done():
+                return
+            with self._key_lock:
+                pending = self._key_futures.get(key_number, [])
+                if future in pending:
+                    pending.remove(future)
+            future.set_result(KeyResult(key_number, status, latency, waited))
+        if self.on_key_response:
+            self.on_key_response(key_number, status)
+
+    def _key_result(self, key_number, frame, latency=None, future=None, waited=0.0):
+        if frame is None:
+            self.metrics.count("timeouts")
+            self.breaker.record_failure()
+            status = KEY_TIMEOUT
+        elif frame.kind == FRAME_NACK:
+            self.metrics.count("nacks")
+            self.breaker.record_success()  # A NACK still means the VMC is there
+            status = KEY_NACK
+        else:
+            self.breaker.record_success()
+            status = KEY_ACK
+        response = frame.text if frame else ""
+        if response:
+            log.info("Key %s response: %s", key_number, response)
+        else:
+            log.warning("No response received from hardware.")
+
+        self.last_key_press_time = time.monotonic()
+        self._resolve_key(key_number, future, status, latency, waited)
+
+    def send_display_command(self, n):
+        command = f"DISPLAY {n}\r"
+        log.debug("Sending command: %r", command)
+
+        try:
+            sent_at = time.monotonic()
+            self._write(command, "DISPLAY")
+            frame = self._next_frame(EXPECTED_REPLIES["DISPLAY"], preemptible=True)
+            if frame is PREEMPTED:
+                # The reply is still decoded when it arrives
+                log.debug("DISPLAY poll preempted by key press")
+                self._expect_late()
+                return
+            if frame is not None:
+                self._report_latency("DISPLAY", time.monotonic() - sent_at)
+            self._display_result(n, frame)
+
+        except OSError as e:
+            self._count_error("Error", "Check Connection")
+            self.port_failed(e)
+        except Exception as e:
+            log.warning("Communication error: %s", e)
+            self._count_error("Error", "Check Connection")
+            self.breaker.record_failure()
+
+    def send_key_command(self, key_number, duration=KEY_PRESS_DURATION, future=None, queued_at=None):
+        command = f"KEY {key_number} {duration}\r"
+        log.debug("Sending command: %r", command)
+
+        sent_at = time.monotonic()
+        waited = sent_at - queued_at if queued_at is not None else 0.0
+        try:
+            self._write(command, "KEY")
+            frame = self._next_frame(EXPECTED_REPLIES["KEY"])
+            latency = None
+            if frame is not None:
+                latency = time.monotonic() - sent_at
+                self._report_latency("KEY", latency)
+            self._key_result(key_number, frame, latency, future, waited)
+
+        except Exception as e:
+            log.error("Failed to send command: %s", e)
+            self._resolve_key(key_number, future, KEY_ERROR, None, waited)
+            if isinstance(e, OSError):
+                self.port_failed(e)
+            else:
+                self.breaker.record_failure()
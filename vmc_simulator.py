@@ -0,0 +1,197 @@
+import argparse
+import os
+import random
+import threading
+import time
+import tty
+
+from uart_protocol import LINE_WIDTH
+from uart_transport import FdTransport, TransportError
+
+KEY_COUNT = 8
+PAGE_COUNT = 4
+
+
+class VMCSimulator(threading.Thread):
+    # Stand-in for a VMC on the far end of any transport. Speaks both
+    # dialects the frontends use:
+    #   DISPLAY n\r  -> 40 display chars + \r   (Python frontends)
+    #   DISP n\r     -> upper\nlower\n          (C frontend)
+    #   KEY n ms\r   -> ACK\r or NACK\r
+    #   BAUD n\r     -> ACK\r if baud switching is enabled, else NACK\r
+    # Reply latency, jitter, byte loss/corruption and how often the
+    # display content changes are all configurable. With wire_baud set,
+    # replies are also paced at that line rate, for links (PTY, loopback)
+    # that would otherwise deliver them instantly. Setting `silent` makes
+    # it swallow commands, like an unplugged VMC. With `push` set it also
+    # sends page 0 unsolicited whenever its content changes, like firmware
+    # that pushes display updates.
+    def __init__(self, transport, latency=0.005, jitter=0.0, drop_rate=0.0,
+                 garble_rate=0.0, change_interval=1.0, allow_baud=False, seed=None,
+                 wire_baud=None, push=False):
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.garble_rate = garble_rate
+        self.change_interval = change_interval
+        self.allow_baud = allow_baud
+        self.wire_baud = wire_baud
+        self.push = push
+        self.silent = False
+        self.random = random.Random(seed)
+        self.started_at = time.monotonic()
+        self.last_key = None
+        self.commands_handled = 0
+        self._running = True
+
+    def stop(self):
+        self._running = False
+        self.transport.close()
+
+    def frame(self, page):
+        # Content ticks over every change_interval seconds
+        if self.change_interval > 0:
+            tick = int((time.monotonic() - self.started_at) / self.change_interval)
+        else:
+            tick = 0
+        upper = f"SIM PAGE {page} #{tick}"
+        lower = f"LAST KEY {self.last_key}" if self.last_key is not None else "READY"
+        return upper.ljust(LINE_WIDTH)[:LINE_WIDTH] + lower.ljust(LINE_WIDTH)[:LINE_WIDTH]
+
+    def respond(self, line):
+        # Returns the reply bytes for one command line
+        parts = line.decode(errors="replace").split()
+        name, args = (parts[0].upper(), parts[1:]) if parts else ("", [])
+        try:
+            if name in ("DISPLAY", "DISP") and len(args) == 1:
+                page = int(args[0])
+                if not 0 <= page < PAGE_COUNT:
+                    return b"NACK\r"
+                text = self.frame(page)
+                if name == "DISP":
+                    return f"{text[:LINE_WIDTH]}\n{text[LINE_WIDTH:]}\n".encode()
+                return text.encode() + b"\r"
+            if name == "KEY" and len(args) == 2:
+                key, duration = int(args[0]), int(args[1])
+                if not 0 <= key < KEY_COUNT or duration <= 0:
+                    return b"NACK\r"
+                self.last_key = key
+                return b"ACK\r"
+            if name == "BAUD" and len(args) == 1:
+                if not self.allow_baud:
+                    return b"NACK\r"
+                self.transport.baudrate = int(args[0])
+                if self.wire_baud:
+                    self.wire_baud = self.transport.baudrate
+                return b"ACK\r"
+        except ValueError:
+            pass
+        return b"NACK\r"
+
+    def _impair(self, data):
+        if not (self.drop_rate or self.garble_rate):
+            return data
+        out = bytearray()
+        for byte in data:
+            roll = self.random.random()
+            if roll < self.drop_rate:
+                continue
+            if roll < self.drop_rate + self.garble_rate:
+                byte = self.random.randrange(256)
+            out.append(byte)
+        return bytes(out)
+
+    def _delay(self, reply):
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if self.wire_baud:
+            delay += len(reply) * 10.0 / self.wire_baud
+        if delay > 0:
+            time.sleep(delay)
+
+    def _push_frame(self):
+        # Sends page 0 if it changed since the last push
+        text = self.frame(0)
+        if text == self._pushed or self.silent:
+            return
+        self._pushed = text
+        reply = text.encode() + b"\r"
+        self._delay(reply)
+        self.transport.write(self._impair(reply))
+
+    def run(self):
+        pending = bytearray()
+        self.transport.timeout = 0.1
+        self._pushed = None
+        while self._running:
+            try:
+                data = self.transport.read(max(1, self.transport.in_waiting))
+                if self.push:
+                    self._push_frame()
+            except (OSError, TransportError):
+                break
+            if not data:
+                continue
+            pending += data
+            while True:
+                end = pending.find(b'\r')
+                if end < 0:
+                    break
+                line = bytes(pending[:end])
+                del pending[:end + 1]
+                if self.silent:
+                    continue
+                reply = self.respond(line)
+                self._delay(reply)
+                self.commands_handled += 1
+                try:
+                    self.transport.write(self._impair(reply))
+                    if self.push:
+                        self._push_frame()  # A key press changes the display
+                except (OSError, TransportError):
+                    return
+
+
+def open_pty(**kwargs):
+    # Start a simulator on a new pseudo-terminal; returns (simulator, path)
+    # where path is the device the frontend should open
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    simulator = VMCSimulator(FdTransport(master), **kwargs)
+    # Hold the slave open so the master doesn't see EIO between clients
+    simulator.slave_fd = slave
+    simulator.start()
+    return simulator, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated VMC on a pseudo-terminal")
+    parser.add_argument("--latency", type=float, default=0.005, help="Reply delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random delay, seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="Per-byte drop probability")
+    parser.add_argument("--garble", type=float, default=0.0, help="Per-byte corruption probability")
+    parser.add_argument("--change-interval", type=float, default=1.0,
+                        help="Seconds between display changes, 0 for static")
+    parser.add_argument("--allow-baud", action="store_true", help="Accept BAUD n requests")
+    parser.add_argument("--wire-baud", type=int, help="Pace replies at this line rate")
+    parser.add_argument("--push", action="store_true", help="Send display changes unsolicited")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    simulator, path = open_pty(
+        latency=args.latency, jitter=args.jitter, drop_rate=args.drop,
+        garble_rate=args.garble, change_interval=args.change_interval,
+        allow_baud=args.allow_baud, seed=args.seed, wire_baud=args.wire_baud, push=args.push
+    )
+    print(f"[LOG] Simulated VMC on {path} (run the frontend with --port pty://{path})")
+    try:
+        while simulator.is_alive():
+            simulator.join(1.0)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()